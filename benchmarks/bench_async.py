@@ -0,0 +1,90 @@
+"""Benchmark the asyncio api against calling the synchronous models from a coroutine.
+
+Runs many coroutines that each clock in and out of a scratch database while a ticker
+coroutine measures how late the event loop wakes it up. The synchronous models block
+the loop for every query, the async api only waits on its background thread.
+
+    python -m benchmarks.bench_async --coroutines 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TICK = 0.001
+
+
+async def ticker(lags: list, done: asyncio.Event):
+    while not done.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - t - TICK)
+
+
+async def measure(workers) -> tuple:
+    lags, done = [], asyncio.Event()
+    tick = asyncio.ensure_future(ticker(lags, done))
+    await asyncio.sleep(0)
+    t = time.perf_counter()
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - t
+    done.set()
+    await tick
+    return elapsed, lags
+
+
+def report(name: str, count: int, elapsed: float, lags: list):
+    lags = [lag * 1000 for lag in lags] or [0.0]
+    print(
+        f"{name:<8} {count / elapsed:10.0f} cloks/s  loop lag median "
+        f"{statistics.median(lags):7.2f} ms  max {max(lags):7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--coroutines", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+        from core import aio
+        from core.defines import SQLITE_PRAGMAS
+        from core.models import Clok
+
+        clok.init(testing=True)
+        adb = aio.AsyncConnGenerator(
+            sqlite_db=DB.sqlite_db, sqlite_pragmas=SQLITE_PRAGMAS
+        )
+        start = datetime(2020, 1, 1)
+
+        async def sync_worker(n):
+            when = start + timedelta(minutes=n)
+            c = Clok.clock_in_when(when)
+            Clok.clok_out_by_id(c.id, when + timedelta(seconds=30))
+            await asyncio.sleep(0)
+
+        async def async_worker(n):
+            when = start + timedelta(days=1, minutes=n)
+            clok_id = await aio.clock_in_when(when, db=adb)
+            await aio.clock_out_when(
+                when + timedelta(seconds=30), clok_id=clok_id, db=adb
+            )
+
+        async def run():
+            n = args.coroutines
+            report("sync", n, *await measure(sync_worker(i) for i in range(n)))
+            report("async", n, *await measure(async_worker(i) for i in range(n)))
+            await adb.close()
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark clok backup against clok dump.
+
+Seeds a scratch database with ``--cloks`` records and times a plain and a compressed
+backup and a json dump of it. The plain backup runs while another connection clocks in
+every ``--write-interval`` seconds, as a second clok process would, and reports how many
+of those writes went through and the slowest of them.
+
+    python -m benchmarks.bench_backup --cloks 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_import import write_dump
+
+
+def _writer(path: str, interval: float, stop: threading.Event, latencies: list):
+    connection = sqlite3.connect(path, timeout=5)
+    while not stop.is_set():
+        t = time.perf_counter()
+        connection.execute(
+            "INSERT INTO time_clok (job_id, user_id, time_in) VALUES (1, 1, ?)",
+            (f"2100-01-01 00:00:{len(latencies) % 60:02}.{len(latencies):06}",),
+        )
+        connection.commit()
+        latencies.append(time.perf_counter() - t)
+        stop.wait(interval)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cloks", type=int, default=200000)
+    parser.add_argument("--write-interval", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        path = os.path.join(tmp, "bench.db")
+        DB.sqlite_db = path
+        import clok
+        from core.backup import backup
+        from core.transfer import dump_file, import_file
+
+        clok.init(testing=True)
+        seed_path = os.path.join(tmp, "seed.json")
+        write_dump(seed_path, args.cloks)
+        import_file(seed_path)
+        os.remove(seed_path)
+        print(f"database: {args.cloks} cloks, {os.path.getsize(path) / 1e6:.1f} MB")
+
+        stop, latencies = threading.Event(), []
+        writer = threading.Thread(
+            target=_writer, args=(path, args.write_interval, stop, latencies)
+        )
+        writer.start()
+        t = time.perf_counter()
+        size = backup(os.path.join(tmp, "backup.db"))
+        elapsed = time.perf_counter() - t
+        stop.set()
+        writer.join()
+        print(
+            f"backup: {elapsed:.2f}s, {size / 1e6:.1f} MB, {len(latencies)} concurrent "
+            f"writes, slowest {max(latencies, default=0) * 1000:.0f} ms"
+        )
+
+        t = time.perf_counter()
+        size = backup(os.path.join(tmp, "backup.db.gz"), compress=True)
+        print(f"compressed: {time.perf_counter() - t:.2f}s, {size / 1e6:.1f} MB")
+
+        t = time.perf_counter()
+        dump_file(os.path.join(tmp, "dump.json"))
+        print(f"dump: {time.perf_counter() - t:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
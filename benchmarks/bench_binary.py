@@ -0,0 +1,76 @@
+"""Compare the binary dump format with the json one.
+
+Seeds a scratch database with ``--cloks`` records and one journal per ten, dumps it in
+both formats, then reports the file sizes, the dump times, the time to only read the
+rows back and the time to import each dump into an empty database.
+
+    python -m benchmarks.bench_binary --cloks 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_import import write_dump
+
+
+def _timed(func, *args, **kwargs):
+    t = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - t, result
+
+
+def _read_json(path):
+    from core.transfer import iter_dump_rows
+
+    with open(path) as f:
+        return sum(1 for _ in iter_dump_rows(f))
+
+
+def _read_binary(path):
+    from core.binary import BinaryDumpReader
+
+    with BinaryDumpReader(path) as reader:
+        return sum(1 for _ in reader.rows())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cloks", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+        from core import binary, transfer
+
+        clok.init(testing=True)
+        seed_path = os.path.join(tmp, "seed.json")
+        write_dump(seed_path, args.cloks)
+        transfer.import_file(seed_path)
+
+        paths = {
+            "json": os.path.join(tmp, "dump.json"),
+            "binary": os.path.join(tmp, "dump.bin"),
+        }
+        dumpers = {"json": transfer.dump_file, "binary": binary.dump_file}
+        readers = {"json": _read_json, "binary": _read_binary}
+        for name, path in paths.items():
+            elapsed, _ = _timed(dumpers[name], path)
+            read, rows = _timed(readers[name], path)
+            print(
+                f"{name}: {os.path.getsize(path) / 1e6:.1f} MB, dump {elapsed:.2f}s, "
+                f"read {rows} rows {read:.2f}s"
+            )
+
+        for name, path in paths.items():
+            DB.sqlite_db = os.path.join(tmp, f"{name}.db")
+            clok.init(testing=True)
+            elapsed, result = _timed(transfer.import_file, path)
+            print(f"{name} import: {elapsed:.2f}s, {result.inserted} rows inserted")
+
+
+if __name__ == "__main__":
+    main()
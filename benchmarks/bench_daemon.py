@@ -0,0 +1,65 @@
+"""Benchmark the resident daemon against in process execution.
+
+Runs each command through the clok.sh entry point (python -m core.fastpath) in a fresh
+interpreter, first with no daemon running and then with ``clok daemon`` serving a
+scratch home directory, and reports the median wall time of both.
+
+    python -m benchmarks.bench_daemon --repeat 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_startup import ROOT, wall_time
+
+COMMANDS = (
+    ("status", ["status"]),
+    ("in", ["in", "--m", "bench"]),
+    ("out", ["out"]),
+    ("show week", ["show", "week"]),
+    ("journal", ["journal"]),
+    ("summary", ["summary", "month"]),
+)
+
+
+def run_all(env, repeat: int) -> dict:
+    entry = [sys.executable, "-m", "core.fastpath"]
+    return {name: wall_time(entry + args, env, repeat) for name, args in COMMANDS}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, PYTHONPATH=ROOT)
+        in_process = run_all(env, args.repeat)
+
+        daemon = subprocess.Popen(
+            [sys.executable, "clok.py", "daemon"],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        )
+        socket_file = os.path.join(home, ".timeclok", "clok.sock")
+        while not os.path.exists(socket_file):
+            time.sleep(0.05)
+        try:
+            with_daemon = run_all(env, args.repeat)
+        finally:
+            subprocess.run(
+                [sys.executable, "clok.py", "daemon", "--stop"], cwd=ROOT, env=env
+            )
+            daemon.wait()
+
+    print(f"{'command':<12} {'in process':>12} {'daemon':>12}")
+    for name, _ in COMMANDS:
+        print(f"{name:<12} {in_process[name]:9.1f} ms {with_daemon[name]:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
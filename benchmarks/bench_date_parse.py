@@ -0,0 +1,65 @@
+"""Benchmark the date and time parser against the strptime loop it replaced.
+
+Parses the command line forms of tests/test_in.py and the strings of an imported dump,
+``--repeat`` times each. The cold numbers clear the parser's cache before every pass,
+the warm ones show repeated inputs, as in an import of many records per day.
+
+    python -m benchmarks.bench_date_parse --repeat 2000
+"""
+import argparse
+import time
+from datetime import datetime
+
+from core.defines import DATE_TIME_FORMATS
+
+INPUTS = (
+    "2020-09-01 01:00:00",
+    "2020-09-01 1:00:00",
+    "2020-09-01 01:00",
+    "2020-09-01 1:00",
+    "2020-09-01 01:00:00AM",
+    "2020-09-01 1:00:00AM",
+    "2020-09-01 01:00AM",
+    "2020-09-01 1:00PM",
+)
+
+
+def strptime_loop(text: str) -> datetime:
+    """The parser before the regex one, tries every format in turn."""
+    for fmt in DATE_TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Could not parse time string {text}")
+
+
+def timed(parse, repeat: int, clear=None) -> float:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        if clear is not None:
+            clear()
+        for text in INPUTS:
+            parse(text)
+    return (time.perf_counter() - t) / (repeat * len(INPUTS)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    from core.date_utils import parse_datetime
+
+    for text in INPUTS:
+        assert parse_datetime(text) == strptime_loop(text), text
+    baseline = timed(strptime_loop, args.repeat)
+    cold = timed(parse_datetime, args.repeat, parse_datetime.cache_clear)
+    warm = timed(parse_datetime, args.repeat)
+    print(f"strptime loop  {baseline:8.2f} us per parse")
+    print(f"regex, cold    {cold:8.2f} us per parse  {baseline / cold:6.1f}x")
+    print(f"regex, cached  {warm:8.2f} us per parse  {baseline / warm:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Benchmark the streaming exporter.
+
+Seeds a scratch database with each of the ``--sizes`` clok counts and dumps it,
+reporting wall time and the peak Python heap allocated during the dump. The peak should
+stay flat as the database grows.
+
+    python -m benchmarks.bench_dump --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_import import write_dump
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+        from core.transfer import dump_file, import_file
+
+        clok.init(testing=True)
+        seeded = 0
+        for size in sorted(args.sizes):
+            # grow the database to the next size by importing only the new rows
+            seed_path = os.path.join(tmp, "seed.json")
+            write_dump(seed_path, size)
+            import_file(seed_path)
+            seeded = size
+
+            dump_path = os.path.join(tmp, "dump.json")
+            tracemalloc.start()
+            t = time.perf_counter()
+            counts = dump_file(dump_path)
+            elapsed = time.perf_counter() - t
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{seeded} cloks: {elapsed:.2f}s, peak heap {peak / 1e6:.2f} MB, "
+                f"{os.path.getsize(dump_path) / 1e6:.1f} MB written, {counts}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark the streaming import engine.
+
+Writes a synthetic dump with ``--cloks`` time_clok rows (and one journal per ten cloks)
+and imports it twice into a scratch database, the second pass only hitting duplicates.
+
+    python -m benchmarks.bench_import --cloks 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from core.users import current_user
+
+
+WORDS = (
+    "review deploy meeting standup fix bug release build test refactor design docs "
+    "support customer invoice planning sprint retro migration database api cache"
+).split()
+
+
+def write_dump(
+    path: str, cloks: int, jobs: int = 1, users: int = 1, journal_every: int = 10
+):
+    """Write a dump of ``cloks`` three hour records, four hours apart, spread round
+    robin over ``users`` users with ``jobs`` jobs each, and a journal entry of a few
+    WORDS for every ``journal_every`` records. User 1 is the importing user, whose
+    default job has id 1."""
+    start = datetime(2000, 1, 1, 8)
+    with open(path, "w") as f:
+        user_rows = [{"id": 1, "name": current_user()}]
+        user_rows += [{"id": u, "name": f"user-{u}"} for u in range(2, users + 1)]
+        job_rows = [
+            {
+                "id": (u - 1) * jobs + j,
+                "name": "default" if j == 1 else f"job-{j}",
+                "user_id": u,
+            }
+            for u in range(1, users + 1)
+            for j in range(1, jobs + 1)
+        ]
+        f.write(f'{{"time_clok_users": {json.dumps(user_rows)}, ')
+        f.write(f'"time_clok_jobs": {json.dumps(job_rows)}, ')
+        f.write('"time_clok_state": [], "time_clok": [')
+        for i in range(cloks):
+            time_in = start + timedelta(hours=4 * (i // users))
+            user = i % users
+            row = {
+                "id": i + 1,
+                "job_id": user * jobs + (i // users) % jobs + 1,
+                "user_id": user + 1,
+                "time_in": time_in.timestamp(),
+                "time_out": (time_in + timedelta(hours=3)).timestamp(),
+            }
+            f.write(("" if i == 0 else ", ") + json.dumps(row))
+        f.write('], "time_clok_journal": [')
+        for n, i in enumerate(range(0, cloks, journal_every)):
+            words = [WORDS[(i * k) % len(WORDS)] for k in (3, 5, 7, 13)]
+            row = {
+                "id": n + 1,
+                "clok_id": i + 1,
+                "user_id": i % users + 1,
+                "time": start.timestamp(),
+                "entry": f"entry {i} ticket{i % 10000} " + " ".join(words),
+            }
+            f.write(("" if n == 0 else ", ") + json.dumps(row))
+        f.write("]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cloks", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+        from core.transfer import import_file
+
+        clok.init(testing=True)
+        dump_path = os.path.join(tmp, "dump.json")
+        write_dump(dump_path, args.cloks)
+        size = os.path.getsize(dump_path) / 1e6
+        print(f"dump: {args.cloks} cloks, {size:.1f} MB")
+
+        for label in ("fresh", "duplicates"):
+            t = time.perf_counter()
+            result = import_file(dump_path)
+            elapsed = time.perf_counter() - t
+            print(f"{label}: {elapsed:.2f}s " f"({args.cloks / elapsed:,.0f} cloks/s)")
+            print(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark the time_clok indexes added by the first schema migration.
+
+Seeds a scratch database, drops the indexes and resets its version to look like a file
+created before the migration existed, then prints query plans and timings of the period
+queries before and after ``migrate`` upgrades it.
+
+    python -m benchmarks.bench_indexes --cloks 200000 --jobs 5 --users 100
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_import import write_dump
+
+SCOPE = "user_id = 1 AND job_id = 1"
+QUERIES = {
+    "date_key": f"SELECT * FROM time_clok WHERE date_key = 20050607 AND {SCOPE}",
+    "week_key": "SELECT sum(time_span) FROM time_clok WHERE week_key = 200523 "
+    f"AND {SCOPE}",
+    "month_key": "SELECT sum(time_span) FROM time_clok WHERE month_key = 200506 "
+    f"AND {SCOPE}",
+    "last_record": f"SELECT * FROM time_clok WHERE {SCOPE} "
+    "ORDER BY time_in DESC LIMIT 1",
+    "all_jobs": "SELECT sum(time_span) FROM time_clok WHERE date_key = 20050607 "
+    "AND user_id = 1",
+}
+
+
+def run_queries(engine, repeat: int):
+    for name, sql in QUERIES.items():
+        plan = " / ".join(
+            row[-1] for row in engine.execute(f"EXPLAIN QUERY PLAN {sql}")
+        )
+        t = time.perf_counter()
+        for _ in range(repeat):
+            engine.execute(sql).fetchall()
+        elapsed = (time.perf_counter() - t) / repeat * 1000
+        print(f"  {name:<12} {elapsed:8.3f} ms  {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cloks", type=int, default=200000)
+    parser.add_argument("--jobs", type=int, default=5)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+        from core.migrations import migrate
+        from core.transfer import import_file
+
+        clok.init(testing=True)
+        dump_path = os.path.join(tmp, "dump.json")
+        write_dump(dump_path, args.cloks, args.jobs, args.users)
+        import_file(dump_path)
+
+        engine = DB.engine
+        indexes = engine.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'"
+        ).fetchall()
+        for (name,) in indexes:
+            engine.execute(f"DROP INDEX {name}")
+        engine.execute("PRAGMA user_version = 0")
+
+        print(
+            f"{args.cloks} cloks over {args.users} users with {args.jobs} jobs each, "
+            "before migrating:"
+        )
+        run_queries(engine, args.repeat)
+        t = time.perf_counter()
+        migrate(engine)
+        print(f"migrated in {time.perf_counter() - t:.2f}s, after migrating:")
+        run_queries(engine, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark journal search.
+
+Seeds a scratch database with ``--entries`` journal entries, one per record, and times
+Journal.search for a few queries next to the LIKE scan it replaces, which reads every
+entry of the user. Ranking scores every match, so queries matching a large part of
+the entries take longest.
+
+    python -m benchmarks.bench_journal_search --entries 300000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_import import write_dump
+
+# a rare term, a term in a fifth of the entries, a prefix and a boolean query
+QUERIES = ("ticket1234", "deploy", "retro*", "bug NOT fix")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=300000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+        from core.models import Journal
+        from core.transfer import import_file
+
+        clok.init(testing=True)
+        dump_path = os.path.join(tmp, "seed.json")
+        write_dump(dump_path, args.entries, journal_every=1)
+        t = time.perf_counter()
+        import_file(dump_path)
+        print(f"imported {args.entries} entries in {time.perf_counter() - t:.1f}s")
+
+        for query in QUERIES:
+            t = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = Journal.search(query, all_jobs=True)
+            elapsed = (time.perf_counter() - t) / args.repeat * 1000
+            print(f"  search {query!r:<22} {elapsed:8.2f} ms, {len(rows)} results")
+
+        word = QUERIES[1]
+        t = time.perf_counter()
+        rows = Journal.owned().filter(Journal.entry.like(f"%{word}%")).all()
+        elapsed = (time.perf_counter() - t) * 1000
+        print(f"  like   {word!r:<22} {elapsed:8.2f} ms, {len(rows)} rows")
+
+
+if __name__ == "__main__":
+    main()
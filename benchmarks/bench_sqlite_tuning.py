@@ -0,0 +1,121 @@
+"""Benchmark SQLite connection tuning under concurrent readers and writers.
+
+For each pragma configuration a scratch database is seeded and then hammered for
+``--seconds`` by ``--writers`` processes inserting and committing single clok rows and
+``--readers`` processes running period totals. Reports operations per second and the
+number of "database is locked" errors.
+
+    python -m benchmarks.bench_sqlite_tuning --writers 4 --readers 4 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from core.defines import SQLITE_PRAGMA_DEFAULTS
+
+CONFIGURATIONS = {
+    "sqlite defaults (delete, full)": {name: "" for name in SQLITE_PRAGMA_DEFAULTS},
+    "wal, synchronous full": dict(SQLITE_PRAGMA_DEFAULTS, synchronous="full"),
+    "clok defaults (wal, normal)": dict(SQLITE_PRAGMA_DEFAULTS),
+}
+
+
+def _generator(path, pragmas):
+    from core.utils import SqlAlchemyConnGenerator
+
+    return SqlAlchemyConnGenerator(sqlite_db=path, sqlite_pragmas=pragmas)
+
+
+def worker(kind, number, path, pragmas, seconds, results):
+    from sqlalchemy.exc import OperationalError
+
+    from core.date_utils import to_db_datetime
+
+    engine = _generator(path, pragmas).engine
+    ops = errors = 0
+    start = datetime(2030, 1, 1) + timedelta(days=number * 1000)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            if kind == "writer":
+                time_in = start + timedelta(minutes=ops)
+                engine.execute(
+                    "INSERT INTO time_clok (job_id, date_key, week_key, month_key, "
+                    "time_in, time_span) VALUES (1, 20300101, 203000, 203001, ?, 60)",
+                    (to_db_datetime(time_in),),
+                )
+            else:
+                engine.execute(
+                    "SELECT sum(time_span) FROM time_clok "
+                    "WHERE job_id = 1 AND month_key = 200001"
+                ).scalar()
+            ops += 1
+        except OperationalError:
+            errors += 1
+    results.put((kind, ops, errors))
+
+
+def run(path, pragmas, writers, readers, seconds):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker, args=(kind, n, path, pragmas, seconds, results)
+        )
+        for n, kind in enumerate(["writer"] * writers + ["reader"] * readers)
+    ]
+    for p in processes:
+        p.start()
+    totals = {"writer": [0, 0], "reader": [0, 0]}
+    for _ in processes:
+        kind, ops, errors = results.get()
+        totals[kind][0] += ops
+        totals[kind][1] += errors
+    for p in processes:
+        p.join()
+    return totals
+
+
+def seed(path, pragmas, cloks):
+    from core.database import BaseModel
+    from core.date_utils import to_db_datetime
+    import core.models  # noqa: F401, registers the tables on BaseModel
+
+    engine = _generator(path, pragmas).engine
+    BaseModel.metadata.create_all(engine)
+    engine.execute("INSERT INTO time_clok_jobs (id, name) VALUES (1, 'default')")
+    start = datetime(2000, 1, 1, 8)
+    rows = [(to_db_datetime(start + timedelta(hours=4 * i)),) for i in range(cloks)]
+    engine.execute(
+        "INSERT INTO time_clok (job_id, date_key, week_key, month_key, time_in, "
+        "time_span) VALUES (1, 20000101, 200000, 200001, ?, 10800)",
+        rows,
+    )
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--cloks", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, (name, pragmas) in enumerate(CONFIGURATIONS.items()):
+            path = os.path.join(tmp, f"{n}.db")
+            seed(path, pragmas, args.cloks)
+            totals = run(path, pragmas, args.writers, args.readers, args.seconds)
+            (writes, write_errors), (reads, read_errors) = totals.values()
+            print(
+                f"{name:<32} writes {writes / args.seconds:8.0f}/s "
+                f"({write_errors} locked)  reads {reads / args.seconds:8.0f}/s "
+                f"({read_errors} locked)"
+            )
+
+
+if __name__ == "__main__":
+    main()
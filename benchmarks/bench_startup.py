@@ -0,0 +1,69 @@
+"""Benchmark command line startup.
+
+Runs each command in a fresh interpreter against a scratch home directory and reports
+the median wall time, first through the fast path used by clok.sh and then through the
+full typer cli in clok.py. The fast path targets less than 100 ms.
+
+    python -m benchmarks.bench_startup --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_MS = 100
+
+COMMANDS = (
+    ("import core.fastpath", [sys.executable, "-c", "import core.fastpath"]),
+    ("import clok", [sys.executable, "-c", "import clok"]),
+    ("fast status", [sys.executable, "-m", "core.fastpath", "status"]),
+    ("fast in", [sys.executable, "-m", "core.fastpath", "in", "--m", "bench"]),
+    ("fast out", [sys.executable, "-m", "core.fastpath", "out"]),
+    ("full status", [sys.executable, "clok.py", "status"]),
+    ("full in", [sys.executable, "clok.py", "in", "--m", "bench"]),
+    ("full out", [sys.executable, "clok.py", "out"]),
+)
+
+
+def wall_time(command, env, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        subprocess.run(
+            command, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL
+        )
+        times.append(time.perf_counter() - t)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, PYTHONPATH=ROOT)
+        # create the database before timing anything
+        subprocess.run(
+            [sys.executable, "clok.py", "status"],
+            cwd=ROOT,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        baseline = wall_time([sys.executable, "-c", "pass"], env, args.repeat)
+        print(f"{'python -c pass':<22} {baseline:8.1f} ms")
+        for name, command in COMMANDS:
+            elapsed = wall_time(command, env, args.repeat)
+            flag = ""
+            if name.startswith("fast"):
+                flag = "ok" if elapsed < TARGET_MS else f"over {TARGET_MS} ms target"
+            print(f"{name:<22} {elapsed:8.1f} ms  {flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark the columnar analytics behind clok stats.
+
+Seeds a scratch database with ``--cloks`` records and times reading them into numpy
+arrays with Clok.to_arrays and computing every statistic clok stats prints, next to the
+same per job totals and heatmap computed by looping over Clok objects.
+
+    python -m benchmarks.bench_stats --cloks 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.bench_import import write_dump
+
+
+def loop_stats(records) -> tuple:
+    jobs, heatmap = defaultdict(float), defaultdict(float)
+    for c in records:
+        jobs[c.job_id] += c.time_span
+        if c.time_out is not None:
+            heatmap[c.time_in.weekday(), c.time_in.hour] += c.time_span
+    return jobs, heatmap
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cloks", type=int, default=1000000)
+    parser.add_argument("--jobs", type=int, default=5)
+    parser.add_argument("--loop-cloks", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+        from core import stats
+        from core.models import Clok
+        from core.transfer import import_file
+
+        clok.init(testing=True)
+        dump_path = os.path.join(tmp, "seed.json")
+        write_dump(dump_path, args.cloks, args.jobs)
+        import_file(dump_path)
+
+        t = time.perf_counter()
+        arrays = Clok.to_arrays(all_jobs=True)
+        read = time.perf_counter() - t
+        t = time.perf_counter()
+        stats.job_seconds(arrays["job_id"], arrays["time_span"])
+        stats.weekday_hour_heatmap(arrays["time_in"], arrays["time_out"])
+        stats.span_histogram(arrays["time_span"])
+        _, weekly = stats.weekly_seconds(arrays["time_in"], arrays["time_span"])
+        stats.rolling_sum(weekly, 4)
+        stats.overtime(weekly, 40)
+        computed = time.perf_counter() - t
+        print(
+            f"numpy    {args.cloks} cloks: to_arrays {read:.3f}s, "
+            f"statistics {computed:.3f}s"
+        )
+
+        # the objects are far slower, so they are only timed on the first loop_cloks
+        count = min(args.loop_cloks, args.cloks)
+        t = time.perf_counter()
+        records = Clok.query().order_by(Clok.id).limit(count).all()
+        read = time.perf_counter() - t
+        t = time.perf_counter()
+        loop_stats(records)
+        computed = time.perf_counter() - t
+        print(f"objects  {count} cloks: query {read:.3f}s, statistics {computed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Synthetic work histories for the benchmark suite.
+
+``write_history`` writes a json dump, ready for ``clok import``, of a user who spreads
+their working days over many jobs and journals as they go. The history ends today so the
+current day, week and month reports have records to show.
+
+    python -m benchmarks.history history.json --cloks 100000
+"""
+import argparse
+import json
+import math
+from datetime import date, datetime, time, timedelta
+
+from benchmarks.bench_import import WORDS
+from core.users import current_user
+
+WORKDAY_START = time(8)
+WORKDAY_SECONDS = 10 * 60 * 60
+
+
+def workdays(years: int, end: date) -> list:
+    """Return the weekdays of the ``years`` years up to and including ``end``."""
+    start = end.replace(year=end.year - years)
+    days = (start + timedelta(days=n) for n in range(1, (end - start).days + 1))
+    return [day for day in days if day.weekday() < 5 or day == end]
+
+
+def write_history(
+    path: str,
+    cloks: int,
+    jobs: int = 20,
+    years: int = 10,
+    journal_every: int = 3,
+    end: date = None,
+):
+    """Write a dump of ``cloks`` records on the most recent workdays of the ``years``
+    years up to ``end``, today by default, as many a day as it takes to fit them. Every
+    record belongs to the next of ``jobs`` jobs, job 1 being the importing user's
+    default job, and every ``journal_every``-th record has a journal entry."""
+    days = workdays(years, end or date.today())
+    per_day = max(math.ceil(cloks / len(days)), 1)
+    slot = WORKDAY_SECONDS // per_day
+    with open(path, "w") as f:
+        job_rows = [
+            {"id": j, "name": "default" if j == 1 else f"job-{j}", "user_id": 1}
+            for j in range(1, jobs + 1)
+        ]
+        f.write(
+            f'{{"time_clok_users": {json.dumps([{"id": 1, "name": current_user()}])}, '
+        )
+        f.write(f'"time_clok_jobs": {json.dumps(job_rows)}, ')
+        f.write('"time_clok_state": [], "time_clok": [')
+        first_day = len(days) - math.ceil(cloks / per_day)
+        for i in range(cloks):
+            day = days[first_day + i // per_day]
+            time_in = datetime.combine(day, WORKDAY_START)
+            time_in += timedelta(seconds=slot * (i % per_day))
+            row = {
+                "id": i + 1,
+                "job_id": i % jobs + 1,
+                "user_id": 1,
+                "time_in": time_in.timestamp(),
+                "time_out": (time_in + timedelta(seconds=slot * 3 // 4)).timestamp(),
+            }
+            f.write(("" if i == 0 else ", ") + json.dumps(row))
+        f.write('], "time_clok_journal": [')
+        for n, i in enumerate(range(0, cloks, journal_every)):
+            words = [WORDS[(i * k) % len(WORDS)] for k in (3, 5, 7, 13)]
+            time_in = datetime.combine(days[first_day + i // per_day], WORKDAY_START)
+            row = {
+                "id": n + 1,
+                "clok_id": i + 1,
+                "user_id": 1,
+                "time": (time_in + timedelta(seconds=slot * (i % per_day))).timestamp(),
+                "entry": f"entry {i} ticket{i % 10000} " + " ".join(words),
+            }
+            f.write(("" if n == 0 else ", ") + json.dumps(row))
+        f.write("]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--cloks", type=int, default=100000)
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--journal-every", type=int, default=3)
+    args = parser.parse_args()
+    write_history(args.path, args.cloks, args.jobs, args.years, args.journal_every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Benchmark suite for performance regressions.
+
+For each of ``--sizes`` seeds a scratch database with a synthetic history from
+benchmarks.history, importing it, then times a json dump, ``clok show`` and ``clok
+journal --show`` for the day, week and month, the ``get_*_hours`` helpers and ``clok
+in`` followed by ``clok out``. Everything but the import runs once to warm the caches
+and then ``--repeat`` times, and the median and fastest run are kept. The commands run
+in process with their output discarded, so the times leave out interpreter startup, see
+bench_startup for that.
+
+The results are written as json to ``--output``. Given a ``--baseline``, results of an
+earlier run, every benchmark whose fastest run is more than ``--tolerance`` slower than
+the baseline's is reported as a regression, the fastest run being the one least
+disturbed by the rest of the machine, and the suite exits with status 1.
+
+    python -m benchmarks.suite --sizes 10000 100000 --output results.json
+    python -m benchmarks.suite --sizes 10000 100000 --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import sqlalchemy
+
+from benchmarks.history import write_history
+
+SCHEMA_VERSION = 1
+# differences smaller than this are timer noise however large the ratio
+NOISE_FLOOR = 0.001
+
+
+def _time(func, repeat: int, warmup: bool) -> dict:
+    times = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        if warmup:
+            func()
+        for _ in range(repeat):
+            t = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t)
+    return {"median": statistics.median(times), "min": min(times), "runs": repeat}
+
+
+def benchmarks(tmp: str) -> list:
+    """Return the (name, function, repeats) of the benchmarks, the import first."""
+    import clok
+    from core.models import Clok
+    from core.transfer import dump_file, import_file
+
+    history = os.path.join(tmp, "history.json")
+    cases = [
+        ("import", lambda: import_file(history), False),
+        ("dump", lambda: dump_file(os.path.join(tmp, "dump.json")), True),
+    ]
+    for period in ("day", "week", "month"):
+        cases += [
+            (
+                f"show {period}",
+                lambda p=period: clok.show(p, None, False, *[False] * 3),
+                True,
+            ),
+            (
+                f"show {period} --journal",
+                lambda p=period: clok.show(p, None, True, *[False] * 3),
+                True,
+            ),
+            (
+                f"journal --show --period {period}",
+                lambda p=period: clok.journal(
+                    None, None, True, p, None, None, False, False, False, None, None
+                ),
+                True,
+            ),
+        ]
+    for name, helper in (
+        ("get_day_hours", Clok.get_day_hours),
+        ("get_week_hours", Clok.get_week_hours),
+        ("get_month_hours", Clok.get_month_hours),
+    ):
+        cases += [
+            (name, helper, True),
+            (f"{name} --all-jobs", lambda h=helper: h(all_jobs=True), True),
+        ]
+    cases.append(
+        (
+            "in and out",
+            lambda: (clok.in_(None, None, None), clok.out(None, None, None)),
+            True,
+        )
+    )
+    return cases
+
+
+def run_size(size: int, repeat: int, jobs: int, years: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        from core.database import DB
+
+        DB.sqlite_db = os.path.join(tmp, "bench.db")
+        import clok
+
+        clok.init(testing=True)
+        write_history(os.path.join(tmp, "history.json"), size, jobs, years)
+        results = {}
+        for name, func, repeated in benchmarks(tmp):
+            results[name] = _time(func, repeat if repeated else 1, repeated)
+            print(f"  {name:<34} {results[name]['median'] * 1000:10.1f} ms")
+        DB.session.close()
+        return results
+
+
+def environment() -> dict:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "sqlalchemy": sqlalchemy.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return (size, name, baseline time, time) of the benchmarks that are more than
+    ``tolerance``, a fraction, slower than in ``baseline``. Benchmarks missing from
+    either run are ignored."""
+    if baseline.get("version") != SCHEMA_VERSION:
+        raise ValueError(f"unsupported baseline version {baseline.get('version')}")
+    regressions = []
+    for size, timings in results["sizes"].items():
+        for name, timing in timings.items():
+            before = baseline["sizes"].get(size, {}).get(name)
+            if before is None:
+                continue
+            limit = max(before["min"] * (1 + tolerance), before["min"] + NOISE_FLOOR)
+            if timing["min"] > limit:
+                regressions.append((size, name, before["min"], timing["min"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--output", help="Write the results to this json file")
+    parser.add_argument("--baseline", help="Compare with the results in this file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = {"version": SCHEMA_VERSION, "environment": environment(), "sizes": {}}
+    for size in args.sizes:
+        print(f"{size} cloks:")
+        results["sizes"][str(size)] = run_size(size, args.repeat, args.jobs, args.years)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for size, name, before, after in regressions:
+            print(
+                f"regression: {name} at {size} cloks, {before * 1000:.1f} ms -> "
+                f"{after * 1000:.1f} ms ({after / before - 1:+.0%})"
+            )
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,48 @@
-import json
+# imported first, --profile reports the time spent importing the rest
+from core import profiling
+
 import os
+import sys
 from datetime import datetime
-from typing import Union
+from typing import List, Union
 
 import typer
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm.exc import NoResultFound
 from typer import Argument, Option
 
-from core.database import BaseModel, DB, add_items_to_database
-from core.defines import APPLICATION_DIRECTORY, DATABASE_FILE, SECONDS_PER_HOUR
-from core.models import Clok, Job, Journal, State, clock_row_header
+from core.database import BaseModel, DB
+from core.defines import (
+    APPLICATION_DIRECTORY,
+    AUDIT_GAP_MINUTES,
+    AUDIT_OPEN_HOURS,
+    DATABASE_FILE,
+    JOURNAL_SEARCH_LIMIT,
+    PROFILE_ENVIRONMENT_VARIABLE,
+    SECONDS_PER_HOUR,
+)
+from core.fastpath import status_message
+from core.migrations import migrate
+from core.users import set_user
+from core.models import (
+    ChangeSequence,
+    Clok,
+    DailyTotal,
+    Job,
+    Journal,
+    State,
+    clock_row_header,
+    summary_format_row,
+    summary_row_header,
+)
 from core.date_utils import (
-    get_date,
-    get_date_key,
-    get_month,
-    get_week,
     parse_date_and_time,
     parse_date_time_junction,
     format_hours,
 )
-from core.utils import to_json
 
+profiling.imports_done()
 
 app = typer.Typer()
 
@@ -29,7 +50,8 @@ app = typer.Typer()
 KEY = Option(
     None,
     help="Specify a key to display, use period to specify key kind. date_key: "
-    "'20201010', week_key: '1-52', month_key: '1-12'. default is the current "
+    "'20201010', week_key: '202041' or '0-53', month_key: '202010' or '1-12', bare "
+    "week and month numbers are in the current year. default is the current "
     "datekey.",
 )
 WEEK = Option(False, help="Shortcut to set the period to week")
@@ -37,15 +59,51 @@ MONTH = Option(False, help="Shortcut to set the period to month")
 ALL_JOBS = Option(False, help="Display records for all jobs")
 
 
+@app.callback()
+def options(
+    ctx: typer.Context,
+    user: str = Option(
+        None,
+        help="Record time for this user instead of $CLOK_USER or your login name. "
+        "Users are created the first time they are used.",
+    ),
+    profile: bool = Option(
+        False,
+        help="Write a profile of the command, its sql statements and timings to "
+        "~/.timeclok/profiles. $CLOK_PROFILE=1 profiles every command.",
+    ),
+    profile_with: List[str] = Option(
+        [],
+        help="Run cprofile or tracemalloc as well, implies --profile. Can be given "
+        "twice, or listed in $CLOK_PROFILE, e.g. CLOK_PROFILE=cprofile,tracemalloc",
+    ),
+):
+    """TimeClok, a time clock and journal for the command line"""
+    if user is not None:
+        set_user(user)
+    profile_with = [name.lower() for name in profile_with]
+    unknown = sorted(set(profile_with) - set(profiling.PROFILERS))
+    if unknown:
+        raise typer.BadParameter(
+            f"{', '.join(unknown)}, expected one of {', '.join(profiling.PROFILERS)}",
+            param_hint="--profile-with",
+        )
+    profilers = profiling.parse_profilers(os.environ.get(PROFILE_ENVIRONMENT_VARIABLE))
+    if profile or profile_with or profilers is not None:
+        p = profiling.Profile(ctx.invoked_subcommand, (profilers or []) + profile_with)
+        p.start()
+        ctx.call_on_close(lambda: print(profiling.summary(p.stop()), file=sys.stderr))
+
+
 def get_records_for_period(
-    period: str, key: Union[str, int, datetime], all_jobs=False
+    period: str, key: Union[str, int, datetime], all_jobs=False, options=()
 ) -> [Clok]:
     if period.lower() == "day":
-        records = Clok.get_by_date_key(key, all_jobs=all_jobs)
+        records = Clok.get_by_date_key(key, all_jobs=all_jobs, options=options)
     elif period.lower() == "week":
-        records = Clok.get_by_week_key(key, all_jobs=all_jobs)
+        records = Clok.get_by_week_key(key, all_jobs=all_jobs, options=options)
     elif period.lower() == "month":
-        records = Clok.get_by_month_key(key, all_jobs=all_jobs)
+        records = Clok.get_by_month_key(key, all_jobs=all_jobs, options=options)
     else:
         print(f"Error: period must be one of (day, week, month) not {period}")
         raise ValueError()
@@ -57,76 +115,114 @@ def init(testing=False):
     """Initialize the database with the default job"""
     if not os.path.exists(APPLICATION_DIRECTORY):
         os.mkdir(APPLICATION_DIRECTORY)
-    if not os.path.exists(DATABASE_FILE) or testing:
+    fresh = not os.path.exists(DATABASE_FILE) or testing
+    if fresh:
         print(f"Creating TimeClok Database and default job.....")
         DB.create_tables(BaseModel)
-        try:
-            j = Job(name="default")
-            j.save()
-            s = State()
-            s.save()
-            s.set_job(j)
-        except IntegrityError:
-            DB.session.rollback()
+    migrate(DB.engine, verbose=not fresh)
+    if fresh:
+        # registers the current user with a default job
+        State.current()
 
 
 @app.command(name="import")
 def import_(
     file_path: str = Argument(
         None,
-        help="the path of the file to import. Only json files are supported at this "
-        "time.",
+        help="the path of the json or binary dump to import, the format is detected "
+        "from the file",
     )
 ):
-    """Import an exported json file to the database."""
+    """Import an exported json or binary file to the database."""
+    from core.transfer import import_file
+
     if os.path.isfile(file_path):
-        with open(file_path) as f:
-            dump_obj = json.loads(f.read())
-        time_clok_jobs = dump_obj["time_clok_jobs"]
-        time_clok = dump_obj["time_clok"]
-        time_clok_state = dump_obj["time_clok_state"]
-        time_clok_journal = dump_obj["time_clok_journal"]
-
-        jobs = []
-        for job in time_clok_jobs:
-            jobs.append(Job(**job))
-        add_items_to_database(jobs)
-
-        cloks = []
-        for clok in time_clok:
-            cloks.append(Clok(**clok))
-        add_items_to_database(cloks)
-
-        journals = []
-        for journal in time_clok_journal:
-            journals.append(Journal(**journal))
-        add_items_to_database(journals)
-        try:
-            s = State(**time_clok_state[0])
-            s.save()
-        except IntegrityError:
-            pass
+        print(f"Importing {file_path}")
+
+        def progress(table, rows):
+            print(f"{table}: {rows} rows processed", end="\r", flush=True)
 
+        result = import_file(file_path, progress=progress)
+        print(result)
     else:
         raise FileNotFoundError(f"'{file_path}' does not exist.")
 
 
 @app.command()
-def dump(file_path: str = Argument(None)):
-    """Export the database to a json file"""
+def dump(
+    file_path: str = Argument(None),
+    since: int = Option(
+        None,
+        help="Only export the changes made after the marker printed by an earlier "
+        "dump",
+    ),
+    format_: str = Option(
+        "json",
+        "--format",
+        help="json, or binary for a smaller file that is faster to import",
+    ),
+):
+    """Export the database to a json or binary file"""
+    if format_ == "json":
+        from core.transfer import dump_file
+    elif format_ == "binary":
+        from core.binary import dump_file
+    else:
+        raise ValueError(f"'{format_}' is not a dump format, use json or binary")
+
     if file_path is None:
         date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = f"{APPLICATION_DIRECTORY}/time-clock-dump-{date_str}.json"
-    print(f"Dumping the database to > {file_path}")
-    dump_dict = {
-        "time_clok_jobs": Job.dump(),
-        "time_clok_state": State.dump(),
-        "time_clok": Clok.dump(),
-        "time_clok_journal": Journal.dump(),
-    }
-    s = json.dumps(dump_dict, default=to_json)
-    with open(file_path, "w") as f:
-        f.write(s)
+        extension = "json" if format_ == "json" else "bin"
+        file_path = f"{APPLICATION_DIRECTORY}/time-clock-dump-{date_str}.{extension}"
+    # read first, changes made while dumping are exported again by the next dump
+    marker = ChangeSequence.current()
+    if since is None:
+        print(f"Dumping the database to > {file_path}")
+    else:
+        print(f"Dumping the changes since {since} to > {file_path}")
+    for table, count in dump_file(file_path, since=since).items():
+        print(f"{table}: {count} rows")
+    print(f"Marker: {marker}, use --since {marker} to dump the changes from now on")
+
+
+@app.command()
+def backup(
+    file_path: str = Argument(None),
+    compress: bool = Option(False, help="gzip the backup"),
+):
+    """Copy the database to a backup file, safe while clok is in use"""
+    from core.backup import backup as backup_database
+
+    if file_path is None:
+        date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        extension = ".gz" if compress else ""
+        file_path = f"{APPLICATION_DIRECTORY}/time-clok-backup-{date_str}.db{extension}"
+    print(f"Backing up the database to > {file_path}")
+
+    def progress(copied, total):
+        print(f"{copied} of {total} pages copied", end="\r", flush=True)
+
+    size = backup_database(file_path, compress=compress, progress=progress)
+    print(f"\nWrote {size / 1e6:.1f} MB")
+
+
+@app.command()
+def restore(
+    file_path: str = Argument(..., help="A file written by clok backup"),
+    yes: bool = Option(False, "--yes", help="Restore without asking first"),
+):
+    """Replace the database with a backup"""
+    from core.backup import restore as restore_database
+
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"'{file_path}' does not exist.")
+    if not yes:
+        typer.confirm(
+            f"This replaces the database with {file_path}, continue?", abort=True
+        )
+    print(f"Restoring the database from {file_path}")
+    restore_database(file_path)
+    print("Restored")
 
 
 @app.command(name="in")
@@ -146,27 +242,11 @@ def in_(
 
     if when is not None and out is not None:
         print(f"Creating entry for {when:%Y-%m-%d}: {when:%H:%M:%S} to {out:%H:%M:%S}")
-        c = Clok(
-            time_in=when,
-            time_out=out,
-            date_key=get_date_key(when),
-            month_key=get_month(when),
-            week_key=get_week(when),
-        )
-        c.update_span()
-        c.save()
-        if m is not None:
-            c.add_journal(m)
-    elif when is not None and out is None:
-        Clok.clock_in_when(when, verbose=True)
-        if m is not None:
-            Clok.get_last_record().add_journal(m)
-        State.set_clok(Clok.get_last_record())
+        Clok.add_span(when, out, m)
+    elif when is not None:
+        Clok.clock_in_when(when, verbose=True, msg=m)
     else:
-        Clok.clock_in(verbose=True)
-        if m is not None:
-            Clok.get_last_record().add_journal(m)
-        State.set_clok(Clok.get_last_record())
+        Clok.clock_in(verbose=True, msg=m)
 
 
 @app.command()
@@ -180,7 +260,7 @@ def out(
         when = parse_date_and_time(when)
 
     if id is not None and when is not None:
-        clok = Clok.clok_out_by_id(id, when, verbose=True)
+        Clok.clok_out_by_id(id, when, verbose=True, msg=m)
     else:
         clok = Clok.get_last_record()
         if (datetime.now() - clok.time_in).total_seconds() / (60 * 60) > 12:
@@ -190,11 +270,17 @@ def out(
             )
 
         if when is not None:
-            clok = Clok.clock_out_when(when, verbose=True)
+            Clok.clock_out_when(when, verbose=True, msg=m)
         else:
-            clok = Clok.clock_out(verbose=True)
-    if m is not None:
-        clok.add_journal(m)
+            Clok.clock_out(verbose=True, msg=m)
+
+
+@app.command()
+def status():
+    """Show the current job and whether you are clocked in"""
+    c = Clok.get_last_record()
+    job = Job.get_by_id(State.get_job_id())
+    print(status_message(job.name, c and c.time_in, c and c.time_out))
 
 
 @app.command()
@@ -212,8 +298,28 @@ def journal(
     week: bool = WEEK,
     month: bool = MONTH,
     all_jobs: bool = ALL_JOBS,
+    search: str = Option(
+        None,
+        help="Search the journal entries, best matches first. Searches every period "
+        "unless a key, --week or --month is given.",
+    ),
+    limit: int = Option(JOURNAL_SEARCH_LIMIT, help="The number of search results"),
 ):
-    """Show and manage journal entries"""
+    """Show, search and manage journal entries"""
+    if search is not None:
+        if week or month or key is not None:
+            period = "week" if week else "month" if month else period
+        else:
+            period = None
+        try:
+            rows = Journal.search(search, period, key, all_jobs=all_jobs, limit=limit)
+        except OperationalError:
+            print("Error: journal search needs sqlite with fts5")
+            return
+        for journal_id, time, job, snippet in rows:
+            print(f" - JID: {journal_id:<6} {time:%Y-%m-%d %H:%M}  {job:<16} {snippet}")
+        print(f"{len(rows)} matching journal entries")
+        return
     if delete is not None:
         id = delete
     if msg is not None:
@@ -231,7 +337,9 @@ def journal(
         period = "month"
 
     if show:
-        records = get_records_for_period(period, key, all_jobs=all_jobs)
+        records = get_records_for_period(
+            period, key, all_jobs=all_jobs, options=[selectinload(Clok.journal_entries)]
+        )
         print(f"Printing Journal entries for the {key or period.lower()}.")
         for i in records:
             for journal in i.journal_entries:
@@ -264,8 +372,12 @@ def show(
         period = "week"
     elif period.startswith("m"):
         period = "month"
-    records = get_records_for_period(period, key, all_jobs=all_jobs)
-    total_hours = sum([i.time_span for i in records]) / SECONDS_PER_HOUR
+    # the job of every record is printed, its journals only when asked for
+    options = [joinedload(Clok.job)]
+    if journal:
+        options.append(selectinload(Clok.journal_entries))
+    records = get_records_for_period(period, key, all_jobs=all_jobs, options=options)
+    total_hours = Clok.get_seconds(period, key, all_jobs=all_jobs) / SECONDS_PER_HOUR
 
     print(clock_row_header())
     for i in records:
@@ -276,6 +388,83 @@ def show(
     print(f"Total Hours Worked: {format_hours(total_hours)}")
 
 
+@app.command()
+def summary(
+    period: str = Argument("month", help="One of day, week, month or year"),
+    key: int = Option(
+        None, help="Only summarize this period key, default is every period."
+    ),
+    all_jobs: bool = ALL_JOBS,
+):
+    """Summarize records, hours and journal entries per period and job"""
+    period = {"d": "day", "w": "week", "m": "month", "y": "year"}.get(period[:1])
+    if period is None:
+        print(f"Error: period must be one of (day, week, month, year)")
+        raise ValueError()
+    rows = Clok.summary(period, key, all_jobs=all_jobs)
+    print(summary_row_header())
+    for row in rows:
+        print(summary_format_row(*row))
+    total_seconds = sum(row[3] for row in rows)
+    print(f"Total Hours Worked: {format_hours(total_seconds / SECONDS_PER_HOUR)}")
+
+
+@app.command()
+def stats(
+    period: str = Argument(None, help="One of day, week, month or year, default all"),
+    key: int = Option(None, help="Only use this period key, default is the current."),
+    all_jobs: bool = ALL_JOBS,
+    weeks: int = Option(4, help="The number of weeks in the rolling average"),
+    overtime: float = Option(40.0, help="Hours per week before time is overtime"),
+):
+    """Print hours per job, a weekday and hour heatmap, record lengths and overtime"""
+    try:
+        from core import stats as st
+    except ImportError:
+        print("Error: clok stats needs the optional numpy package")
+        raise
+    if period is not None:
+        period = {"d": "day", "w": "week", "m": "month", "y": "year"}.get(period[:1])
+        if period is None:
+            print(f"Error: period must be one of (day, week, month, year)")
+            raise ValueError()
+    arrays = Clok.to_arrays(period, key, all_jobs=all_jobs)
+    time_span = arrays["time_span"]
+    print(f"Records: {len(time_span)}")
+    print(f"Total Hours Worked: {format_hours(time_span.sum() / SECONDS_PER_HOUR)}")
+    if not len(time_span):
+        return
+
+    names = {j.id: j.name for j in Job.owned()}
+    print("\nHours per job")
+    for job_id, seconds in zip(*st.job_seconds(arrays["job_id"], time_span)):
+        hours = format_hours(seconds / SECONDS_PER_HOUR)
+        print(f"  {names.get(job_id, job_id):<16} {hours}")
+
+    print("\nHours per weekday and hour")
+    heatmap = st.weekday_hour_heatmap(arrays["time_in"], arrays["time_out"])
+    for line in st.format_heatmap(heatmap):
+        print(f"  {line}")
+
+    print("\nRecord lengths")
+    counts, edges = st.span_histogram(time_span)
+    for count, low, high in zip(counts, edges, edges[1:]):
+        label = f"{low:.0f}-{high:.0f}h" if high != float("inf") else f"{low:.0f}h+"
+        print(f"  {label:<7} {count}")
+
+    _, weekly = st.weekly_seconds(arrays["time_in"], time_span)
+    over = st.overtime(weekly, overtime)
+    average = st.rolling_sum(weekly, weeks)[-1] / min(weeks, len(weekly))
+    print(
+        f"\nWeeks over {overtime:g} hours: {int((over > 0).sum())} of {len(weekly)}, "
+        f"overtime {format_hours(over.sum() / SECONDS_PER_HOUR)}"
+    )
+    print(
+        f"Average of the last {weeks} weeks: "
+        f"{format_hours(average / SECONDS_PER_HOUR)} per week"
+    )
+
+
 @app.command()
 def jobs(
     show: bool = Option(True, help="display records for day/week/month/date_key"),
@@ -287,15 +476,15 @@ def jobs(
         show = False
     if show:
         print(Job.print_header())
-        current_job = State.get().job
-        for j in Job.query().all():
-            if j.id == current_job.id:
+        current_job_id = State.get_job_id()
+        for j in Job.owned().all():
+            if j.id == current_job_id:
                 print(f"{j} <- Current")
             else:
                 print(j)
     elif add is not None:
         try:
-            j = Job.query().filter(Job.name == add).one()
+            j = Job.owned().filter(Job.name == add.lower()).one()
             print(f"Job '{add.lower()}' already exists.")
         except NoResultFound:
             print(f"Creating job '{add.lower()}'")
@@ -303,15 +492,7 @@ def jobs(
             j.save()
     elif switch is not None:
         try:
-            s = State.get()
-            c = Clok.get_last_record()
-            if c is not None:
-                if c.time_out is None:
-                    print(f"Clocking you out of '{s.job.name}' at {get_date()}")
-                    Clok.clock_out()
-            print(f"Switching to job '{switch.lower()}'")
-            j = Job.query().filter(Job.name == switch.lower()).one()
-            State.set_job(j)
+            Job.switch(switch, verbose=True)
         except NoResultFound:
             print(f"Job '{switch}' not found")
 
@@ -338,13 +519,93 @@ def delete(id_=Argument(None, help="The id of the time_clock record to delete"))
 
 @app.command()
 def repair():
-
-    for j in Journal.query().all():
+    removed = []
+    for j in Journal.owned().all():
         print(j.clok_id, j.time, j.entry)
         if j.entry is None or j.entry == "show":
-            Journal.delete_by_id(j.id)
+            removed.append(j.id)
+    Journal.bulk_delete(removed)
 
 
-if __name__ == "__main__":
+@app.command()
+def rollup(rebuild: bool = Option(False, help="Recompute the totals from the records")):
+    """Check the daily totals that the reports are summed from"""
+    if rebuild:
+        print(f"Rebuilt {DailyTotal.rebuild()} daily totals")
+        return
+    stale = DailyTotal.stale()
+    print(f"{DailyTotal.count()} daily totals, {stale} out of date")
+    if stale:
+        print("Run 'clok rollup --rebuild' to recompute them")
+
+
+def _span_text(c) -> str:
+    time_out = f"{c.time_out:%H:%M}" if c.time_out is not None else "open"
+    return f"{c.id} {c.time_in:%Y-%m-%d %H:%M}-{time_out}"
+
+
+@app.command()
+def audit(
+    across_jobs: bool = Option(
+        False, help="Also find overlaps and gaps between records of different jobs"
+    ),
+    open_hours: float = Option(
+        AUDIT_OPEN_HOURS, help="Report records still open after this many hours"
+    ),
+    gap_minutes: float = Option(
+        AUDIT_GAP_MINUTES, help="Report breaks within a day longer than this"
+    ),
+    fix: bool = Option(
+        False,
+        help="Merge records that lie within an earlier one into it and truncate "
+        "records that overlap the next one",
+    ),
+):
+    """Find overlapping records, records left open and gaps"""
+    from core.audit import audit_records
+
+    result = audit_records(across_jobs, open_hours, gap_minutes, fix)
+    names = {j.id: j.name for j in Job.owned()}
+    if result.overlaps:
+        print("Overlapping records")
+        for a, b in result.overlaps:
+            job = names.get(b.job_id) if a.job_id == b.job_id else "across jobs"
+            print(f" - {_span_text(a)} overlaps {_span_text(b)} ({job})")
+    if result.open:
+        print(f"Records open for more than {open_hours:g} hours")
+        for c in result.open:
+            print(f" - {_span_text(c)} ({names.get(c.job_id)})")
+    if result.gaps:
+        print(f"Gaps longer than {gap_minutes:g} minutes")
+        for job_id, start, end in result.gaps:
+            hours = format_hours((end - start).total_seconds() / SECONDS_PER_HOUR)
+            job = names.get(job_id, "all jobs")
+            print(f" - {start:%Y-%m-%d %H:%M}-{end:%H:%M} {hours} ({job})")
+    print(
+        f"{len(result.overlaps)} overlaps, {len(result.open)} open records, "
+        f"{len(result.gaps)} gaps"
+    )
+    if fix:
+        print(f"Merged {result.merged} records, truncated {result.truncated}")
+
+
+@app.command()
+def daemon(stop: bool = Option(False, help="Stop the running daemon")):
+    """Serve commands from a resident process over a unix socket. clok.sh forwards
+    commands to it when it is running, which skips interpreter startup and imports."""
+    from core.daemon import serve, stop as stop_daemon
+
+    if stop:
+        if not stop_daemon():
+            print("The daemon is not running")
+    else:
+        serve()
+
+
+def main():
     init()
-    app()
+    app(prog_name="clok")
+
+
+if __name__ == "__main__":
+    main()
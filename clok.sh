@@ -1,13 +1,14 @@
 #!/usr/bin/env bash
 
-VENV_LOC=".venv_location"
 WORKING_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
+VENV_LOC="$WORKING_DIR/.venv_location"
 if [[ ! -f $VENV_LOC ]]; then
   touch $VENV_LOC
-  pipenv --venv > $VENV_LOC
+  (cd "$WORKING_DIR" && pipenv --venv) > $VENV_LOC
 fi
 
-VENV="$(cat $VENV_LOC)"
+# read the cached venv location with a builtin instead of spawning cat on every call
+read -r VENV < "$VENV_LOC"
 if [[ -f "$VENV/bin/python" ]]; then
   PYTHON="$VENV/bin/python"
 elif [[ -f "$VENV/Scripts/python.exe" ]]; then
@@ -19,6 +20,6 @@ fi
 #echo "working_dir: $WORKING_DIR"
 #echo "venv: $VENV"
 #echo "python: $PYTHON"
-# Call program and forward all command line arguments
-$PYTHON  $WORKING_DIR/clok.py "$@"
-
+# Call program and forward all command line arguments. core.fastpath handles in, out
+# and status without loading the full cli, and hands everything else to clok.py
+PYTHONPATH="$WORKING_DIR${PYTHONPATH:+:$PYTHONPATH}" $PYTHON -m core.fastpath "$@"
@@ -0,0 +1,305 @@
+"""This file contains the asyncio api over the TimeClok database for applications that
+embed the models in an event loop. SqlAlchemy 1.3 has no asyncio support, so queries
+run on an aiosqlite connection, whose calls are executed on a background thread and
+never block the loop. Period filters are built with the same SqlAlchemy expressions the
+models use and compiled to sql, writes use the same sql as the fast path, so both apis
+read and write exactly the same rows.
+
+aiosqlite is an optional dependency, it is only needed when this module is used. The
+schema is created and migrated by the synchronous ``clok init``. """
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import IO, Dict, Iterable, List, Optional, Tuple, Union
+
+import aiosqlite
+from sqlalchemy import Column, DateTime, desc, func, select
+from sqlalchemy.dialects import sqlite
+
+from core.date_utils import to_db_datetime
+from core.defines import (
+    DATABASE_FILE,
+    SECONDS_PER_HOUR,
+    SQLITE_PRAGMAS,
+    TRANSFER_CHUNK_SIZE,
+)
+from core.fastpath import (
+    CLOCK_OUT_SQL,
+    INSERT_CLOK_SQL,
+    INSERT_JOURNAL_SQL,
+    LAST_RECORD_SQL,
+    RECORD_SQL,
+    SET_STATE_CLOK_SQL,
+    STATE_SQL,
+    clock_out_values,
+    clok_values,
+    journal_values,
+)
+from core.models import Clok, DailyTotal
+from core.sqlite_utils import pragma_statements
+from core.users import current_user
+from core.utils import to_json
+
+_DIALECT = sqlite.dialect(paramstyle="named")
+# the columns of a record, the change tracking bookkeeping is only dumped
+_RECORD_COLUMNS = [c for c in Clok.__table__.columns if c.name != "change_seq"]
+
+
+class AsyncConnGenerator:
+    """
+    The asyncio counterpart of SqlAlchemyConnGenerator for sqlite databases. It owns one
+    aiosqlite connection that is opened on first use. sqlite only allows one writer at
+    a time anyway, so coroutines take turns on the connection through ``unit_of_work``
+    instead of each opening their own.
+    """
+
+    def __init__(self, sqlite_db: Union[str, bool] = True, **kwargs):
+        self._sqlite_db = sqlite_db
+        self._sqlite_pragmas = kwargs.get("sqlite_pragmas", {})
+        self._connection = None
+        self._lock = None
+        self._owner = None
+
+    @property
+    def database(self) -> str:
+        return self._sqlite_db if isinstance(self._sqlite_db, str) else ":memory:"
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # created lazily so that it belongs to the loop that first uses it
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _connect(self) -> aiosqlite.Connection:
+        if self._connection is None:
+            connection = await aiosqlite.connect(self.database)
+            for statement in pragma_statements(self._sqlite_pragmas):
+                await connection.execute(statement)
+            self._connection = connection
+        return self._connection
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """Give the current task the connection for one transaction. The outermost
+        block commits once when it exits and rolls back if it raises, nested blocks in
+        the same task join the transaction of the enclosing one.
+
+        ::
+
+            async with ADB.unit_of_work() as connection:
+                await connection.execute(...)
+        """
+        task = asyncio.current_task()
+        if self._owner is not None and self._owner is task:
+            yield self._connection
+            return
+        async with self.lock:
+            connection = await self._connect()
+            self._owner = task
+            try:
+                yield connection
+                await connection.commit()
+            except BaseException:
+                await connection.rollback()
+                raise
+            finally:
+                self._owner = None
+
+    async def fetchall(self, sql: str, parameters=()) -> List[tuple]:
+        async with self.unit_of_work() as connection:
+            async with connection.execute(sql, parameters) as cursor:
+                return await cursor.fetchall()
+
+    async def fetchone(self, sql: str, parameters=()) -> Optional[tuple]:
+        async with self.unit_of_work() as connection:
+            async with connection.execute(sql, parameters) as cursor:
+                return await cursor.fetchone()
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+
+ADB = AsyncConnGenerator(sqlite_db=DATABASE_FILE, sqlite_pragmas=SQLITE_PRAGMAS)
+
+
+def compile_query(query) -> Tuple[str, dict]:
+    """Compile a SqlAlchemy core statement to sql and parameters for aiosqlite."""
+    compiled = query.compile(dialect=_DIALECT)
+    parameters = {
+        name: to_db_datetime(value) if isinstance(value, datetime) else value
+        for name, value in compiled.params.items()
+    }
+    return str(compiled), parameters
+
+
+def _row_to_dict(columns: Iterable[Column], row: tuple) -> Dict:
+    record = {}
+    for column, value in zip(columns, row):
+        if isinstance(column.type, DateTime) and value is not None:
+            value = datetime.fromisoformat(value)
+        record[column.name] = value
+    return record
+
+
+async def state(db: AsyncConnGenerator = ADB) -> Tuple[int, int, Optional[int], int]:
+    """Return the (id, job_id, clok_id, user_id) of the current user's state row. New
+    users are registered by the synchronous models, see State.current."""
+    row = await db.fetchone(STATE_SQL, (current_user(),))
+    if row is None:
+        raise LookupError(f"TimeClok has no user named '{current_user()}' yet")
+    return row
+
+
+async def get_last_record(db: AsyncConnGenerator = ADB) -> Optional[Dict]:
+    """Same as Clok.get_last_record, returns the record as a dictionary."""
+    async with db.unit_of_work():
+        _, job_id, clok_id, user_id = await state(db)
+        table = Clok.__table__
+        query = select(_RECORD_COLUMNS).where(table.c.user_id == user_id)
+        if clok_id is not None:
+            query = query.where(table.c.id == clok_id)
+        else:
+            query = query.where(table.c.job_id == job_id)
+            query = query.order_by(desc(table.c.time_in)).limit(1)
+        row = await db.fetchone(*compile_query(query))
+    return row and _row_to_dict(_RECORD_COLUMNS, row)
+
+
+async def add_journal(
+    clok_id: int, msg: str, when: datetime = None, db: AsyncConnGenerator = ADB
+):
+    async with db.unit_of_work() as connection:
+        user_id = (await state(db))[3]
+        await connection.execute(
+            INSERT_JOURNAL_SQL,
+            journal_values(user_id, clok_id, msg, when or datetime.now()),
+        )
+
+
+async def clock_in_when(
+    when: datetime, msg: str = None, db: AsyncConnGenerator = ADB
+) -> int:
+    """Clock in to the current job at ``when`` and return the new record's id."""
+    async with db.unit_of_work() as connection:
+        state_id, job_id, _, user_id = await state(db)
+        cursor = await connection.execute(
+            INSERT_CLOK_SQL, clok_values(user_id, job_id, when)
+        )
+        clok_id = cursor.lastrowid
+        await cursor.close()
+        await connection.execute(SET_STATE_CLOK_SQL, (clok_id, state_id))
+        if msg is not None:
+            await add_journal(clok_id, msg, when, db)
+    return clok_id
+
+
+async def clock_in(msg: str = None, db: AsyncConnGenerator = ADB) -> int:
+    return await clock_in_when(datetime.now(), msg, db)
+
+
+async def clock_out_when(
+    when: datetime,
+    msg: str = None,
+    clok_id: int = None,
+    db: AsyncConnGenerator = ADB,
+) -> int:
+    """Clock out of the last record, or of record ``clok_id``, at ``when`` and return
+    the record's id. Only the current user's records can be clocked out of."""
+    async with db.unit_of_work() as connection:
+        _, job_id, current_id, user_id = await state(db)
+        clok_id = clok_id if clok_id is not None else current_id
+        if clok_id is not None:
+            record = await db.fetchone(RECORD_SQL, (clok_id, user_id))
+        else:
+            record = await db.fetchone(LAST_RECORD_SQL, (user_id, job_id))
+        if record is None:
+            raise LookupError("There is no record to clock out of")
+        clok_id, time_in, _ = record
+        await connection.execute(
+            CLOCK_OUT_SQL,
+            clock_out_values(clok_id, datetime.fromisoformat(time_in), when),
+        )
+        if msg is not None:
+            await add_journal(clok_id, msg, when, db)
+    return clok_id
+
+
+async def clock_out(msg: str = None, db: AsyncConnGenerator = ADB) -> int:
+    return await clock_out_when(datetime.now(), msg, db=db)
+
+
+async def _scope_filter(query, all_jobs: bool, db: AsyncConnGenerator, model=Clok):
+    """Same as SpanQuery.scope_filter."""
+    _, job_id, _, user_id = await state(db)
+    query = query.where(model.user_id == user_id)
+    if not all_jobs:
+        query = query.where(model.job_id == job_id)
+    return query
+
+
+async def get_by_period(
+    period: str, key=None, all_jobs=False, db: AsyncConnGenerator = ADB
+) -> List[Dict]:
+    """Same as SpanQuery.get_by_period, returns the records as dictionaries."""
+    query = select(_RECORD_COLUMNS).where(Clok.period_filter(period, key))
+    async with db.unit_of_work():
+        query = await _scope_filter(query, all_jobs, db)
+        rows = await db.fetchall(*compile_query(query))
+    return [_row_to_dict(_RECORD_COLUMNS, row) for row in rows]
+
+
+async def get_seconds(
+    period: str, key=None, all_jobs=False, db: AsyncConnGenerator = ADB
+) -> int:
+    """Same as Clok.get_seconds."""
+    query = select([func.coalesce(func.sum(DailyTotal.seconds), 0)])
+    query = query.where(DailyTotal.period_filter(period, key))
+    async with db.unit_of_work():
+        query = await _scope_filter(query, all_jobs, db, DailyTotal)
+        (seconds,) = await db.fetchone(*compile_query(query))
+    return seconds
+
+
+async def get_hours(
+    period: str, key=None, all_jobs=False, db: AsyncConnGenerator = ADB
+) -> float:
+    return await get_seconds(period, key, all_jobs, db) / SECONDS_PER_HOUR
+
+
+async def dump_database(
+    f: IO, chunk_size: int = TRANSFER_CHUNK_SIZE, db: AsyncConnGenerator = ADB
+) -> Dict[str, int]:
+    """Same as core.transfer.dump_database. The connection is held for the whole dump
+    so that it is a consistent snapshot, rows are fetched ``chunk_size`` at a time."""
+    from core.transfer import DUMP_TABLES
+
+    counts = {}
+    async with db.unit_of_work() as connection:
+        f.write("{")
+        for n, table in enumerate(DUMP_TABLES):
+            f.write(f"{', ' if n else ''}{json.dumps(table.name)}: [")
+            query = select([table]).order_by(*table.primary_key.columns)
+            count = 0
+            async with connection.execute(*compile_query(query)) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        row = _row_to_dict(table.columns, row)
+                        row = json.dumps(row, default=to_json)
+                        f.write(f"{', ' if count else ''}{row}")
+                        count += 1
+            f.write("]")
+            counts[table.name] = count
+        f.write("}")
+    return counts
+
+
+async def dump_file(file_path: str, **kwargs) -> Dict[str, int]:
+    with open(file_path, "w") as f:
+        return await dump_database(f, **kwargs)
@@ -0,0 +1,124 @@
+"""This file contains the record audit behind ``clok audit``. Overlapping records are
+counted twice by every report, the audit finds them along with records left open and
+gaps within a day. The current user's records are read with one ordered Core select and
+swept once while they stream in: a record overlaps when it starts before the latest end
+seen so far, which also catches records inside a long earlier one that comparing
+neighbours would miss. The time taken grows linearly with the number of records.
+
+With ``fix`` records that lie entirely within an earlier one are merged into it, their
+journal entries moved over, and records that run past the start of the next one are
+truncated to end there. All fixes are written in one transaction. """
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, select
+
+from core.defines import AUDIT_GAP_MINUTES, AUDIT_OPEN_HOURS, TRANSFER_CHUNK_SIZE
+from core.models import Clok, Journal, State
+
+Span = namedtuple("Span", "id job_id date_key time_in time_out")
+
+
+class AuditResult:
+    """The overlaps found by ``audit_records`` as (earlier, later) record pairs, the
+    records left open, the gaps as (job_id, start, end) and, with ``fix``, the number
+    of records merged and truncated. The job_id of gaps is None across jobs."""
+
+    def __init__(self):
+        self.overlaps = []
+        self.open = []
+        self.gaps = []
+        self.merged = 0
+        self.truncated = 0
+
+    @property
+    def clean(self) -> bool:
+        return not (self.overlaps or self.open or self.gaps)
+
+
+def _iter_spans(across_jobs: bool, chunk_size: int):
+    table = Clok.__table__
+    columns = [getattr(table.c, name) for name in Span._fields]
+    # of the records starting together the longest comes first and holds the others,
+    # which are merged into it rather than truncated to nothing
+    order = [table.c.time_in, table.c.time_out.desc(), table.c.id]
+    if not across_jobs:
+        order.insert(0, table.c.job_id)
+    query = select(columns).where(table.c.user_id == State.get_user_id())
+    result = Clok.db().execute(query.order_by(*order))
+    try:
+        rows = result.fetchmany(chunk_size)
+        while rows:
+            yield from (Span(*row) for row in rows)
+            rows = result.fetchmany(chunk_size)
+    finally:
+        result.close()
+
+
+def audit_records(
+    across_jobs: bool = False,
+    open_hours: float = AUDIT_OPEN_HOURS,
+    gap_minutes: float = AUDIT_GAP_MINUTES,
+    fix: bool = False,
+    now: datetime = None,
+    chunk_size: int = TRANSFER_CHUNK_SIZE,
+) -> AuditResult:
+    """Audit the current user's records, each job's on their own unless
+    ``across_jobs``. Open records are never merged or truncated."""
+    result = AuditResult()
+    opened_before = (now or datetime.now()) - timedelta(hours=open_hours)
+    gap = timedelta(minutes=gap_minutes)
+    truncated, merged = [], []
+    holder, holder_end = None, None
+    for span in _iter_spans(across_jobs, chunk_size):
+        if holder is not None and holder.job_id != span.job_id and not across_jobs:
+            holder = None
+        # open records take no time in the sweep
+        end = span.time_out or span.time_in
+        if span.time_out is None and span.time_in < opened_before:
+            result.open.append(span)
+        if holder is None:
+            holder, holder_end = span, end
+            continue
+        if span.time_in < holder_end:
+            result.overlaps.append((holder, span))
+            if fix and span.time_out is not None:
+                if end <= holder_end:
+                    merged.append((span.id, holder.id))
+                    continue
+                truncated.append((holder, span.time_in))
+        elif span.date_key == holder.date_key and span.time_in - holder_end > gap:
+            job_id = None if across_jobs else span.job_id
+            result.gaps.append((job_id, holder_end, span.time_in))
+        if end > holder_end:
+            holder, holder_end = span, end
+    if truncated or merged:
+        _apply_fixes(truncated, merged)
+    result.truncated, result.merged = len(truncated), len(merged)
+    return result
+
+
+def _apply_fixes(truncated: list, merged: list):
+    journal = Journal.__table__
+    move = (
+        journal.update()
+        .where(journal.c.clok_id == bindparam("merged_id"))
+        .values(clok_id=bindparam("into_id"))
+    )
+    with Clok.unit_of_work() as session:
+        Clok.bulk_update(
+            {
+                "id": span.id,
+                "time_out": time_out,
+                "time_span": (time_out - span.time_in).total_seconds(),
+            }
+            for span, time_out in truncated
+        )
+        if merged:
+            moves = [{"merged_id": m, "into_id": into} for m, into in merged]
+            session.execute(move, moves)
+            Clok.bulk_delete(m for m, _ in merged)
+            # the state must not point at a record that is gone
+            into = dict(merged).get(State.get_clok_id())
+            if into is not None:
+                State.set_clok(Clok.get_by_id(into))
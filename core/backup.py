@@ -0,0 +1,137 @@
+"""This file contains the hot backup and restore behind ``clok backup`` and ``clok
+restore``. Both use sqlite's online backup api on the engine's own connections, which
+copies the database file page by page instead of reading rows, so they take time
+proportional to the size of the file. Backups copy BACKUP_PAGES pages at a time from one
+read snapshot, so they are consistent and, in wal mode, ``clok in`` and ``clok out``
+from other processes keep working while a backup runs. Backups can be gzip compressed,
+restores detect compressed files. """
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from core.database import DB
+from core.defines import BACKUP_COMPRESS_LEVEL, BACKUP_COPY_SIZE, BACKUP_PAGES
+from core.migrations import migrate
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _step_progress(progress: Callable[[int, int], None]):
+    """Adapt a progress(pages copied, total pages) callback to sqlite3's."""
+    if progress is None:
+        return None
+    return lambda status, remaining, total: progress(total - remaining, total)
+
+
+@contextmanager
+def _read_transaction(connection: sqlite3.Connection):
+    """Hold a read transaction on the source of a backup. sqlite restarts a backup
+    whenever another connection writes between two steps, which under a steady trickle
+    of writes never finishes. In the transaction every step reads the same snapshot,
+    and in wal mode that doesn't block writers."""
+    if connection.in_transaction:
+        yield
+        return
+    connection.execute("BEGIN")
+    try:
+        connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        yield
+    finally:
+        connection.execute("COMMIT")
+
+
+def backup(
+    file_path: str,
+    compress: bool = False,
+    pages: int = BACKUP_PAGES,
+    progress: Callable[[int, int], None] = None,
+) -> int:
+    """Copy the database to ``file_path``, gzip compressed with ``compress``, and
+    return the size of the backup. The copy is written next to ``file_path`` and only
+    renamed to it once complete, a failed backup never leaves a partial file behind.
+    ``progress`` is called with the number of pages copied and the total after every
+    step."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, part_path = tempfile.mkstemp(suffix=".part", dir=directory)
+    os.close(fd)
+    try:
+        target = sqlite3.connect(part_path)
+        source = DB.engine.raw_connection()
+        try:
+            with _read_transaction(source.connection):
+                source.connection.backup(
+                    target, pages=pages, progress=_step_progress(progress)
+                )
+            # a self contained file, without the -wal and -shm files of wal mode
+            target.execute("PRAGMA journal_mode = delete")
+        finally:
+            source.close()
+            target.close()
+        if compress:
+            gz = gzip.open(f"{part_path}.gz", "wb", BACKUP_COMPRESS_LEVEL)
+            with open(part_path, "rb") as f, gz:
+                shutil.copyfileobj(f, gz, BACKUP_COPY_SIZE)
+            os.replace(f"{part_path}.gz", part_path)
+        os.replace(part_path, file_path)
+    finally:
+        for path in (part_path, f"{part_path}.gz"):
+            if os.path.exists(path):
+                os.remove(path)
+    return os.path.getsize(file_path)
+
+
+def is_compressed(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        return f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+@contextmanager
+def open_backup(file_path: str) -> Iterator[sqlite3.Connection]:
+    """Open a backup, decompressed to a temporary file if needed, and check that it is
+    an intact TimeClok database. Raises ValueError if it isn't."""
+    with tempfile.TemporaryDirectory() as tmp:
+        if is_compressed(file_path):
+            path = os.path.join(tmp, "restore.db")
+            with gzip.open(file_path, "rb") as gz, open(path, "wb") as f:
+                shutil.copyfileobj(gz, f, BACKUP_COPY_SIZE)
+        else:
+            path = file_path
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            try:
+                check = connection.execute("PRAGMA quick_check").fetchone()[0]
+                tables = connection.execute(
+                    "SELECT count(*) FROM sqlite_master WHERE name = 'time_clok'"
+                ).fetchone()[0]
+            except sqlite3.DatabaseError as e:
+                raise ValueError(f"{file_path} is not a TimeClok backup: {e}")
+            if check != "ok" or not tables:
+                raise ValueError(f"{file_path} is not an intact TimeClok backup")
+            yield connection
+        finally:
+            connection.close()
+
+
+def restore(
+    file_path: str,
+    pages: int = BACKUP_PAGES,
+    progress: Callable[[int, int], None] = None,
+) -> int:
+    """Replace the database with the backup at ``file_path`` and return the number of
+    migrations applied to it. The backup is checked before anything is overwritten,
+    and backups made by older versions are migrated after they are restored."""
+    with open_backup(file_path) as source:
+        # the current session's objects and cached state belong to the old database
+        DB.make_new_session()
+        target = DB.engine.raw_connection()
+        try:
+            source.backup(
+                target.connection, pages=pages, progress=_step_progress(progress)
+            )
+        finally:
+            target.close()
+    return migrate(DB.engine)
@@ -0,0 +1,206 @@
+"""This file contains the optional resident daemon and its thin client. ``clok daemon``
+keeps the database connection and the mapped models warm and runs commands sent over a
+local unix socket, so frequent callers like editor and git hooks don't pay for
+interpreter startup, imports and mapper configuration on every call.
+
+The protocol is one json request line, ``{"argv": [...], "cwd": "...", "user": "..."}``,
+answered with the command's output as it is produced followed by a NUL byte and the exit
+code. The client side only uses the standard library so the fast path can import it
+cheaply. """
+import contextvars
+import json
+import os
+import socket
+import sys
+from typing import List, Optional
+
+from core.defines import SOCKET_FILE
+from core.users import current_user, set_user, split_user_option
+
+# exit code the daemon answers with when a command needs a terminal, the client then
+# runs the command in process instead
+EXIT_NEEDS_TERMINAL = 75
+
+# commands that are never forwarded, they prompt after writing or manage the daemon,
+# profiled commands run in process so the profile is of their own process
+LOCAL_COMMANDS = ("daemon", "delete")
+LOCAL_OPTIONS = ("--delete", "--profile", "--profile-with")
+
+
+class NeedsTerminal(Exception):
+    """Raised in the daemon when a command asks for confirmation."""
+
+
+def _should_forward(argv: List[str]) -> bool:
+    _, argv = split_user_option(argv)
+    if not argv or argv[0] in LOCAL_COMMANDS:
+        return False
+    return not any(arg.split("=")[0] in LOCAL_OPTIONS for arg in argv)
+
+
+def _send(request: dict, path: str) -> Optional[socket.socket]:
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def forward(argv: List[str], path: str = SOCKET_FILE, out=None) -> Optional[int]:
+    """Run a command in the daemon, streaming its output to ``out``. Returns the exit
+    code, or None when no daemon is running or the command has to run in process."""
+    if not _should_forward(argv):
+        return None
+    # the user is resolved here, the daemon's environment may name someone else
+    sock = _send(dict(argv=argv, cwd=os.getcwd(), user=current_user()), path)
+    if sock is None:
+        return None
+    out = out or sys.stdout.buffer
+    trailer = None
+    with sock:
+        while True:
+            data = sock.recv(1 << 16)
+            if not data:
+                break
+            if trailer is None:
+                output, nul, rest = data.partition(b"\0")
+                out.write(output)
+                out.flush()
+                if nul:
+                    trailer = rest
+            else:
+                trailer += data
+    if not trailer:
+        # the daemon went away in the middle of the command
+        return 1
+    code = int(trailer)
+    return None if code == EXIT_NEEDS_TERMINAL else code
+
+
+def stop(path: str = SOCKET_FILE) -> bool:
+    sock = _send(dict(stop=True), path)
+    if sock is None:
+        return False
+    with sock:
+        sock.recv(1)
+    return True
+
+
+class _SocketWriter:
+    """A minimal text stream that sends everything written to it to the client."""
+
+    def __init__(self, sock: socket.socket):
+        self._sock = sock
+
+    def write(self, s: str) -> int:
+        self._sock.sendall(s.encode())
+        return len(s)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _needs_terminal(*args, **kwargs):
+    raise NeedsTerminal()
+
+
+def execute(argv: List[str], out, user: str = None) -> int:
+    """Run one command for ``user`` in a copy of the current context, so that the user
+    set by the request or its --user option does not leak into later commands."""
+    return contextvars.copy_context().run(_execute, argv, out, user)
+
+
+def _execute(argv: List[str], out, user: str = None) -> int:
+    """Run one command of the cli with its output written to ``out`` and return the exit
+    code. The session is removed afterwards so the next command sees writes made by
+    other processes in the meantime."""
+    import contextlib
+    import traceback
+
+    import click
+    import typer
+
+    import clok
+    from core.database import DB
+
+    # there is no terminal in the daemon, confirmations are handed back to the client
+    confirm, typer.confirm = typer.confirm, _needs_terminal
+    set_user(user)
+    code = 0
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        try:
+            clok.app(args=argv, prog_name="clok", standalone_mode=False)
+        except NeedsTerminal:
+            code = EXIT_NEEDS_TERMINAL
+        except click.exceptions.Exit as e:
+            code = e.exit_code
+        except click.ClickException as e:
+            e.show(file=out)
+            code = e.exit_code
+        except click.Abort:
+            print("Aborted!")
+            code = 1
+        except Exception:
+            traceback.print_exc(file=out)
+            code = 1
+        finally:
+            typer.confirm = confirm
+            DB.remove_session()
+    return code
+
+
+def serve(path: str = SOCKET_FILE):
+    """Serve commands on a unix socket until stopped. Requests are handled one at a
+    time, which keeps the shared session safe."""
+    import socketserver
+
+    import clok
+
+    if stop(path):
+        print("Stopped the running daemon")
+    if os.path.exists(path):
+        os.unlink(path)
+    clok.init()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            if request.get("stop"):
+                self.wfile.write(b"\0")
+                self.server.stopping = True
+                return
+            cwd = os.getcwd()
+            try:
+                os.chdir(request.get("cwd") or cwd)
+                code = execute(
+                    request["argv"],
+                    _SocketWriter(self.connection),
+                    request.get("user"),
+                )
+            finally:
+                os.chdir(cwd)
+            self.wfile.write(b"\0" + str(code).encode())
+
+    server = socketserver.UnixStreamServer(path, Handler)
+    server.stopping = False
+    os.chmod(path, 0o600)
+    inode = os.stat(path).st_ino
+    print(f"TimeClok daemon listening on {path}")
+    try:
+        while not server.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # a daemon started to replace this one may already own the path
+        if os.path.exists(path) and os.stat(path).st_ino == inode:
+            os.unlink(path)
@@ -2,35 +2,30 @@
 and cloud databases that can be uses throughout the application. """
 import json
 from datetime import datetime
-from typing import Union
+from itertools import islice
+from typing import Iterable, Iterator, List, Union
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, JSON
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, JSON, and_, bindparam
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Query
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import IntegrityError
 
 from core.utils import SqlAlchemyConnGenerator
-from core.defines import DATABASE_FILE
+from core.defines import DATABASE_FILE, SQLITE_PRAGMAS, TRANSFER_CHUNK_SIZE
 
 # if this is not set to a filename then it will default to an in memory db by passing
 # true to the sqlite_db keyword.
-DB = SqlAlchemyConnGenerator(sqlite_db=DATABASE_FILE)
+DB = SqlAlchemyConnGenerator(sqlite_db=DATABASE_FILE, sqlite_pragmas=SQLITE_PRAGMAS)
 
 BaseModel = declarative_base()
 
 
-def add_items_to_database(items):
-    for item in items:
-        _add_item(item)
-
-
-def _add_item(item):
-    try:
-        DB.session.add(item)
-        DB.session.commit()
-    except IntegrityError:
-        DB.session.rollback()
+def _chunks(rows: Iterable, size: int) -> Iterator[List]:
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
 
 
 class CRUDMixin(object):
@@ -53,17 +48,79 @@ class CRUDMixin(object):
         return commit and self.save() or self
 
     def save(self, commit=True):
-        """Save the record."""
-        self._db_instance.locked_session.add(self)
+        """Save the record. Inside a unit of work the commit is left to the outermost
+        block, ``commit=False`` only adds the record to the session."""
         if commit:
-            self._db_instance.locked_session.commit()
+            with self._db_instance.unit_of_work() as session:
+                session.add(self)
+        else:
+            self._db_instance.session.add(self)
         return self
 
     def delete(self, commit=True):
         """Remove the record from the database."""
-        self._db_instance.locked_session.delete(self)
         if commit:
-            self._db_instance.locked_session.commit()
+            with self._db_instance.unit_of_work() as session:
+                session.delete(self)
+        else:
+            self._db_instance.session.delete(self)
+
+    # The bulk methods write with Core executemany batches of ``chunk_size`` rows in
+    # one unit of work, they commit once or join the enclosing unit of work. They skip
+    # the session, instances it already holds don't see their changes until they are
+    # expired. Models with an ``owned`` query only change the current user's rows.
+
+    @classmethod
+    def _bulk_scope(cls):
+        owned = getattr(cls, "owned", None)
+        return owned().whereclause if owned is not None else None
+
+    @classmethod
+    def bulk_create(
+        cls, rows: Iterable[dict], chunk_size: int = TRANSFER_CHUNK_SIZE
+    ) -> int:
+        """Insert ``rows``, dicts of column values that all have the same keys, and
+        return the number inserted. Missing columns get their defaults."""
+        count = 0
+        with cls._db_instance.unit_of_work() as session:
+            for chunk in _chunks(rows, chunk_size):
+                session.execute(cls.__table__.insert(), chunk)
+                count += len(chunk)
+        return count
+
+    @classmethod
+    def bulk_update(
+        cls, rows: Iterable[dict], chunk_size: int = TRANSFER_CHUNK_SIZE
+    ) -> int:
+        """Update the rows with the ids of ``rows``, dicts of an id and the new column
+        values that all have the same keys, and return the number updated."""
+        table, scope, count = cls.__table__, cls._bulk_scope(), 0
+        with cls._db_instance.unit_of_work() as session:
+            for chunk in _chunks(rows, chunk_size):
+                values = {name: bindparam(name) for name in chunk[0] if name != "id"}
+                where = table.c.id == bindparam("bulk_id")
+                statement = table.update().where(
+                    where if scope is None else and_(where, scope)
+                )
+                params = [{"bulk_id": row["id"], **row} for row in chunk]
+                for row in params:
+                    del row["id"]
+                count += session.execute(statement.values(values), params).rowcount
+        return count
+
+    @classmethod
+    def bulk_delete(
+        cls, ids: Iterable[int], chunk_size: int = TRANSFER_CHUNK_SIZE
+    ) -> int:
+        """Delete the rows with ``ids`` and return the number deleted."""
+        table, scope, count = cls.__table__, cls._bulk_scope(), 0
+        where = table.c.id == bindparam("bulk_id")
+        statement = table.delete().where(where if scope is None else and_(where, scope))
+        with cls._db_instance.unit_of_work() as session:
+            for chunk in _chunks(ids, chunk_size):
+                params = [{"bulk_id": record_id} for record_id in chunk]
+                count += session.execute(statement, params).rowcount
+        return count
 
     def __repr__(self):
         d = {}
@@ -81,11 +138,15 @@ class Model(CRUDMixin, BaseModel):
 
     @classmethod
     def query(cls) -> Query:
-        return cls._db_instance.locked_session.query(cls)
+        return cls._db_instance.session.query(cls)
 
     @classmethod
     def db(cls):
-        return cls._db_instance.locked_session
+        return cls._db_instance.session
+
+    @classmethod
+    def unit_of_work(cls):
+        return cls._db_instance.unit_of_work()
 
     @classmethod
     def count(self):
@@ -115,6 +176,16 @@ class Tracked(object):
     modified_at = Column(DateTime, onupdate=datetime.utcnow)
 
 
+class Versioned(object):
+    """Mixin for the tables whose changes are tracked for incremental dumps. Triggers
+    set change_seq from a database wide sequence whenever a row is inserted or updated,
+    whoever writes it, see the track_changes migration."""
+
+    change_seq = Column(
+        Integer, nullable=False, default=0, server_default="0", index=True
+    )
+
+
 class JsonData(object):
     _data = Column("data", JSON, default={})
 
@@ -170,8 +241,8 @@ class SurrogatePK(object):
                 isinstance(record_id, (int, float)),
             )
         ):
-            cls.query().filter(cls.id == int(record_id)).delete()
-            cls.db().commit()
+            with cls.unit_of_work():
+                cls.query().filter(cls.id == int(record_id)).delete()
 
 
 def reference_col(tablename, nullable=False, pk_name="id", **kwargs):
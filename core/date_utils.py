@@ -1,12 +1,27 @@
+import re
 from datetime import datetime, timedelta
-from typing import Union
+from functools import lru_cache
+from typing import Tuple, Union
 
-from core.defines import DATE_FORMAT, DATE_TIME_FORMATS
+from core.defines import DATE_PARSE_CACHE_SIZE, DB_DATETIME_FORMAT
+
+# the forms of TIME_FORMATS in core.defines, with optional fractional seconds for iso
+# and sqlite strings. 12 hour times have an am/pm suffix in any case.
+_TIME_PATTERN = (
+    r"(?P<hour>\d{1,2}):(?P<minute>\d{1,2})"
+    r"(?::(?P<second>\d{1,2})(?:\.(?P<fraction>\d{1,6}))?)?"
+    r"\s*(?P<ampm>[aApP][mM])?"
+)
+_DATE_PATTERN = r"(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})"
+_TIME_RE = re.compile(_TIME_PATTERN)
+_DATE_RE = re.compile(_DATE_PATTERN)
+_DATE_TIME_RE = re.compile(f"{_DATE_PATTERN}[ T]{_TIME_PATTERN}")
+_DELTA_RE = re.compile(r"(?P<sign>[_+])(?P<value>\d+)(?P<unit>[hHmM])")
 
 
 def get_date_key(key: Union[datetime, int, str] = None) -> int:
     if isinstance(key, datetime):
-        return int(key.strftime("%Y%m%d"))
+        return key.year * 10000 + key.month * 100 + key.day
     elif isinstance(key, int):
         return key
     elif isinstance(key, str):
@@ -16,15 +31,57 @@ def get_date_key(key: Union[datetime, int, str] = None) -> int:
 
 
 def get_week(date: datetime = None) -> int:
+    """Return the year qualified week key of a date, 2020 week 41 is 202041. Weeks are
+    the same as strftime("%U"), they start on sunday and the days before the first
+    sunday of the year are in week 0."""
     if date is None:
         date = datetime.now()
-    return int(date.strftime("%U"))
+    day_of_year = date.toordinal() - date.replace(month=1, day=1).toordinal()
+    weekday = (date.weekday() + 1) % 7
+    return date.year * 100 + (day_of_year + 7 - weekday) // 7
 
 
 def get_month(date: datetime = None) -> int:
+    """Return the year qualified month key of a date, October 2020 is 202010."""
     if date is None:
         date = datetime.now()
-    return date.month
+    return date.year * 100 + date.month
+
+
+def qualify_period_key(key: Union[int, str, None], default: int) -> int:
+    """Normalize a week or month key from user input. Bare week (0-53) and month (1-12)
+    numbers are taken to be in the current year, year qualified keys are returned as
+    they are and None returns the default."""
+    if key is None:
+        return default
+    key = int(key)
+    if key < 100:
+        return datetime.now().year * 100 + key
+    return key
+
+
+def get_week_key(key: Union[int, str] = None) -> int:
+    return qualify_period_key(key, get_week())
+
+
+def get_month_key(key: Union[int, str] = None) -> int:
+    return qualify_period_key(key, get_month())
+
+
+def to_db_datetime(date: Union[datetime, None]) -> Union[str, None]:
+    """Format a datetime the same way SqlAlchemy stores sqlite DateTime columns, so rows
+    written with raw sql compare equal to rows written through the orm."""
+    if date is None:
+        return None
+    return DB_DATETIME_FORMAT % (
+        date.year,
+        date.month,
+        date.day,
+        date.hour,
+        date.minute,
+        date.second,
+        date.microsecond,
+    )
 
 
 def get_date():
@@ -37,41 +94,86 @@ def parse_date(date: Union[str, int, float, datetime]):
     if isinstance(date, (float, int)):
         return datetime.fromtimestamp(date)
     elif isinstance(date, str):
-        return datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+        return parse_datetime(date)
     elif isinstance(date, datetime):
         return date
     else:
         raise ValueError(f"This format is not supported: ({date}) type({type(date)})")
 
 
+def _clock(match) -> Tuple[int, int, int, int]:
+    """Return the (hour, minute, second, microsecond) of a _TIME_PATTERN match."""
+    hour, minute = int(match["hour"]), int(match["minute"])
+    second = int(match["second"] or 0)
+    microsecond = int((match["fraction"] or "0").ljust(6, "0"))
+    ampm = match["ampm"]
+    if ampm is not None:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"{hour} is not a 12 hour clock hour")
+        hour = hour % 12 + (12 if ampm.lower() == "pm" else 0)
+    return hour, minute, second, microsecond
+
+
+@lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def _parse_time(time: str) -> Tuple[int, int, int, int]:
+    match = _TIME_RE.fullmatch(time)
+    if match is None:
+        raise ValueError(f"Could not parse time string {time}")
+    return _clock(match)
+
+
+@lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def _parse_date(date: str) -> datetime:
+    match = _DATE_RE.fullmatch(date)
+    if match is None:
+        raise ValueError(f"Could not parse date string {date}")
+    return datetime(int(match["year"]), int(match["month"]), int(match["day"]))
+
+
+@lru_cache(maxsize=DATE_PARSE_CACHE_SIZE)
+def parse_datetime(date_time: str) -> datetime:
+    """Parse an absolute date and time, either iso 8601 or a date followed by any of the
+    TIME_FORMATS in core.defines. Times with a utc offset are converted to naive local
+    time like every other time in the database. Results are cached, only absolute
+    inputs ever get here."""
+    if date_time[-1:].isdigit():
+        # iso strings, and the strings sqlite stores, are parsed in c
+        try:
+            value = datetime.fromisoformat(date_time)
+        except ValueError:
+            pass
+        else:
+            if value.tzinfo is not None:
+                value = value.astimezone().replace(tzinfo=None)
+            return value
+    match = _DATE_TIME_RE.fullmatch(date_time)
+    if match is None:
+        raise ValueError(f"Could not parse time string {date_time}")
+    year, month, day = int(match["year"]), int(match["month"]), int(match["day"])
+    return datetime(year, month, day, *_clock(match))
+
+
 def parse_date_time_junction(junction: str) -> (datetime, datetime):
     date_str, time_junc = junction.split(" ")
-    date = datetime.strptime(date_str, DATE_FORMAT)
+    date = _parse_date(date_str)
     time_str1, time_str2 = time_junc.split("-")
     print(time_str1, time_str2)
     return parse_date_and_time(time_str1, date), parse_date_and_time(time_str2, date)
 
 
 def parse_date_and_time(time: str, date: datetime = None) -> datetime:
-    if time.startswith("_") or time.startswith("+"):
+    """Parse a time on ``date``, today by default, a full date and time or a delta
+    from now like _5m or +1h."""
+    if time.startswith(("_", "+")):
+        # relative to now, so never cached
         return parse_time_delta(time)
-
+    try:
+        hour, minute, second, microsecond = _parse_time(time)
+    except ValueError:
+        return parse_datetime(time)
     if date is None:
-        date_str = datetime.now().strftime(DATE_FORMAT)
-    else:
-        date_str = date.strftime(DATE_FORMAT)
-
-    if len(time) <= 11:
-        date_time_str = f"{date_str} {time.upper()}"
-    else:
-        date_time_str = time
-    for fmt in DATE_TIME_FORMATS:
-        try:
-            return datetime.strptime(date_time_str, fmt)
-        except ValueError:
-            pass
-
-    raise ValueError(f"Could not parse time string {time}")
+        date = datetime.now()
+    return datetime(date.year, date.month, date.day, hour, minute, second, microsecond)
 
 
 def format_hours(hours: float) -> str:
@@ -82,17 +184,16 @@ def format_hours(hours: float) -> str:
 
 
 def parse_time_delta(date: str) -> datetime:
-    """Parse values like -5m or +1h into datetime values"""
-    period = date[-1].lower()
-    prefix = date[0]
-    value = int(date[1:-1])
-    if period == "h":
+    """Parse values like _5m or +1h into datetime values"""
+    match = _DELTA_RE.fullmatch(date)
+    if match is None:
+        raise ValueError(f"Can only parse hour or minute deltas not {date}")
+    value = int(match["value"])
+    if match["unit"] in ("h", "H"):
         delta = timedelta(hours=value)
-    elif period == "m":
-        delta = timedelta(minutes=value)
     else:
-        raise ValueError(f"Can only parse hour or minute deltas not {prefix}")
-    if prefix == "_":
+        delta = timedelta(minutes=value)
+    if match["sign"] == "_":
         return datetime.now() - delta
     else:
         return datetime.now() + delta
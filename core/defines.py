@@ -5,12 +5,46 @@ USR_DIR = os.path.expanduser("~")
 APPLICATION_DIRECTORY = f"{USR_DIR}/.timeclok/"
 DATABASE_FILE = f"{APPLICATION_DIRECTORY}/time-clok.db"
 CREDENTIALS_FILE = f"{APPLICATION_DIRECTORY}/credentials.json"
+SOCKET_FILE = f"{APPLICATION_DIRECTORY}/clok.sock"
+
+# Users
+# time is recorded for the user given with --user, then $CLOK_USER, then the login name
+USER_ENVIRONMENT_VARIABLE = "CLOK_USER"
+# used when the login name can't be determined
+DEFAULT_USER = "default"
+# every user starts out with a job of this name
+DEFAULT_JOB = "default"
+
+# SQLite connection tuning, applied to every new connection. Each pragma can be changed
+# with an environment variable named CLOK_SQLITE_<PRAGMA>, an empty value leaves the
+# sqlite default in place. e.g. CLOK_SQLITE_JOURNAL_MODE=delete
+SQLITE_PRAGMA_DEFAULTS = {
+    # readers don't block the writer and the writer doesn't block readers
+    "journal_mode": "wal",
+    # in wal mode normal is safe against corruption and skips most fsyncs
+    "synchronous": "normal",
+    # negative values are in KiB, 16 MB
+    "cache_size": "-16000",
+    "mmap_size": str(256 * 1024 * 1024),
+    "temp_store": "memory",
+    # milliseconds to wait for a lock before failing with "database is locked"
+    "busy_timeout": "5000",
+}
+SQLITE_PRAGMAS = {
+    name: os.environ.get(f"CLOK_SQLITE_{name.upper()}", default)
+    for name, default in SQLITE_PRAGMA_DEFAULTS.items()
+}
 
 # Date Defines
 SECONDS_PER_HOUR = 60.0 * 60.0
 
 DATE_FORMAT = "%Y-%m-%d"
+# number of distinct date and time strings whose parsed value is kept
+DATE_PARSE_CACHE_SIZE = 4096
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# printf style format matching SqlAlchemy's storage format for sqlite DateTime columns
+DB_DATETIME_FORMAT = "%04d-%02d-%02d %02d:%02d:%02d.%06d"
+# the time forms accepted on the command line, parsed by core.date_utils
 TIME_FORMATS = (
     "%I:%M:%S%p",  # 07:45:00PM
     "%-I:%M:%S%p",  # 7:45:00PM
@@ -23,3 +57,39 @@ TIME_FORMATS = (
 DATE_TIME_FORMATS = []
 for fmt in TIME_FORMATS:
     DATE_TIME_FORMATS.append(f"{DATE_FORMAT} {fmt}")
+
+# Journal search
+# number of results printed by clok journal --search
+JOURNAL_SEARCH_LIMIT = 20
+# number of words around the matches shown for each result
+JOURNAL_SNIPPET_TOKENS = 12
+
+# Import/Export Defines
+# number of rows converted and written per executemany batch
+TRANSFER_CHUNK_SIZE = 10000
+# number of characters read from a dump file at a time while streaming
+TRANSFER_READ_SIZE = 1 << 16
+
+# Backup Defines
+# number of database pages copied per step of a backup or restore, locks are released
+# between steps so other connections can write while a backup runs
+BACKUP_PAGES = 1024
+# number of bytes compressed or decompressed at a time
+BACKUP_COPY_SIZE = 1 << 20
+# gzip level of compressed backups, higher levels are several times slower for a few
+# percent smaller files
+BACKUP_COMPRESS_LEVEL = 1
+
+# Profiling Defines
+# profile every command, e.g. CLOK_PROFILE=1, or name the extra profilers to run as
+# well, e.g. CLOK_PROFILE=cprofile,tracemalloc
+PROFILE_ENVIRONMENT_VARIABLE = "CLOK_PROFILE"
+PROFILE_DIRECTORY = f"{APPLICATION_DIRECTORY}profiles"
+# number of allocation sites listed in the tracemalloc report
+PROFILE_TRACEMALLOC_LINES = 25
+
+# Audit Defines
+# clok audit reports records still open after this many hours
+AUDIT_OPEN_HOURS = 12.0
+# and breaks longer than this many minutes between two records of the same day
+AUDIT_GAP_MINUTES = 60.0
@@ -0,0 +1,248 @@
+"""This file contains the startup optimized entry point used by clok.sh. Commands are
+forwarded to the resident daemon when one is running. Otherwise the most common
+commands, ``in`` and ``out`` with an optional message and ``status``, are handled here
+with the standard library's sqlite3 module, so they don't pay for importing typer,
+SqlAlchemy and the models. Anything else, including any case that needs a prompt or a
+schema upgrade, falls through to the full command line interface in clok.py.
+
+This module must stay cheap to import: standard library, core.defines, core.date_utils,
+core.sqlite_utils, core.users and the daemon client only. The sql here has to write
+exactly what the models would. """
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+
+from core.date_utils import (
+    format_hours,
+    get_date_key,
+    get_month,
+    get_week,
+    to_db_datetime,
+)
+from core.defines import (
+    DATABASE_FILE,
+    PROFILE_ENVIRONMENT_VARIABLE,
+    SECONDS_PER_HOUR,
+    SQLITE_PRAGMAS,
+)
+from core.sqlite_utils import apply_pragmas
+from core.users import current_user, reset_user, set_user, split_user_option
+
+# out asks for confirmation past this many hours, which the full cli handles
+CONFIRM_OUT_HOURS = 12
+
+# the sql shared with the async api in core.aio
+STATE_SQL = (
+    "SELECT s.id, s.job_id, s.clok_id, s.user_id FROM time_clok_state s "
+    "JOIN time_clok_users u ON u.id = s.user_id WHERE u.name = ?"
+)
+RECORD_SQL = "SELECT id, time_in, time_out FROM time_clok WHERE id = ? AND user_id = ?"
+LAST_RECORD_SQL = (
+    "SELECT id, time_in, time_out FROM time_clok WHERE user_id = ? AND job_id = ? "
+    "ORDER BY time_in DESC LIMIT 1"
+)
+INSERT_CLOK_SQL = (
+    "INSERT INTO time_clok "
+    "(job_id, date_key, week_key, month_key, time_in, time_out, time_span, user_id) "
+    "VALUES (?, ?, ?, ?, ?, NULL, 0, ?)"
+)
+SET_STATE_CLOK_SQL = "UPDATE time_clok_state SET clok_id = ? WHERE id = ?"
+CLOCK_OUT_SQL = "UPDATE time_clok SET time_out = ?, time_span = ? WHERE id = ?"
+INSERT_JOURNAL_SQL = (
+    "INSERT INTO time_clok_journal (created_at, clok_id, time, entry, user_id) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+def clok_values(user_id: int, job_id: int, when: datetime) -> tuple:
+    """Parameters of INSERT_CLOK_SQL for a record clocked in at ``when``."""
+    return (
+        job_id,
+        get_date_key(when),
+        get_week(when),
+        get_month(when),
+        to_db_datetime(when),
+        user_id,
+    )
+
+
+def clock_out_values(clok_id: int, time_in: datetime, when: datetime) -> tuple:
+    """Parameters of CLOCK_OUT_SQL."""
+    return to_db_datetime(when), (when - time_in).total_seconds(), clok_id
+
+
+def journal_values(user_id: int, clok_id: int, msg: str, when: datetime) -> tuple:
+    """Parameters of INSERT_JOURNAL_SQL."""
+    return (
+        to_db_datetime(datetime.utcnow()),
+        clok_id,
+        to_db_datetime(when),
+        msg,
+        user_id,
+    )
+
+
+class Fallback(Exception):
+    """Raised when a command has to be handled by the full command line interface."""
+
+
+def _parse_message(args: List[str]) -> Union[str, None]:
+    """Parse the arguments of in/out, only a journal message is supported here."""
+    if not args:
+        return None
+    if len(args) == 2 and args[0] == "--m":
+        return args[1]
+    if len(args) == 1 and args[0].startswith("--m="):
+        return args[0][len("--m=") :]
+    raise Fallback()
+
+
+def _state(connection) -> Tuple[int, int, Optional[int], int]:
+    """Return the (id, job_id, clok_id, user_id) of the current user's state row. Users
+    that don't have one yet are registered by the full cli."""
+    row = connection.execute(STATE_SQL, (current_user(),)).fetchone()
+    if row is None:
+        raise Fallback()
+    return row
+
+
+def _last_record(connection, user_id: int, job_id: int, clok_id: Optional[int]):
+    """Same as Clok.get_last_record, returns (id, time_in, time_out) or None."""
+    if clok_id is not None:
+        return connection.execute(RECORD_SQL, (clok_id, user_id)).fetchone()
+    return connection.execute(LAST_RECORD_SQL, (user_id, job_id)).fetchone()
+
+
+def _add_journal(connection, user_id: int, clok_id: int, msg: str, when: datetime):
+    connection.execute(INSERT_JOURNAL_SQL, journal_values(user_id, clok_id, msg, when))
+
+
+def clock_in(connection, when: datetime, msg: str = None) -> int:
+    state_id, job_id, _, user_id = _state(connection)
+    print(f"Clocking you in at {when:%Y-%m-%d %H:%M:%S}")
+    with connection:
+        clok_id = connection.execute(
+            INSERT_CLOK_SQL, clok_values(user_id, job_id, when)
+        ).lastrowid
+        connection.execute(SET_STATE_CLOK_SQL, (clok_id, state_id))
+        if msg is not None:
+            _add_journal(connection, user_id, clok_id, msg, when)
+    return clok_id
+
+
+def clock_out(connection, when: datetime, msg: str = None) -> int:
+    _, job_id, clok_id, user_id = _state(connection)
+    record = _last_record(connection, user_id, job_id, clok_id)
+    if record is None:
+        raise Fallback()
+    clok_id, time_in, _ = record
+    time_in = datetime.fromisoformat(time_in)
+    if (when - time_in).total_seconds() / SECONDS_PER_HOUR > CONFIRM_OUT_HOURS:
+        raise Fallback()
+    print(f"Clocking you out at {when:%Y-%m-%d %H:%M:%S}")
+    with connection:
+        connection.execute(CLOCK_OUT_SQL, clock_out_values(clok_id, time_in, when))
+        if msg is not None:
+            _add_journal(connection, user_id, clok_id, msg, when)
+    return clok_id
+
+
+def status_message(
+    job_name: str, time_in: Optional[datetime], time_out: Optional[datetime]
+) -> str:
+    if time_in is None or time_out is not None:
+        return f"Clocked out of '{job_name}'"
+    hours = (datetime.now() - time_in).total_seconds() / SECONDS_PER_HOUR
+    return (
+        f"Clocked in to '{job_name}' since {time_in:%Y-%m-%d %H:%M:%S} "
+        f"({format_hours(hours)})"
+    )
+
+
+def status(connection) -> str:
+    _, job_id, clok_id, user_id = _state(connection)
+    (job_name,) = connection.execute(
+        "SELECT name FROM time_clok_jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    record = _last_record(connection, user_id, job_id, clok_id)
+    if record is None:
+        return status_message(job_name, None, None)
+    _, time_in, time_out = record
+    return status_message(
+        job_name,
+        datetime.fromisoformat(time_in),
+        time_out and datetime.fromisoformat(time_out),
+    )
+
+
+def connect(path: str = DATABASE_FILE):
+    """Open the database, falling back when it is missing or needs an upgrade."""
+    if not os.path.isfile(path):
+        raise Fallback()
+    from core.migrations import MIGRATIONS
+
+    connection = sqlite3.connect(path)
+    apply_pragmas(connection, SQLITE_PRAGMAS)
+    (version,) = connection.execute("PRAGMA user_version").fetchone()
+    if version != len(MIGRATIONS):
+        connection.close()
+        raise Fallback()
+    return connection
+
+
+def run(args: List[str]) -> bool:
+    """Run a command on the fast path, returns False if it has to be handled by the full
+    command line interface. Nothing is written before that decision is made."""
+    user, args = split_user_option(args)
+    if not args or args[0] not in ("in", "out", "status"):
+        return False
+    command, args = args[0], args[1:]
+    token = set_user(user) if user is not None else None
+    try:
+        if command == "status":
+            if args:
+                raise Fallback()
+        else:
+            msg = _parse_message(args)
+        connection = connect()
+        try:
+            if command == "status":
+                print(status(connection))
+            elif command == "in":
+                clock_in(connection, datetime.now(), msg)
+            else:
+                clock_out(connection, datetime.now(), msg)
+        finally:
+            connection.close()
+    except Fallback:
+        return False
+    finally:
+        if token is not None:
+            reset_user(token)
+    return True
+
+
+def main():
+    from core.daemon import forward
+
+    # profiles are taken by the full cli, of every command
+    profiling = False
+    if os.environ.get(PROFILE_ENVIRONMENT_VARIABLE):
+        from core.profiling import parse_profilers
+
+        profiling = (
+            parse_profilers(os.environ[PROFILE_ENVIRONMENT_VARIABLE]) is not None
+        )
+    code = None if profiling else forward(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+    if profiling or not run(sys.argv[1:]):
+        from clok import main as clok_main
+
+        clok_main()
+
+
+if __name__ == "__main__":
+    main()
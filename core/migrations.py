@@ -0,0 +1,427 @@
+"""This file contains the versioned schema migrations that upgrade existing database
+files in place. ``PRAGMA user_version`` stores how many migrations have been applied to
+a database, and ``migrate`` runs the ones that are missing, in order, on startup.
+
+Migrations are plain sql so they don't depend on the current state of the models, and
+they must be idempotent: a fresh database created from the models runs all of them and a
+failed upgrade is simply retried on the next start. Only ever append to MIGRATIONS. """
+from typing import TYPE_CHECKING, Callable, List
+
+if TYPE_CHECKING:
+    # only needed for annotations, the fast path imports this module without SqlAlchemy
+    from sqlalchemy.engine import Connection, Engine
+
+MIGRATIONS: List[Callable[["Connection"], None]] = []
+
+
+def migration(func: Callable[["Connection"], None]):
+    """Register a migration, the version of a database is the number of migrations that
+    have been applied to it."""
+    MIGRATIONS.append(func)
+    return func
+
+
+def get_version(connection: "Connection") -> int:
+    return connection.execute("PRAGMA user_version").scalar()
+
+
+def migrate(engine: "Engine", verbose=False) -> int:
+    """Apply every migration newer than the database's version and return the number of
+    migrations that were applied."""
+    with engine.connect() as connection:
+        version = get_version(connection)
+        pending = MIGRATIONS[version:]
+        if pending and verbose:
+            print(f"Upgrading TimeClok database to version {len(MIGRATIONS)}.....")
+        for number, func in enumerate(pending, version + 1):
+            with connection.begin():
+                func(connection)
+                connection.execute(f"PRAGMA user_version = {number}")
+    return len(pending)
+
+
+@migration
+def add_time_clok_indexes(connection: "Connection"):
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_job_date "
+        "ON time_clok (job_id, date_key)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_job_week "
+        "ON time_clok (job_id, week_key)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_job_month "
+        "ON time_clok (job_id, month_key)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_job_time_in "
+        "ON time_clok (job_id, time_in)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_date ON time_clok (date_key)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_journal_clok "
+        "ON time_clok_journal (clok_id)"
+    )
+    connection.execute("ANALYZE")
+
+
+@migration
+def qualify_week_and_month_keys(connection: "Connection"):
+    # week_key and month_key used to be bare week (0-53) and month (1-12) numbers,
+    # prefix them with the year of the record's date_key, week 41 of 2020 is 202041
+    connection.execute(
+        "UPDATE time_clok SET week_key = (date_key / 10000) * 100 + week_key "
+        "WHERE week_key < 100 AND date_key IS NOT NULL"
+    )
+    connection.execute(
+        "UPDATE time_clok SET month_key = (date_key / 10000) * 100 + month_key "
+        "WHERE month_key < 100 AND date_key IS NOT NULL"
+    )
+
+
+def _columns(connection: "Connection", table: str) -> List[str]:
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def _rebuild_table(connection: "Connection", table: str, create_sql: str, owner: int):
+    """Recreate a table from ``create_sql`` and copy its rows, adding a user_id column
+    set to ``owner``. sqlite can't change the constraints of an existing table."""
+    columns = ", ".join(_columns(connection, table))
+    connection.execute(f"DROP TABLE IF EXISTS {table}_new")
+    connection.execute(create_sql.format(table=f"{table}_new"))
+    connection.execute(
+        f"INSERT INTO {table}_new ({columns}, user_id) "
+        f"SELECT {columns}, ? FROM {table}",
+        (owner,),
+    )
+    connection.execute(f"DROP TABLE {table}")
+    connection.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+_USER_TABLES = {
+    "time_clok_jobs": """CREATE TABLE {table} (
+        id INTEGER NOT NULL,
+        name VARCHAR(64),
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT "natural" UNIQUE (user_id, name),
+        FOREIGN KEY(user_id) REFERENCES time_clok_users (id)
+    )""",
+    "time_clok": """CREATE TABLE {table} (
+        id INTEGER NOT NULL,
+        job_id INTEGER NOT NULL,
+        date_key INTEGER,
+        week_key INTEGER,
+        month_key INTEGER,
+        time_in DATETIME,
+        time_out DATETIME,
+        time_span INTEGER,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT "natural" UNIQUE (user_id, time_in, time_out),
+        FOREIGN KEY(job_id) REFERENCES time_clok_jobs (id),
+        FOREIGN KEY(user_id) REFERENCES time_clok_users (id)
+    )""",
+    "time_clok_state": """CREATE TABLE {table} (
+        id INTEGER NOT NULL,
+        job_id INTEGER,
+        clok_id INTEGER,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(job_id) REFERENCES time_clok_jobs (id),
+        FOREIGN KEY(clok_id) REFERENCES time_clok (id),
+        UNIQUE (user_id),
+        FOREIGN KEY(user_id) REFERENCES time_clok_users (id)
+    )""",
+    "time_clok_journal": """CREATE TABLE {table} (
+        created_at DATETIME,
+        modified_at DATETIME,
+        id INTEGER NOT NULL,
+        clok_id INTEGER NOT NULL,
+        time DATETIME,
+        entry TEXT,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT "natural" UNIQUE (id, time),
+        FOREIGN KEY(clok_id) REFERENCES time_clok (id),
+        FOREIGN KEY(user_id) REFERENCES time_clok_users (id)
+    )""",
+}
+
+
+@migration
+def partition_by_user(connection: "Connection"):
+    # every row gets a user, the records of a database created before users existed
+    # belong to whoever upgrades it. Natural keys become unique per user.
+    from core.users import current_user
+
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS time_clok_users ("
+        "id INTEGER NOT NULL, name VARCHAR(64), PRIMARY KEY (id), UNIQUE (name))"
+    )
+    if "user_id" not in _columns(connection, "time_clok"):
+        user = current_user()
+        connection.execute(
+            "INSERT OR IGNORE INTO time_clok_users (name) VALUES (?)", (user,)
+        )
+        owner = connection.execute(
+            "SELECT id FROM time_clok_users WHERE name = ?", (user,)
+        ).scalar()
+        for table, create_sql in _USER_TABLES.items():
+            _rebuild_table(connection, table, create_sql, owner)
+    # rebuilt tables lost their indexes, the ones without a user are replaced
+    for name in ("date", "week", "month", "time_in"):
+        connection.execute(f"DROP INDEX IF EXISTS ix_time_clok_job_{name}")
+    connection.execute("DROP INDEX IF EXISTS ix_time_clok_date")
+    for name, column in (
+        ("date", "date_key"),
+        ("week", "week_key"),
+        ("month", "month_key"),
+        ("time_in", "time_in"),
+    ):
+        connection.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_time_clok_user_job_{name} "
+            f"ON time_clok (user_id, job_id, {column})"
+        )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_user_date "
+        "ON time_clok (user_id, date_key)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_journal_clok "
+        "ON time_clok_journal (clok_id)"
+    )
+    connection.execute("ANALYZE")
+
+
+_ROLLUP_KEY = (
+    "user_id = {row}.user_id AND job_id = {row}.job_id AND date_key = {row}.date_key"
+)
+_ROLLUP_ADD = (
+    "INSERT INTO time_clok_daily_totals "
+    "(user_id, job_id, date_key, week_key, month_key, seconds, records) "
+    "SELECT {row}.user_id, {row}.job_id, {row}.date_key, {row}.week_key, "
+    "{row}.month_key, coalesce({row}.time_span, 0), 1 WHERE {row}.date_key IS NOT NULL "
+    "ON CONFLICT (user_id, job_id, date_key) DO UPDATE SET "
+    "week_key = excluded.week_key, month_key = excluded.month_key, "
+    "seconds = seconds + excluded.seconds, records = records + 1;"
+)
+_ROLLUP_SUBTRACT = (
+    "UPDATE time_clok_daily_totals SET "
+    "seconds = seconds - coalesce({row}.time_span, 0), records = records - 1 "
+    f"WHERE {_ROLLUP_KEY};"
+    f"DELETE FROM time_clok_daily_totals WHERE {_ROLLUP_KEY} AND records <= 0;"
+)
+ROLLUP_TRIGGERS = {
+    "time_clok_rollup_insert": "AFTER INSERT ON time_clok BEGIN "
+    + _ROLLUP_ADD.format(row="NEW")
+    + " END",
+    "time_clok_rollup_delete": "AFTER DELETE ON time_clok BEGIN "
+    + _ROLLUP_SUBTRACT.format(row="OLD")
+    + " END",
+    "time_clok_rollup_update": "AFTER UPDATE OF "
+    "user_id, job_id, date_key, week_key, month_key, time_span ON time_clok BEGIN "
+    + _ROLLUP_SUBTRACT.format(row="OLD")
+    + _ROLLUP_ADD.format(row="NEW")
+    + " END",
+}
+# the daily totals computed from the records
+ROLLUP_SELECT_SQL = (
+    "SELECT user_id, job_id, date_key, max(week_key), max(month_key), "
+    "coalesce(sum(time_span), 0), count(*) FROM time_clok "
+    "WHERE date_key IS NOT NULL GROUP BY user_id, job_id, date_key"
+)
+ROLLUP_REBUILD_SQL = (
+    "DELETE FROM time_clok_daily_totals",
+    "INSERT INTO time_clok_daily_totals "
+    "(user_id, job_id, date_key, week_key, month_key, seconds, records) "
+    + ROLLUP_SELECT_SQL,
+)
+
+
+@migration
+def add_daily_totals(connection: "Connection"):
+    # seconds and records per user, job and day for the period reports. Triggers keep
+    # the totals in the same transaction as every write to time_clok, whether it comes
+    # from the models, the fast path, the asyncio api or an import. Rebuilding
+    # time_clok drops its triggers, a later migration that does must recreate them.
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS time_clok_daily_totals (
+            user_id INTEGER NOT NULL,
+            job_id INTEGER NOT NULL,
+            date_key INTEGER NOT NULL,
+            week_key INTEGER,
+            month_key INTEGER,
+            seconds INTEGER NOT NULL,
+            records INTEGER NOT NULL,
+            PRIMARY KEY (user_id, job_id, date_key)
+        )"""
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_daily_totals_week "
+        "ON time_clok_daily_totals (user_id, job_id, week_key)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_time_clok_daily_totals_month "
+        "ON time_clok_daily_totals (user_id, job_id, month_key)"
+    )
+    for name, body in ROLLUP_TRIGGERS.items():
+        connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+        connection.execute(f"CREATE TRIGGER {name} {body}")
+    for statement in ROLLUP_REBUILD_SQL:
+        connection.execute(statement)
+
+
+JOURNAL_FTS_TABLE = "time_clok_journal_fts"
+_JOURNAL_FTS_DELETE = (
+    f"INSERT INTO {JOURNAL_FTS_TABLE} ({JOURNAL_FTS_TABLE}, rowid, entry) "
+    "VALUES ('delete', OLD.id, OLD.entry);"
+)
+_JOURNAL_FTS_INSERT = (
+    f"INSERT INTO {JOURNAL_FTS_TABLE} (rowid, entry) VALUES (NEW.id, NEW.entry);"
+)
+JOURNAL_FTS_TRIGGERS = {
+    "time_clok_journal_fts_insert": "AFTER INSERT ON time_clok_journal BEGIN "
+    + _JOURNAL_FTS_INSERT
+    + " END",
+    "time_clok_journal_fts_delete": "AFTER DELETE ON time_clok_journal BEGIN "
+    + _JOURNAL_FTS_DELETE
+    + " END",
+    "time_clok_journal_fts_update": "AFTER UPDATE OF id, entry ON time_clok_journal "
+    "BEGIN " + _JOURNAL_FTS_DELETE + _JOURNAL_FTS_INSERT + " END",
+}
+
+
+def has_fts5(connection: "Connection") -> bool:
+    return bool(
+        connection.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar()
+    )
+
+
+@migration
+def add_journal_search(connection: "Connection"):
+    # an external content fts5 index of the journal entries, it stores only the index
+    # and reads the text from time_clok_journal. Triggers keep it in sync with every
+    # write. sqlite builds without fts5 skip it and journal search is unavailable.
+    if not has_fts5(connection):
+        return
+    connection.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {JOURNAL_FTS_TABLE} USING fts5("
+        "entry, content='time_clok_journal', content_rowid='id')"
+    )
+    for name, body in JOURNAL_FTS_TRIGGERS.items():
+        connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+        connection.execute(f"CREATE TRIGGER {name} {body}")
+    connection.execute(
+        f"INSERT INTO {JOURNAL_FTS_TABLE} ({JOURNAL_FTS_TABLE}) VALUES ('rebuild')"
+    )
+
+
+CHANGE_SEQUENCE_TABLE = "time_clok_sequence"
+TOMBSTONE_TABLE = "time_clok_tombstones"
+# the tables whose changes are tracked and the columns whose updates are changes. A
+# migration that adds a column to one of them must recreate its triggers.
+TRACKED_TABLES = {
+    "time_clok_jobs": ("id", "name", "user_id"),
+    "time_clok_state": ("id", "job_id", "clok_id", "user_id"),
+    "time_clok": (
+        "id",
+        "job_id",
+        "date_key",
+        "week_key",
+        "month_key",
+        "time_in",
+        "time_out",
+        "time_span",
+        "user_id",
+    ),
+    "time_clok_journal": (
+        "created_at",
+        "modified_at",
+        "id",
+        "clok_id",
+        "time",
+        "entry",
+        "user_id",
+    ),
+}
+_NEXT_CHANGE = f"UPDATE {CHANGE_SEQUENCE_TABLE} SET value = value + 1 WHERE id = 1;"
+_CHANGE_SEQ = f"(SELECT value FROM {CHANGE_SEQUENCE_TABLE} WHERE id = 1)"
+_SET_CHANGE_SEQ = (
+    "UPDATE {table} SET change_seq = " + _CHANGE_SEQ + " WHERE id = NEW.id;"
+)
+_TOMBSTONE = (
+    f"INSERT OR REPLACE INTO {TOMBSTONE_TABLE} (table_name, row_id, change_seq) "
+    f"SELECT '{{table}}', OLD.id, {_CHANGE_SEQ} WHERE {{where}};"
+)
+
+
+def _change_triggers(table: str, columns) -> dict:
+    set_change_seq = _SET_CHANGE_SEQ.format(table=table)
+    return {
+        f"{table}_changes_insert": f"AFTER INSERT ON {table} BEGIN "
+        + _NEXT_CHANGE
+        + set_change_seq
+        + f"DELETE FROM {TOMBSTONE_TABLE} "
+        f"WHERE table_name = '{table}' AND row_id = NEW.id; END",
+        f"{table}_changes_update": f"AFTER UPDATE OF {', '.join(columns)} ON {table} "
+        "BEGIN "
+        + _NEXT_CHANGE
+        + set_change_seq
+        + _TOMBSTONE.format(table=table, where="OLD.id IS NOT NEW.id")
+        + " END",
+        f"{table}_changes_delete": f"AFTER DELETE ON {table} BEGIN "
+        + _NEXT_CHANGE
+        + _TOMBSTONE.format(table=table, where="1")
+        + " END",
+    }
+
+
+CHANGE_TRIGGERS = {
+    name: body
+    for table, columns in TRACKED_TABLES.items()
+    for name, body in _change_triggers(table, columns).items()
+}
+
+
+@migration
+def track_changes(connection: "Connection"):
+    # every insert and update of a tracked row takes the next value of a database wide
+    # sequence as its change_seq, and every delete leaves a tombstone with one, so
+    # ``dump --since`` can export what changed after any earlier marker. Rows that
+    # existed before get change 1, the first marker handed out.
+    connection.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHANGE_SEQUENCE_TABLE} ("
+        "id INTEGER NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (id))"
+    )
+    connection.execute(
+        f"INSERT OR IGNORE INTO {CHANGE_SEQUENCE_TABLE} (id, value) VALUES (1, 1)"
+    )
+    connection.execute(
+        f"""CREATE TABLE IF NOT EXISTS {TOMBSTONE_TABLE} (
+            table_name VARCHAR(64) NOT NULL,
+            row_id INTEGER NOT NULL,
+            change_seq INTEGER NOT NULL,
+            PRIMARY KEY (table_name, row_id)
+        )"""
+    )
+    connection.execute(
+        f"CREATE INDEX IF NOT EXISTS ix_{TOMBSTONE_TABLE}_change_seq "
+        f"ON {TOMBSTONE_TABLE} (change_seq)"
+    )
+    for table in TRACKED_TABLES:
+        if "change_seq" not in _columns(connection, table):
+            connection.execute(
+                f"ALTER TABLE {table} "
+                "ADD COLUMN change_seq INTEGER NOT NULL DEFAULT '0'"
+            )
+        connection.execute(f"UPDATE {table} SET change_seq = 1 WHERE change_seq = 0")
+        connection.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_change_seq ON {table} (change_seq)"
+        )
+    for name, body in CHANGE_TRIGGERS.items():
+        connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+        connection.execute(f"CREATE TRIGGER {name} {body}")
@@ -2,125 +2,308 @@
 schema. These basically allow us to more easily query and insert into our database
 without having to play with sql directly unless we want to. """
 
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Union
+from typing import Iterable, Tuple, Union
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    TEXT,
+    UniqueConstraint,
+    and_,
+    cast,
+    column,
+    desc,
+    event,
+    func,
+    literal_column,
+    or_,
+    select,
+    table,
+    String,
+)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import Query, Session, relationship, selectinload
+from sqlalchemy.orm.exc import NoResultFound
+
+from core.database import Model, SurrogatePK, Tracked, Versioned, reference_col
+from core.defines import (
+    DEFAULT_JOB,
+    JOURNAL_SEARCH_LIMIT,
+    JOURNAL_SNIPPET_TOKENS,
+    SECONDS_PER_HOUR,
+    TRANSFER_CHUNK_SIZE,
+)
+from core.migrations import (
+    CHANGE_SEQUENCE_TABLE,
+    JOURNAL_FTS_TABLE,
+    ROLLUP_REBUILD_SQL,
+    ROLLUP_SELECT_SQL,
+    TOMBSTONE_TABLE,
+)
+from core.date_utils import (
+    get_date,
+    get_date_key,
+    get_month,
+    get_month_key,
+    get_week,
+    get_week_key,
+    parse_date,
+)
+from core.users import current_user
+
+
+PERIODS = ("day", "week", "month", "year")
 
-from sqlalchemy import Column, DateTime, Integer, TEXT, UniqueConstraint, desc, String
-from sqlalchemy.orm import relationship
 
-from core.database import Model, SurrogatePK, Tracked, reference_col
-from core.defines import SECONDS_PER_HOUR
-from core.date_utils import get_date_key, get_month, get_week, parse_date
+class SpanQuery:
+    @classmethod
+    def period_filter(cls, period: str, key: Union[datetime, int, str] = None):
+        """Return a filter clause selecting the rows of one period. The key defaults to
+        the current day/week/month/year."""
+        if period == "day":
+            return cls.date_key == get_date_key(key)
+        elif period == "week":
+            return cls.week_key == get_week_key(key)
+        elif period == "month":
+            return cls.month_key == get_month_key(key)
+        elif period == "year":
+            year = datetime.now().year if key is None else int(key)
+            return cls.date_key.between(year * 10000, year * 10000 + 9999)
+        raise ValueError(f"period must be one of {PERIODS} not {period}")
 
+    @classmethod
+    def period_column(cls, period: str):
+        """Return the column expression that identifies the period of a row."""
+        if period == "day":
+            return cls.date_key
+        elif period == "week":
+            return cls.week_key
+        elif period == "month":
+            return cls.month_key
+        elif period == "year":
+            return cls.date_key / 10000
+        raise ValueError(f"period must be one of {PERIODS} not {period}")
 
-class SpanQuery:
     @classmethod
-    def get_by_date_key(cls, key: Union[datetime, int, str] = None, all_jobs=False):
-        if key is None:
-            dk = get_date_key()
-        else:
-            dk = get_date_key(key)
-        if all_jobs:
-            return [i for i in (cls.query().filter(cls.date_key == dk).all())]
-        else:
-            return [
-                i
-                for i in (
-                    cls.query()
-                    .filter(cls.date_key == dk)
-                    .filter(cls.job_id == State.get().job.id)
-                    .all()
-                )
-            ]
-
-    @classmethod
-    def get_by_month_key(cls, key: Union[int, str] = None, all_jobs=False):
-        if key is None:
-            key = get_month()
-        if all_jobs:
-            return [i for i in (cls.query().filter(cls.month_key == int(key)).all())]
-        else:
-            return [
-                i
-                for i in (
-                    cls.query()
-                    .filter(cls.month_key == int(key))
-                    .filter(cls.job_id == State.get().job.id)
-                    .all()
-                )
-            ]
-
-    @classmethod
-    def get_by_week_key(cls, key: Union[int, str] = None, all_jobs=False):
-        if key is None:
-            key = get_week()
+    def scope_filter(cls, all_jobs=False):
+        """Return a filter clause selecting the current user's rows, of the current job
+        only unless ``all_jobs`` is set."""
         if all_jobs:
-            return [i for i in (cls.query().filter(cls.week_key == int(key)).all())]
-        else:
-            return [
-                i
-                for i in (
-                    cls.query()
-                    .filter(cls.week_key == int(key))
-                    .filter(cls.job_id == State.get().job.id)
-                    .all()
-                )
-            ]
+            return cls.user_id == State.get_user_id()
+        return and_(
+            cls.user_id == State.get_user_id(), cls.job_id == State.get_job_id()
+        )
+
+    @classmethod
+    def get_by_period(cls, period: str, key=None, all_jobs=False, options=()):
+        """Return the rows of a period. Relationships are loaded lazily, pass loader
+        ``options`` such as selectinload to load the ones the caller is going to use."""
+        query = cls.query().options(*options).filter(cls.period_filter(period, key))
+        return query.filter(cls.scope_filter(all_jobs)).all()
+
+    @classmethod
+    def get_by_date_key(
+        cls, key: Union[datetime, int, str] = None, all_jobs=False, options=()
+    ):
+        return cls.get_by_period("day", key, all_jobs=all_jobs, options=options)
+
+    @classmethod
+    def get_by_month_key(cls, key: Union[int, str] = None, all_jobs=False, options=()):
+        return cls.get_by_period("month", key, all_jobs=all_jobs, options=options)
+
+    @classmethod
+    def get_by_week_key(cls, key: Union[int, str] = None, all_jobs=False, options=()):
+        return cls.get_by_period("week", key, all_jobs=all_jobs, options=options)
 
     @classmethod
     def dump(cls):
         return [i.to_dict for i in cls.query().all()]
 
 
-class State(Model, SurrogatePK):
+_STATE_CACHE_KEY = "clok_state"
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_state_cache(session):
+    session.info.pop(_STATE_CACHE_KEY, None)
+
+
+class User(Model, SurrogatePK):
+    __tablename__ = "time_clok_users"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(64), unique=True)
+
+    def __init__(self, name: str, id: int = None):
+        if id is not None:
+            self.id = id
+        self.name = name.lower()
+
+    @property
+    def to_dict(self):
+        return dict(id=self.id, name=self.name)
+
+    @classmethod
+    def register(cls, name: str) -> Tuple[int, int, int, None]:
+        """Create a user with a default job and a state row, returns the (user_id,
+        state_id, job_id, clok_id) of the new state."""
+        with cls.unit_of_work() as session:
+            user = cls(name=name)
+            session.add(user)
+            session.flush()
+            job = Job(name=DEFAULT_JOB, user_id=user.id)
+            session.add(job)
+            session.flush()
+            state = State(user_id=user.id, job_id=job.id)
+            session.add(state)
+            session.flush()
+        return user.id, state.id, job.id, None
+
+
+class Owned:
+    """Mixin for the tables that are partitioned by user. Records of other users can't
+    be looked up or deleted by id, rows inserted without a user belong to the current
+    one."""
+
+    @declared_attr
+    def user_id(cls):
+        return reference_col("time_clok_users", default=lambda: State.get_user_id())
+
+    @classmethod
+    def owned(cls) -> Query:
+        """Query the current user's records."""
+        return cls.query().filter(cls.user_id == State.get_user_id())
+
+    @classmethod
+    def get_by_id(cls, record_id):
+        record = super().get_by_id(record_id)
+        if record is not None and record.user_id == State.get_user_id():
+            return record
+        return None
+
+    @classmethod
+    def delete_by_id(cls, record_id):
+        if cls.get_by_id(record_id) is not None:
+            super().delete_by_id(record_id)
+
+
+class State(Model, Owned, SurrogatePK, Versioned):
     __tablename__ = "time_clok_state"
     job_id = reference_col("time_clok_jobs", default=None, nullable=True)
     # save the current clok in to state
     clok_id = reference_col("time_clok", default=None, nullable=True)
 
-    clok = relationship("Clok", lazy="joined")
-    job = relationship("Job", lazy="joined")
+    clok = relationship("Clok")
+    job = relationship("Job")
+
+    @declared_attr
+    def user_id(cls):
+        # every user has exactly one state row
+        return reference_col("time_clok_users", unique=True)
 
     @classmethod
     def get(cls):
-        return cls.query().one()
+        return cls.query().get(cls.current()[0])
+
+    @classmethod
+    def _current(cls) -> Tuple[str, int, int, int, int]:
+        user = current_user()
+        current = cls.db().info.get(_STATE_CACHE_KEY)
+        if current is None or current[0] != user:
+            row = (
+                cls.db()
+                .query(cls.user_id, cls.id, cls.job_id, cls.clok_id)
+                .join(User, User.id == cls.user_id)
+                .filter(User.name == user)
+                .one_or_none()
+            )
+            if row is None:
+                row = User.register(user)
+            current = cls._cache(user, *row)
+        return current
+
+    @classmethod
+    def current(cls) -> Tuple[int, int, int]:
+        """Return the (id, job_id, clok_id) of the current user's state row, which is
+        created the first time a user is seen. The ids are cached in the session so
+        that they are only queried once per session and user, the setters below keep
+        the cache up to date and a rollback clears it."""
+        return cls._current()[2:]
+
+    @classmethod
+    def get_user_id(cls) -> int:
+        return cls._current()[1]
+
+    @classmethod
+    def get_job_id(cls) -> int:
+        return cls._current()[3]
+
+    @classmethod
+    def get_clok_id(cls) -> Union[int, None]:
+        return cls._current()[4]
+
+    @classmethod
+    def _cache(cls, user, user_id, state_id, job_id, clok_id):
+        current = (user, user_id, state_id, job_id, clok_id)
+        cls.db().info[_STATE_CACHE_KEY] = current
+        return current
+
+    @classmethod
+    def invalidate(cls):
+        cls.db().info.pop(_STATE_CACHE_KEY, None)
+
+    @classmethod
+    def _write(cls, commit=True, **values):
+        user, user_id, state_id, job_id, clok_id = cls._current()
+        with cls.unit_of_work() if commit else nullcontext():
+            cls.query().filter(cls.id == state_id).update(values)
+        cls._cache(
+            user,
+            user_id,
+            state_id,
+            values.get("job_id", job_id),
+            values.get("clok_id", clok_id),
+        )
 
     @classmethod
     def set_clok(cls, clok: "Clok"):
-        s = cls.get()
-        s.clok = clok
-        s.save()
+        cls._write(clok_id=clok.id if clok is not None else None)
 
     @classmethod
     def set_job(cls, job: "Job"):
-        s = cls.get()
-        s.job = job
-        s.save()
+        cls._write(job_id=job.id)
 
     @classmethod
     def clear_clok(cls):
-        s = cls.get()
-        s.clok_id = None
-        s.save(0)
+        cls._write(commit=False, clok_id=None)
 
     @property
     def to_dict(self):
-        return dict(job_id=self.job_id, clok_id=self.clok_id, id=self.id)
+        return dict(
+            job_id=self.job_id, clok_id=self.clok_id, id=self.id, user_id=self.user_id
+        )
 
     @classmethod
     def dump(cls):
         return [i.to_dict for i in cls.query().all()]
 
 
-class Job(Model, SurrogatePK):
+class Job(Model, Owned, SurrogatePK, Versioned):
     __tablename__ = "time_clok_jobs"
+    # job names are unique per user
+    __table_args__ = (UniqueConstraint("user_id", "name", name="natural"),)
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(64), unique=True)
+    name = Column(String(64))
 
-    def __init__(self, name: str, id: int = None):
+    def __init__(self, name: str, id: int = None, user_id: int = None):
         if id is not None:
             self.id = id
         self.name = name.lower()
+        self.user_id = user_id if user_id is not None else State.get_user_id()
 
     @staticmethod
     def print_header():
@@ -133,14 +316,46 @@ class Job(Model, SurrogatePK):
     def to_dict(self):
         return dict(id=self.id, name=self.name)
 
+    @classmethod
+    def switch(cls, name: str, verbose=False) -> "Job":
+        """Make the job ``name`` the current one, clocking out of the open record of
+        the current job first, in one transaction. The current and the new job are
+        read with one query. Raises NoResultFound if there is no such job."""
+        name = name.lower()
+        job_id = State.get_job_id()
+        jobs = cls.owned().filter(or_(cls.name == name, cls.id == job_id)).all()
+        job = next((j for j in jobs if j.name == name), None)
+        if job is None:
+            raise NoResultFound(f"Job '{name}' not found")
+        with cls.unit_of_work():
+            c = Clok.get_last_record()
+            if c is not None and c.time_out is None:
+                if verbose:
+                    current = next(j for j in jobs if j.id == job_id)
+                    print(f"Clocking you out of '{current.name}' at {get_date()}")
+                Clok.clock_out()
+            if verbose:
+                print(f"Switching to job '{name}'")
+            State.set_job(job)
+        return job
+
     @classmethod
     def dump(cls):
         return [i.to_dict for i in cls.query().all()]
 
 
-class Clok(Model, SurrogatePK, SpanQuery):
+class Clok(Model, Owned, SurrogatePK, Versioned, SpanQuery):
     __tablename__ = "time_clok"
-    __table_args__ = (UniqueConstraint("time_in", "time_out", name="natural"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "time_in", "time_out", name="natural"),
+        # every SpanQuery filters on the user, a period key and (usually) the current
+        # job, and get_last_record sorts a job's records by time_in
+        Index("ix_time_clok_user_job_date", "user_id", "job_id", "date_key"),
+        Index("ix_time_clok_user_job_week", "user_id", "job_id", "week_key"),
+        Index("ix_time_clok_user_job_month", "user_id", "job_id", "month_key"),
+        Index("ix_time_clok_user_job_time_in", "user_id", "job_id", "time_in"),
+        Index("ix_time_clok_user_date", "user_id", "date_key"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     job_id = reference_col("time_clok_jobs")
     date_key = Column(Integer, default=get_date_key)
@@ -150,8 +365,10 @@ class Clok(Model, SurrogatePK, SpanQuery):
     time_out = Column(DateTime, default=None)
     time_span = Column(Integer, default=0)
 
-    journal_entries = relationship("Journal", lazy="joined")
-    job = relationship("Job", lazy="joined")
+    # nothing is loaded eagerly by default, queries that print the job or journals of
+    # many records ask for them with joinedload or selectinload
+    journal_entries = relationship("Journal", order_by="Journal.id")
+    job = relationship("Job")
 
     def __init__(
         self,
@@ -164,9 +381,11 @@ class Clok(Model, SurrogatePK, SpanQuery):
         time_out: datetime = None,
         time_span: int = None,
         journal_msg: str = None,
+        user_id: int = None,
         **kwargs,
     ):
         self.id = id
+        self.user_id = user_id if user_id is not None else State.get_user_id()
         self.date_key = date_key
         self.week_key = week_key
         self.month_key = month_key
@@ -179,7 +398,7 @@ class Clok(Model, SurrogatePK, SpanQuery):
         if job_id is not None:
             self.job_id = job_id
         else:
-            self.job_id = State.get().job.id
+            self.job_id = State.get_job_id()
 
     @property
     def to_dict(self):
@@ -192,9 +411,39 @@ class Clok(Model, SurrogatePK, SpanQuery):
             time_in=self.time_in,
             time_out=self.time_out,
             time_span=self.time_span,
+            user_id=self.user_id,
             journals=self.get_journals,
         )
 
+    @classmethod
+    def dump(cls):
+        query = cls.query().options(selectinload(cls.journal_entries))
+        return [i.to_dict for i in query]
+
+    @classmethod
+    def to_arrays(cls, period: str = None, key=None, all_jobs=False):
+        """Return the time_in, time_out, time_span and job_id of the current user's
+        records, of a single period when one is given, as contiguous numpy arrays. Each
+        column is read as a single comma separated text with group_concat, see
+        core.stats for the analytics on them. Needs the optional numpy package."""
+        from core.stats import to_arrays
+
+        columns = [
+            # group_concat skips nulls, which would misalign the columns
+            func.group_concat(func.coalesce(cls.time_in, "NaT")),
+            func.group_concat(func.coalesce(cls.time_out, "NaT")),
+            func.group_concat(cast(func.coalesce(cls.time_span, 0), Integer)),
+        ]
+        if all_jobs:
+            columns.append(func.group_concat(cls.job_id))
+        query = select(columns).where(cls.scope_filter(all_jobs))
+        if period is not None:
+            query = query.where(cls.period_filter(period, key))
+        # one row of a few long strings, sqlite builds them much faster than the python
+        # sqlite module builds a tuple per record
+        row = cls.db().execute(query).fetchone()
+        return to_arrays(row, job_id=None if all_jobs else State.get_job_id())
+
     def update_span(self):
         if self.time_in and self.time_out:
             self.time_span = (self.time_out - self.time_in).total_seconds()
@@ -206,74 +455,172 @@ class Clok(Model, SurrogatePK, SpanQuery):
 
     @classmethod
     def get_last_record(cls):
-        s = State.get()
-        if s.clok is None:
+        clok_id = State.get_clok_id()
+        if clok_id is None:
             return (
-                cls.query().filter(cls.job == s.job).order_by(desc(cls.time_in)).first()
+                cls.query()
+                .filter(cls.job_id == State.get_job_id())
+                .order_by(desc(cls.time_in))
+                .first()
             )
         else:
-            return s.clok
+            return cls.query().get(clok_id)
 
     @classmethod
     def get_most_recent_record(cls):
-        return cls.query().order_by(desc(cls.id)).first()
+        return cls.owned().order_by(desc(cls.id)).first()
 
     @classmethod
-    def clock_in(cls, verbose=False):
-        cls.clock_in_when(datetime.now(), verbose)
+    def bulk_create(
+        cls, rows: Iterable[dict], chunk_size: int = TRANSFER_CHUNK_SIZE
+    ) -> int:
+        """Insert records like CRUDMixin.bulk_create. Every row needs a time_in, the
+        period keys and time span are derived from the times and the job defaults to
+        the current one."""
+        job_id = State.get_job_id()
+
+        def record(row: dict) -> dict:
+            time_in, time_out = row["time_in"], row.get("time_out")
+            span = (time_out - time_in).total_seconds() if time_out else 0
+            return {
+                "job_id": job_id,
+                "date_key": get_date_key(time_in),
+                "week_key": get_week(time_in),
+                "month_key": get_month(time_in),
+                "time_out": time_out,
+                "time_span": span,
+                **row,
+            }
+
+        return super().bulk_create(map(record, rows), chunk_size)
 
     @classmethod
-    def clock_in_when(cls, when: datetime, verbose=False):
-        if verbose:
-            print(f"Clocking you in at {when:%Y-%m-%d %H:%M:%S}")
+    def _new(cls, time_in: datetime, time_out: datetime = None, msg: str = None):
         c = cls(
-            time_in=when,
-            date_key=get_date_key(when),
-            month_key=get_month(when),
-            week_key=get_week(when),
+            time_in=time_in,
+            time_out=time_out,
+            date_key=get_date_key(time_in),
+            month_key=get_month(time_in),
+            week_key=get_week(time_in),
         )
-        c.save()
-        State.set_clok(c)
+        if msg is not None:
+            # inserted with the record, which has no id to refer to yet
+            c.journal_entries.append(Journal(entry=msg))
         return c
 
     @classmethod
-    def clock_out(cls, verbose=False):
-        cls.clock_out_when(datetime.now(), verbose)
+    def clock_in(cls, verbose=False, msg: str = None):
+        return cls.clock_in_when(datetime.now(), verbose, msg)
 
     @classmethod
-    def clock_out_when(cls, when: datetime, verbose=False):
+    def clock_in_when(cls, when: datetime, verbose=False, msg: str = None):
+        """Clock in at ``when`` with an optional journal entry and make the new record
+        the current one, in one transaction."""
+        if verbose:
+            print(f"Clocking you in at {when:%Y-%m-%d %H:%M:%S}")
+        c = cls._new(when, msg=msg)
+        with cls.unit_of_work() as session:
+            session.add(c)
+            session.flush()
+            State.set_clok(c)
+        return c
+
+    @classmethod
+    def add_span(cls, time_in: datetime, time_out: datetime, msg: str = None):
+        """Add a finished record with an optional journal entry in one transaction,
+        the current record stays the same."""
+        c = cls._new(time_in, time_out, msg)
+        with cls.unit_of_work():
+            c.update_span()
+        return c
+
+    @classmethod
+    def clock_out(cls, verbose=False, msg: str = None):
+        return cls.clock_out_when(datetime.now(), verbose, msg)
+
+    @classmethod
+    def clock_out_when(cls, when: datetime, verbose=False, msg: str = None):
+        """Clock out of the last record at ``when`` with an optional journal entry, in
+        one transaction."""
         if verbose:
             print(f"Clocking you out at {when:%Y-%m-%d %H:%M:%S}")
-        r = cls.get_last_record()
-        r.time_out = when
-        r.update_span()
-        r.save()
+        with cls.unit_of_work():
+            r = cls.get_last_record()
+            r.time_out = when
+            r.update_span()
+            if msg is not None:
+                r.add_journal(msg)
         return r
 
     @classmethod
-    def clok_out_by_id(cls, id: Union[int, str], when: datetime, verbose=False):
+    def clok_out_by_id(
+        cls, id: Union[int, str], when: datetime, verbose=False, msg: str = None
+    ):
         if verbose:
             print(f"Clocking you out at {when:%Y-%m-%d %H:%M:%S}")
-        c = cls.get_by_id(int(id))
-        c.time_out = when
-        c.update_span()
-        c.save()
+        with cls.unit_of_work():
+            c = cls.get_by_id(int(id))
+            c.time_out = when
+            c.update_span()
+            if msg is not None:
+                c.add_journal(msg)
         return c
 
+    @classmethod
+    def get_seconds(cls, period: str, key=None, all_jobs=False) -> int:
+        """Sum the recorded seconds of a period from the daily totals."""
+        query = cls.db().query(func.coalesce(func.sum(DailyTotal.seconds), 0))
+        query = query.filter(DailyTotal.period_filter(period, key))
+        return query.filter(DailyTotal.scope_filter(all_jobs)).scalar()
+
     @classmethod
     def get_day_hours(cls, key: int = None, all_jobs=False):
-        records = cls.get_by_date_key(key, all_jobs=all_jobs)
-        return sum([i.time_span for i in records])
+        return cls.get_seconds("day", key, all_jobs=all_jobs)
+
+    @classmethod
+    def get_week_hours(cls, key: int = None, all_days=False, all_jobs=False):
+        return cls.get_seconds("week", key, all_jobs=all_jobs)
 
     @classmethod
-    def get_week_hours(cls, key: int = None, all_days=False):
-        records = cls.get_by_week_key(key)
-        return sum([i.time_span for i in records])
+    def get_month_hours(cls, key: int = None, all_days=False, all_jobs=False):
+        return cls.get_seconds("month", key, all_jobs=all_jobs)
 
     @classmethod
-    def get_month_hours(cls, key: int = None, all_days=False):
-        records = cls.get_by_month_key(key)
-        return sum([i.time_span for i in records])
+    def summary(cls, period: str = "week", key=None, all_jobs=False):
+        """Return (job name, period key, records, seconds, journals) rows for every
+        period and job, or only for ``key`` when it is given. Records and seconds are
+        summed from the daily totals, journals are counted in a second query because
+        they are not part of the rollup."""
+        period_column = DailyTotal.period_column(period)
+        totals = (
+            cls.db()
+            .query(
+                Job.name,
+                period_column.label("key"),
+                func.sum(DailyTotal.records),
+                func.sum(DailyTotal.seconds),
+            )
+            .join(Job, Job.id == DailyTotal.job_id)
+            .filter(DailyTotal.scope_filter(all_jobs))
+        )
+        clok_period_column = cls.period_column(period)
+        journals = (
+            cls.db()
+            .query(Job.name, clok_period_column, func.count(Journal.id))
+            .join(cls, cls.id == Journal.clok_id)
+            .join(Job, Job.id == cls.job_id)
+            .filter(cls.scope_filter(all_jobs))
+        )
+        if key is not None:
+            totals = totals.filter(DailyTotal.period_filter(period, key))
+            journals = journals.filter(cls.period_filter(period, key))
+        journals = journals.group_by(clok_period_column, Job.name)
+        counts = {(name, key): count for name, key, count in journals}
+        totals = totals.group_by(period_column, Job.name)
+        return [
+            (name, key, records, seconds, counts.get((name, key), 0))
+            for name, key, records, seconds in totals.order_by(period_column, Job.name)
+        ]
 
     def __repr__(self):
         span = 0
@@ -325,10 +672,13 @@ class Clok(Model, SurrogatePK, SpanQuery):
             return None
 
 
-class Journal(Model, SurrogatePK, Tracked, SpanQuery):
+class Journal(Model, Owned, SurrogatePK, Tracked, Versioned, SpanQuery):
     __tablename__ = "time_clok_journal"
 
-    __table_args__ = (UniqueConstraint("id", "time", name="natural"),)
+    __table_args__ = (
+        UniqueConstraint("id", "time", name="natural"),
+        Index("ix_time_clok_journal_clok", "clok_id"),
+    )
     clok_id = reference_col("time_clok")
     time = Column(DateTime, default=datetime.now)
     entry = Column(TEXT)
@@ -340,8 +690,10 @@ class Journal(Model, SurrogatePK, Tracked, SpanQuery):
         time: datetime = None,
         entry: str = None,
         id: int = None,
+        user_id: int = None,
     ):
         self.id = id
+        self.user_id = user_id if user_id is not None else State.get_user_id()
         if clok_id is not None:
             self.clok_id = clok_id
         elif clock is not None:
@@ -354,6 +706,50 @@ class Journal(Model, SurrogatePK, Tracked, SpanQuery):
     def to_dict(self):
         return dict(time=self.time, entry=self.entry, id=self.id)
 
+    @classmethod
+    def search(
+        cls,
+        text: str,
+        period: str = None,
+        key=None,
+        all_jobs=False,
+        limit: int = JOURNAL_SEARCH_LIMIT,
+    ):
+        """Return (id, time, job name, snippet) rows of the current user's journal
+        entries that match ``text``, best match first. ``text`` is an fts5 query, text
+        that isn't valid fts5 syntax is searched for as plain words. Records can be
+        limited to a period and to the current job like SpanQuery. Raises
+        OperationalError when sqlite was built without fts5."""
+        if not text.strip():
+            return []
+        try:
+            return cls._search(text, period, key, all_jobs, limit)
+        except OperationalError:
+            words = " ".join('"' + w.replace('"', '""') + '"' for w in text.split())
+            return cls._search(words, period, key, all_jobs, limit)
+
+    @classmethod
+    def _search(cls, text, period, key, all_jobs, limit):
+        fts = table(JOURNAL_FTS_TABLE, column("rowid"))
+        name = literal_column(JOURNAL_FTS_TABLE)
+        query = (
+            cls.db()
+            .query(
+                cls.id,
+                cls.time,
+                Job.name,
+                func.snippet(name, 0, "[", "]", "...", JOURNAL_SNIPPET_TOKENS),
+            )
+            .select_from(fts)
+            .join(cls, cls.id == fts.c.rowid)
+            .join(Clok, Clok.id == cls.clok_id)
+            .join(Job, Job.id == Clok.job_id)
+            .filter(name.op("MATCH")(text), Clok.scope_filter(all_jobs))
+        )
+        if period is not None:
+            query = query.filter(Clok.period_filter(period, key))
+        return query.order_by(func.bm25(name), desc(cls.time)).limit(limit).all()
+
     def __repr__(self):
         return _journal_format_row(self.id, self.entry)
 
@@ -361,6 +757,74 @@ class Journal(Model, SurrogatePK, Tracked, SpanQuery):
         return self.__repr__()
 
 
+class DailyTotal(Model, SpanQuery):
+    """Seconds worked and number of records per user, job and day. The rows are kept up
+    to date by triggers on time_clok, see the add_daily_totals migration, so the period
+    reports sum a row per day instead of every record."""
+
+    __tablename__ = "time_clok_daily_totals"
+    __table_args__ = (
+        Index("ix_time_clok_daily_totals_week", "user_id", "job_id", "week_key"),
+        Index("ix_time_clok_daily_totals_month", "user_id", "job_id", "month_key"),
+    )
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    job_id = Column(Integer, primary_key=True, autoincrement=False)
+    date_key = Column(Integer, primary_key=True, autoincrement=False)
+    week_key = Column(Integer)
+    month_key = Column(Integer)
+    seconds = Column(Integer, nullable=False, default=0)
+    records = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Recompute every daily total from the records, returns the number of rows."""
+        with cls.unit_of_work() as session:
+            for statement in ROLLUP_REBUILD_SQL:
+                session.execute(statement)
+        return cls.count()
+
+    @classmethod
+    def stale(cls) -> int:
+        """Return the number of daily totals that don't match the records."""
+        totals = (
+            "SELECT user_id, job_id, date_key, week_key, month_key, seconds, records "
+            "FROM time_clok_daily_totals"
+        )
+        key = "SELECT user_id, job_id, date_key FROM"
+        return (
+            cls.db()
+            .execute(
+                f"SELECT count(*) FROM ({key} ({ROLLUP_SELECT_SQL} EXCEPT {totals}) "
+                f"UNION {key} ({totals} EXCEPT {ROLLUP_SELECT_SQL}))"
+            )
+            .scalar()
+        )
+
+
+class ChangeSequence(Model):
+    """The single row sequence that change_seq values and tombstones are taken from,
+    see the track_changes migration."""
+
+    __tablename__ = CHANGE_SEQUENCE_TABLE
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    value = Column(Integer, nullable=False)
+
+    @classmethod
+    def current(cls) -> int:
+        """Return the last change handed out, the marker for ``dump --since``."""
+        return cls.db().query(cls.value).filter(cls.id == 1).scalar() or 0
+
+
+class Tombstone(Model):
+    """A row deleted from one of the tracked tables, kept so that incremental dumps can
+    delete it from the databases they are imported into."""
+
+    __tablename__ = TOMBSTONE_TABLE
+    table_name = Column(String(64), primary_key=True)
+    row_id = Column(Integer, primary_key=True, autoincrement=False)
+    change_seq = Column(Integer, nullable=False, index=True)
+
+
 def _journal_format_row(journal_id, journal_entry) -> str:
     journal_id_str = f" - JID: {journal_id:<4}"
     if len(journal_entry) > 80:
@@ -404,6 +868,20 @@ def _seek_last_space(s: str, chars: int) -> int:
                 return 0
 
 
+def summary_row_header():
+    return _summary_format_row("Job", "Key", "Records", "Hours", "Journals")
+
+
+def summary_format_row(job, key, records, seconds, journals) -> str:
+    return _summary_format_row(
+        job, key, records, round(seconds / SECONDS_PER_HOUR, 2), journals
+    )
+
+
+def _summary_format_row(job, key, records, hours, journals) -> str:
+    return f"{key:<10} {job:<10} {records:<8} {hours:<8} {journals:<8}"
+
+
 def clock_row_header():
     return _clock_format_row(
         "ID", "Job", "Date", "Month", "Week", "Clock In", "Clock Out", "Hours "
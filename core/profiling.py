@@ -0,0 +1,207 @@
+"""This file contains the profiler behind ``clok --profile`` and $CLOK_PROFILE. A
+profile records the wall time of a command, the time the process spent importing the cli
+and, through engine and mapper events, every sql statement executed with its time, the
+commits and rollbacks and the number of rows hydrated into model instances. cProfile and
+tracemalloc can run as well. The report is written as json to PROFILE_DIRECTORY, the
+extra profilers' output next to it, and a one line summary is printed to stderr.
+
+The report's layout is versioned by PROFILE_SCHEMA_VERSION, fields are only ever added
+within a version. This module is imported first by clok.py to time the imports, it must
+only import the standard library at module level. """
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from core.defines import PROFILE_DIRECTORY, PROFILE_TRACEMALLOC_LINES
+
+PROFILE_SCHEMA = "clok-profile"
+PROFILE_SCHEMA_VERSION = 1
+# the profilers that can run along with the sql instrumentation
+PROFILERS = ("cprofile", "tracemalloc")
+
+_IMPORT_STARTED = time.perf_counter()
+_import_time = None
+
+
+def imports_done():
+    """Mark the end of the cli's imports, clok.py calls this after its last import."""
+    global _import_time
+    if _import_time is None:
+        _import_time = time.perf_counter() - _IMPORT_STARTED
+
+
+def parse_profilers(value: Optional[str]) -> Optional[List[str]]:
+    """Parse the value of $CLOK_PROFILE. Returns None when profiling is off, otherwise
+    the extra profilers it names, any other value like 1 only turns profiling on."""
+    if not value or value.strip().lower() in ("0", "false", "no", "off"):
+        return None
+    names = [name.strip().lower() for name in value.split(",")]
+    return [name for name in PROFILERS if name in names]
+
+
+class Profile:
+    """Profile the work done between ``start`` and ``stop``.
+
+    ::
+
+        profile = Profile("show", profilers=["cprofile"])
+        profile.start()
+        ...
+        report = profile.stop()
+    """
+
+    def __init__(
+        self,
+        command: str,
+        profilers: Iterable[str] = (),
+        directory: str = PROFILE_DIRECTORY,
+    ):
+        unknown = set(profilers) - set(PROFILERS)
+        if unknown:
+            raise ValueError(f"Unknown profilers {', '.join(sorted(unknown))}")
+        self.command = command
+        self.profilers = [name for name in PROFILERS if name in profilers]
+        self.directory = directory
+        self.statements = {}
+        self.commits = 0
+        self.rollbacks = 0
+        self.rows = 0
+        self._last_statement = None
+        self._started = None
+        self._started_at = None
+        self._cprofile = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, *args):
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, *args):
+        elapsed = time.perf_counter() - conn.info["profile_started"].pop()
+        stats = self.statements.setdefault(
+            statement, {"statement": statement, "count": 0, "time": 0.0, "rows": 0}
+        )
+        stats["count"] += 1
+        stats["time"] += elapsed
+        self._last_statement = stats
+
+    def _handle_error(self, context):
+        started = context.connection.info.get("profile_started")
+        if started:
+            started.pop()
+
+    def _commit(self, conn):
+        self.commits += 1
+
+    def _rollback(self, conn):
+        self.rollbacks += 1
+
+    def _load(self, target, context):
+        # instances are hydrated right after the statement that selected them
+        self.rows += 1
+        if self._last_statement is not None:
+            self._last_statement["rows"] += 1
+
+    def _listeners(self):
+        return (
+            ("before_cursor_execute", self._before_cursor_execute),
+            ("after_cursor_execute", self._after_cursor_execute),
+            ("handle_error", self._handle_error),
+            ("commit", self._commit),
+            ("rollback", self._rollback),
+        )
+
+    def start(self):
+        from sqlalchemy import event
+        from sqlalchemy.orm import Mapper
+
+        from core.database import DB
+
+        for name, fn in self._listeners():
+            DB.listen(name, fn)
+        event.listen(Mapper, "load", self._load)
+        if "tracemalloc" in self.profilers:
+            import tracemalloc
+
+            tracemalloc.start()
+        if "cprofile" in self.profilers:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._started_at = datetime.now()
+        self._started = time.perf_counter()
+
+    def stop(self) -> dict:
+        """Stop profiling, write the report and the profilers' output and return the
+        report."""
+        from sqlalchemy import event
+        from sqlalchemy.orm import Mapper
+
+        from core.database import DB
+
+        wall_time = time.perf_counter() - self._started
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        event.remove(Mapper, "load", self._load)
+        for name, fn in self._listeners():
+            DB.remove_listener(name, fn)
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(
+            self.directory,
+            f"{self._started_at:%Y%m%d-%H%M%S}-{os.getpid()}-{self.command or 'clok'}",
+        )
+        statements = sorted(self.statements.values(), key=lambda s: -s["time"])
+        report = {
+            "schema": PROFILE_SCHEMA,
+            "version": PROFILE_SCHEMA_VERSION,
+            "command": self.command,
+            "argv": sys.argv[1:],
+            "pid": os.getpid(),
+            "started": self._started_at.isoformat(),
+            "wall_time": wall_time,
+            "import_time": _import_time,
+            "sql": {
+                "statements": sum(s["count"] for s in statements),
+                "time": sum(s["time"] for s in statements),
+                "commits": self.commits,
+                "rollbacks": self.rollbacks,
+                "rows_hydrated": self.rows,
+                "by_statement": statements,
+            },
+            "cprofile": None,
+            "tracemalloc": None,
+        }
+        if self._cprofile is not None:
+            report["cprofile"] = f"{base}.prof"
+            self._cprofile.dump_stats(report["cprofile"])
+        if "tracemalloc" in self.profilers:
+            report["tracemalloc"] = self._write_tracemalloc(f"{base}.tracemalloc.txt")
+        report["path"] = f"{base}.json"
+        with open(report["path"], "w") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    @staticmethod
+    def _write_tracemalloc(path: str) -> dict:
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(path, "w") as f:
+            f.write(f"current {current} bytes, peak {peak} bytes\n")
+            for stat in snapshot.statistics("lineno")[:PROFILE_TRACEMALLOC_LINES]:
+                f.write(f"{stat}\n")
+        return {"path": path, "current": current, "peak": peak}
+
+
+def summary(report: dict) -> str:
+    sql = report["sql"]
+    return (
+        f"profile: {report['wall_time'] * 1000:.1f} ms, {sql['statements']} statements "
+        f"in {sql['time'] * 1000:.1f} ms, {sql['commits']} commits, "
+        f"{sql['rows_hydrated']} rows hydrated, written to {report['path']}"
+    )
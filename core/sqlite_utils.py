@@ -0,0 +1,29 @@
+"""This file contains helpers for raw sqlite3 connections. It only uses the standard
+library so that the fast path can share it with the SqlAlchemy engine."""
+import re
+from typing import Dict, List
+
+_PRAGMA_VALUE = re.compile(r"^-?\w+$")
+
+
+def pragma_statements(pragmas: Dict[str, str]) -> List[str]:
+    """Return the validated ``PRAGMA`` statements for the given pragmas. Empty values
+    are skipped so that sqlite's own default stays in place."""
+    statements = []
+    for name, value in pragmas.items():
+        if value is None or value == "":
+            continue
+        if not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f"Invalid value for sqlite pragma {name}: {value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def apply_pragmas(connection, pragmas: Dict[str, str]):
+    """Set the given pragmas on a DBAPI sqlite connection."""
+    for statement in pragma_statements(pragmas):
+        cursor = connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
@@ -0,0 +1,150 @@
+"""This file contains the columnar analytics behind ``clok stats``. Records are read
+with one Core select into contiguous numpy arrays, see Clok.to_arrays, and every
+statistic is computed with vectorized operations on those arrays instead of looping
+over Clok objects, which keeps years of history well under a second.
+
+numpy is an optional dependency, it is only needed when this module is used. Times are
+naive local times like everywhere else in TimeClok, they are stored in the arrays as
+datetime64[s] and open records have a time_out of NaT. """
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.defines import SECONDS_PER_HOUR
+
+# the int64 value of NaT, it marks the time_out of records that are still open
+NAT = np.iinfo(np.int64).min
+SECONDS_PER_DAY = 24 * 60 * 60
+# 1970-01-01 was a thursday, these shift day numbers to monday = 0 and to the sunday
+# based weeks of the week keys
+_EPOCH_WEEKDAY = 3
+_EPOCH_WEEK_OFFSET = 4
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+# a record length histogram bin per hour, the last one collects everything longer
+SPAN_BINS = tuple(range(0, 13)) + (np.inf,)
+HEAT_SHADES = " .:-=+*#%@"
+
+
+# the columns of Clok.to_arrays, numpy parses the datetime text sqlite stores
+COLUMNS = np.dtype(
+    [
+        ("time_in", "datetime64[s]"),
+        ("time_out", "datetime64[s]"),
+        ("time_span", np.int64),
+        ("job_id", np.int64),
+    ]
+)
+
+
+def _parse(text: Optional[str], dtype: np.dtype) -> np.ndarray:
+    if not text:
+        return np.array([], dtype=dtype)
+    if dtype.kind == "M":
+        return np.array(text.split(","), dtype=dtype)
+    return np.fromstring(text, dtype=dtype, sep=",")
+
+
+def to_arrays(
+    columns: Iterable[Optional[str]], job_id: int = None
+) -> Dict[str, np.ndarray]:
+    """Convert the comma separated columns read by Clok.to_arrays, in the order of
+    COLUMNS, to one contiguous array per column sorted by time_in. Missing times are
+    NaT. When every record belongs to ``job_id`` the job_id column is left out of the
+    query and filled in here."""
+    arrays = {
+        name: _parse(text, COLUMNS[name]) for name, text in zip(COLUMNS.names, columns)
+    }
+    if job_id is not None:
+        arrays["job_id"] = np.full(len(arrays["time_in"]), job_id, dtype=np.int64)
+    # group_concat doesn't promise an order, the rows come in time_in order in practice
+    # and the sort is cheap on sorted input
+    order = np.argsort(arrays["time_in"], kind="stable")
+    return {name: np.ascontiguousarray(array[order]) for name, array in arrays.items()}
+
+
+def _seconds(times: np.ndarray) -> np.ndarray:
+    return times.view(np.int64)
+
+
+def job_seconds(job_id: np.ndarray, time_span: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Return the job ids and the seconds recorded for each of them."""
+    jobs, index = np.unique(job_id, return_inverse=True)
+    return jobs, np.bincount(index, weights=time_span, minlength=len(jobs))
+
+
+def weekday_hour_heatmap(time_in: np.ndarray, time_out: np.ndarray) -> np.ndarray:
+    """Return a (7, 24) array of the seconds worked in every hour of every weekday,
+    monday first. Records are split over all the hours they overlap, open records are
+    left out."""
+    start, end = _seconds(time_in), _seconds(time_out)
+    closed = (end != NAT) & (start != NAT) & (end > start)
+    start, end = start[closed], end[closed]
+    first = start // 3600
+    counts = (end - 1) // 3600 - first + 1
+    # one element per record and hour it overlaps
+    record = np.repeat(np.arange(len(first)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    hour = first[record] + offsets
+    seconds = np.minimum(end[record], hour * 3600 + 3600) - np.maximum(
+        start[record], hour * 3600
+    )
+    cell = ((hour // 24 + _EPOCH_WEEKDAY) % 7) * 24 + hour % 24
+    return np.bincount(cell, weights=seconds, minlength=7 * 24).reshape(7, 24)
+
+
+def span_histogram(
+    time_span: np.ndarray, bins: Iterable[float] = SPAN_BINS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the number of records per length, the bins are in hours."""
+    return np.histogram(time_span / SECONDS_PER_HOUR, bins=np.asarray(bins))
+
+
+def daily_seconds(
+    time_in: np.ndarray, time_span: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return every day from the first to the last record, days without records
+    included, and the seconds recorded on them."""
+    if not len(time_in):
+        return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64)
+    days = _seconds(time_in) // SECONDS_PER_DAY
+    first = days.min()
+    seconds = np.bincount(days - first, weights=time_span)
+    return (first + np.arange(len(seconds))).astype("datetime64[D]"), seconds
+
+
+def weekly_seconds(
+    time_in: np.ndarray, time_span: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Same as daily_seconds for the sunday based weeks of the week keys, returns the
+    first day of every week."""
+    if not len(time_in):
+        return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64)
+    weeks = (_seconds(time_in) // SECONDS_PER_DAY + _EPOCH_WEEK_OFFSET) // 7
+    first = weeks.min()
+    seconds = np.bincount(weeks - first, weights=time_span)
+    starts = (first + np.arange(len(seconds))) * 7 - _EPOCH_WEEK_OFFSET
+    return starts.astype("datetime64[D]"), seconds
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Return the sum of every ``window`` consecutive values, the first ``window - 1``
+    sums cover fewer values."""
+    total = np.cumsum(values, dtype=np.float64)
+    total[window:] = total[window:] - total[:-window]
+    return total
+
+
+def overtime(weekly: np.ndarray, hours_per_week: float) -> np.ndarray:
+    """Return the seconds worked over ``hours_per_week`` in every week."""
+    return np.maximum(weekly - hours_per_week * SECONDS_PER_HOUR, 0)
+
+
+def format_heatmap(heatmap: np.ndarray) -> List[str]:
+    """Draw a weekday and hour heatmap with one character per hour, darker characters
+    are more hours."""
+    scale = heatmap.max() or 1
+    shades = np.ceil(heatmap / scale * (len(HEAT_SHADES) - 1)).astype(int)
+    lines = ["     " + "".join(f"{hour:<3}" for hour in range(0, 24, 3)).rstrip()]
+    for name, row in zip(WEEKDAYS, shades):
+        lines.append(f"{name}  " + "".join(HEAT_SHADES[shade] for shade in row))
+    return lines
@@ -0,0 +1,481 @@
+"""This file contains the streaming export and import engines used by the dump and
+import commands. Exports read each table in chunks and write rows as they are read, so
+memory use does not depend on the size of the database. Imports parse dump files one row
+at a time, validate and convert rows in chunks, and write each chunk with a single
+``INSERT OR IGNORE`` executemany so that duplicates are skipped by the database instead
+of by per row commits and rollbacks.
+
+Incremental dumps, ``dump_database(since=marker)``, only contain the rows changed after
+a marker of an earlier dump and the tombstones of the rows deleted since. Importing one
+deletes the tombstoned rows and updates changed rows in place, importing it twice
+changes nothing. """
+import json
+from datetime import datetime
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, select
+
+from core.database import DB
+from core.date_utils import (
+    get_date_key,
+    get_month,
+    get_week,
+    parse_date,
+    to_db_datetime,
+)
+from core.defines import TRANSFER_CHUNK_SIZE, TRANSFER_READ_SIZE
+from core.migrations import TRACKED_TABLES
+from core.models import ChangeSequence, Clok, Job, Journal, State, Tombstone, User
+from core.utils import to_json
+
+_WHITESPACE = json.decoder.WHITESPACE
+# the first section of an incremental dump, its one row holds the marker the dump was
+# made since and the marker to make the next one since
+DELTA_SECTION = "time_clok_changes"
+DELTA_TABLE = Table(
+    DELTA_SECTION, MetaData(), Column("since", Integer), Column("marker", Integer)
+)
+
+
+class DumpFormatError(ValueError):
+    """Raised when a dump file does not have the expected layout."""
+
+
+class _JsonStream:
+    """A minimal pull parser over a text file. It never holds more than one read chunk
+    plus the value being decoded in memory."""
+
+    def __init__(self, f: IO, read_size: int = TRANSFER_READ_SIZE):
+        self._f = f
+        self._read_size = read_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        data = self._f.read(self._read_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non whitespace character without consuming it, or an empty
+        string at the end of the file."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise DumpFormatError(f"Expected '{char}' but found '{found}'")
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a value that ends exactly at the end of the buffer may be truncated
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+def iter_dump_rows(
+    f: IO, read_size: int = TRANSFER_READ_SIZE
+) -> Iterator[Tuple[str, dict]]:
+    """Stream a sectioned json dump ``{"table": [row, ...], ...}`` yielding a
+    ``(table_name, row)`` tuple for every row in file order."""
+    stream = _JsonStream(f, read_size)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        name = stream.value()
+        stream.expect(":")
+        stream.expect("[")
+        if stream.peek() != "]":
+            while True:
+                yield name, stream.value()
+                if stream.peek() != ",":
+                    break
+                stream.expect(",")
+        stream.expect("]")
+        if stream.peek() != ",":
+            break
+        stream.expect(",")
+    stream.expect("}")
+
+
+# tables in the order they are written to a dump
+DUMP_TABLES = (
+    User.__table__,
+    Job.__table__,
+    State.__table__,
+    Clok.__table__,
+    Journal.__table__,
+)
+
+
+def iter_table_rows(
+    table: Table, chunk_size: int = TRANSFER_CHUNK_SIZE, since: int = None
+) -> Iterator:
+    """Yield every row of a table as a dictionary, fetching ``chunk_size`` rows at a
+    time from a streaming cursor. With ``since`` only the rows changed after that
+    marker are read, in the order they were changed."""
+    query = select([table])
+    if since is not None and "change_seq" in table.c:
+        query = query.where(table.c.change_seq > since).order_by(table.c.change_seq)
+    else:
+        query = query.order_by(*table.primary_key.columns)
+    result = DB.session.execute(query.execution_options(stream_results=True))
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        result.close()
+
+
+def dump_sections(
+    chunk_size: int = TRANSFER_CHUNK_SIZE, since: int = None
+) -> List[Tuple[Table, Iterable[dict]]]:
+    """Return the tables of a dump, in the order they are written, with an iterator
+    over the rows of each. Rows are only read when the iterators are consumed.
+
+    With ``since`` the dump is incremental: it starts with a DELTA_SECTION holding the
+    current marker, read before any table so that changes made while dumping are
+    exported again next time rather than missed, followed by the tombstones and the
+    rows changed after ``since``. Users are always dumped in full."""
+    sections = []
+    if since is not None:
+        delta = dict(since=since, marker=ChangeSequence.current())
+        sections.append((DELTA_TABLE, [delta]))
+        tombstones = iter_table_rows(Tombstone.__table__, chunk_size, since)
+        sections.append((Tombstone.__table__, tombstones))
+    for table in DUMP_TABLES:
+        sections.append((table, iter_table_rows(table, chunk_size, since)))
+    return sections
+
+
+def dump_database(
+    f: IO, chunk_size: int = TRANSFER_CHUNK_SIZE, since: int = None
+) -> Dict[str, int]:
+    """Write the database to an open file as a sectioned json dump,
+    ``{"table": [row, ...], ...}``, that ``iter_dump_rows`` can read back as a stream.
+    Returns the number of rows written per table, see dump_sections for ``since``."""
+    counts = {}
+    f.write("{")
+    for n, (table, rows) in enumerate(dump_sections(chunk_size, since)):
+        f.write(f"{', ' if n else ''}{json.dumps(table.name)}: [")
+        count = 0
+        for row in rows:
+            f.write(f"{', ' if count else ''}{json.dumps(row, default=to_json)}")
+            count += 1
+        f.write("]")
+        if table is not DELTA_TABLE:
+            counts[table.name] = count
+    f.write("}")
+    return counts
+
+
+def dump_file(file_path: str, **kwargs) -> Dict[str, int]:
+    with open(file_path, "w") as f:
+        return dump_database(f, **kwargs)
+
+
+class _RowConverter:
+    """Converts dump rows into complete parameter dictionaries for one table. Every row
+    has a value for every column so that a chunk can be sent as a single executemany.
+    Dates are formatted here rather than by SqlAlchemy's bind processors, which would
+    otherwise be the most expensive part of an import. Rows of dumps made before users
+    existed are given to the user running the import."""
+
+    def __init__(self, table: Table, delta: bool = False):
+        self.table = table
+        # change_seq belongs to the database that made the dump, the importing
+        # database's triggers give every row it writes its own
+        self.columns = [c.name for c in table.columns if c.name != "change_seq"]
+        self._owned = "user_id" in self.columns
+        self._default_user_id = None
+        self._datetimes = [
+            c.name for c in table.columns if isinstance(c.type, DateTime)
+        ]
+        self.insert_sql = (
+            f"INSERT OR IGNORE INTO {table.name} ({', '.join(self.columns)}) "
+            f"VALUES ({', '.join(':' + name for name in self.columns)})"
+        )
+        self.update_sql = None
+        if delta:
+            # rows of an incremental dump replace the row with their id, unless nothing
+            # changed or the new values collide with another row's natural key
+            values = [name for name in self.columns if name != "id"]
+            self.update_sql = (
+                f"UPDATE OR IGNORE {table.name} SET "
+                f"{', '.join(f'{name} = :{name}' for name in values)} WHERE id = :id "
+                f"AND ({' OR '.join(f'{name} IS NOT :{name}' for name in values)})"
+            )
+
+    def __call__(self, raw: dict) -> Dict:
+        row = {name: raw.get(name) for name in self.columns}
+        if self._owned and row["user_id"] is None:
+            row["user_id"] = self.default_user_id
+        for name in self._datetimes:
+            row[name] = parse_date(row[name])
+        row = self.fix(row)
+        for name in self._datetimes:
+            row[name] = to_db_datetime(row[name])
+        return row
+
+    @property
+    def default_user_id(self):
+        # only resolved once, and only if the dump contains rows without a user
+        if self._default_user_id is None:
+            self._default_user_id = State.get_user_id()
+        return self._default_user_id
+
+    def fix(self, row: dict) -> Dict:
+        return row
+
+    def write(self, connection, rows: List[dict]) -> Tuple[int, int, int]:
+        """Write a chunk of converted rows, returns the number of rows inserted,
+        updated and deleted."""
+        updated = 0
+        if self.update_sql is not None:
+            updated = connection.execute(self.update_sql, rows).rowcount
+        return connection.execute(self.insert_sql, rows).rowcount, updated, 0
+
+
+class _UserConverter(_RowConverter):
+    def fix(self, row):
+        if not row["name"]:
+            raise ValueError("user is missing a name")
+        row["name"] = row["name"].lower()
+        return row
+
+
+class _JobConverter(_RowConverter):
+    def fix(self, row):
+        if not row["name"]:
+            raise ValueError("job is missing a name")
+        row["name"] = row["name"].lower()
+        return row
+
+
+class _ClokConverter(_RowConverter):
+    def __init__(self, table, delta=False):
+        super().__init__(table, delta)
+        self._default_job_id = None
+
+    @property
+    def default_job_id(self):
+        # only resolved once, and only if the dump contains rows without a job
+        if self._default_job_id is None:
+            self._default_job_id = State.get_job_id()
+        return self._default_job_id
+
+    def fix(self, row):
+        time_in, time_out = row["time_in"], row["time_out"]
+        if time_in is None:
+            raise ValueError("clok is missing time_in")
+        if row["job_id"] is None:
+            row["job_id"] = self.default_job_id
+        if row["date_key"] is None:
+            row["date_key"] = get_date_key(time_in)
+        # dumps made before keys were year qualified have bare week/month numbers
+        if row["week_key"] is None or row["week_key"] < 100:
+            row["week_key"] = get_week(time_in)
+        if row["month_key"] is None or row["month_key"] < 100:
+            row["month_key"] = get_month(time_in)
+        if row["time_span"] is None:
+            if time_out is not None:
+                row["time_span"] = int((time_out - time_in).total_seconds())
+            else:
+                row["time_span"] = 0
+        return row
+
+
+class _JournalConverter(_RowConverter):
+    def fix(self, row):
+        if row["clok_id"] is None:
+            raise ValueError("journal is missing clok_id")
+        if row["time"] is None:
+            row["time"] = datetime.now()
+        if row["created_at"] is None:
+            row["created_at"] = datetime.utcnow()
+        return row
+
+
+class _TombstoneConverter:
+    """Deletes the rows named by the tombstones of an incremental dump."""
+
+    def __call__(self, raw: dict) -> Dict:
+        if raw["table_name"] not in TRACKED_TABLES:
+            raise ValueError(f"{raw['table_name']} is not a tracked table")
+        return dict(table_name=raw["table_name"], row_id=int(raw["row_id"]))
+
+    def write(self, connection, rows: List[dict]) -> Tuple[int, int, int]:
+        deleted = 0
+        for table in {row["table_name"] for row in rows}:
+            ids = [dict(id=r["row_id"]) for r in rows if r["table_name"] == table]
+            deleted += connection.execute(
+                f"DELETE FROM {table} WHERE id = :id", ids
+            ).rowcount
+        return 0, 0, deleted
+
+
+CONVERTERS = {
+    Tombstone.__tablename__: lambda delta: _TombstoneConverter(),
+    User.__tablename__: lambda delta: _UserConverter(User.__table__, delta),
+    Job.__tablename__: lambda delta: _JobConverter(Job.__table__, delta),
+    State.__tablename__: lambda delta: _RowConverter(State.__table__, delta),
+    Clok.__tablename__: lambda delta: _ClokConverter(Clok.__table__, delta),
+    Journal.__tablename__: lambda delta: _JournalConverter(Journal.__table__, delta),
+}
+
+
+class ImportResult:
+    """Per table counts of processed, inserted, updated, deleted and skipped rows. The
+    marker of an incremental dump is kept as ``delta``."""
+
+    def __init__(self):
+        self.tables = {}
+        self.delta = None
+
+    def _counts(self, name) -> Dict[str, int]:
+        return self.tables.setdefault(
+            name, dict(processed=0, inserted=0, updated=0, deleted=0, skipped=0)
+        )
+
+    def add(
+        self, name: str, processed: int, inserted: int, updated: int = 0, deleted=0
+    ):
+        counts = self._counts(name)
+        counts["processed"] += processed
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+        counts["deleted"] += deleted
+        counts["skipped"] += processed - inserted - updated - deleted
+
+    def _total(self, count: str) -> int:
+        return sum(c[count] for c in self.tables.values())
+
+    @property
+    def inserted(self):
+        return self._total("inserted")
+
+    @property
+    def updated(self):
+        return self._total("updated")
+
+    @property
+    def deleted(self):
+        return self._total("deleted")
+
+    @property
+    def skipped(self):
+        return self._total("skipped")
+
+    @staticmethod
+    def _format(name, c) -> str:
+        line = f"{name}: {c['inserted']} inserted"
+        for count in ("updated", "deleted"):
+            if c[count]:
+                line += f", {c[count]} {count}"
+        return f"{line}, {c['skipped']} skipped"
+
+    def __str__(self):
+        rows = [self._format(name, c) for name, c in self.tables.items()]
+        counts = ("inserted", "updated", "deleted", "skipped")
+        totals = {count: self._total(count) for count in counts}
+        rows.append(self._format("Total", totals))
+        return "\n".join(rows)
+
+
+def import_dump(f: IO, **kwargs) -> ImportResult:
+    """Import a sectioned json dump from an open file, see import_rows."""
+    return import_rows(iter_dump_rows(f), **kwargs)
+
+
+def import_rows(
+    rows: Iterable[Tuple[str, dict]],
+    chunk_size: int = TRANSFER_CHUNK_SIZE,
+    progress: Callable[[str, int], None] = None,
+) -> ImportResult:
+    """Import the ``(table_name, row)`` tuples of a dump. Each table section is written
+    in one transaction with ``INSERT OR IGNORE`` batches of ``chunk_size`` rows, so rows
+    that collide with an existing primary or natural key are counted as skipped. Rows
+    that fail validation are skipped as well. ``progress`` is called with the table name
+    and the number of rows processed so far after every batch.
+
+    Incremental dumps first delete their tombstoned rows, and their rows update the
+    existing row with the same id before being inserted, so that replaying a dump
+    skips every row."""
+    session = DB.session
+    result = ImportResult()
+    name, converter, chunk, processed = None, None, [], 0
+
+    def flush():
+        nonlocal chunk
+        if chunk:
+            written = converter.write(session.connection(), chunk)
+            result.add(name, len(chunk), *written)
+            chunk = []
+        if progress is not None:
+            progress(name, processed)
+
+    try:
+        for section, raw in rows:
+            if section == DELTA_SECTION:
+                result.delta = raw
+                continue
+            if section != name:
+                if converter is not None:
+                    flush()
+                    session.commit()
+                name, converter, processed = section, None, 0
+                if section in CONVERTERS:
+                    converter = CONVERTERS[section](result.delta is not None)
+            if converter is None:
+                continue
+            processed += 1
+            try:
+                chunk.append(converter(raw))
+            except (ValueError, TypeError, KeyError, AttributeError):
+                result.add(name, 1, 0)
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+        if converter is not None:
+            flush()
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return result
+
+
+def import_file(file_path: str, **kwargs) -> ImportResult:
+    """Import a json or binary dump, the format is detected from its first bytes."""
+    from core import binary
+
+    if binary.is_binary_file(file_path):
+        with binary.BinaryDumpReader(file_path) as reader:
+            return import_rows(reader.rows(), **kwargs)
+    with open(file_path) as f:
+        return import_dump(f, **kwargs)
@@ -0,0 +1,45 @@
+"""This file resolves the user that time is recorded for. Many users can share one
+database, every job, clok, journal entry and state row belongs to one of them. Only the
+standard library is used so that the fast path and the daemon client can import it. """
+import getpass
+import os
+from contextvars import ContextVar, Token
+from typing import List, Optional, Tuple
+
+from core.defines import DEFAULT_USER, USER_ENVIRONMENT_VARIABLE
+
+# set by the --user option, a context variable so that threads and asyncio tasks can
+# act for different users
+_user: ContextVar[Optional[str]] = ContextVar("clok_user", default=None)
+
+
+def set_user(name: Optional[str]) -> Token:
+    """Record time for ``name`` in the current context, None restores the default.
+    Returns a token that ``reset_user`` takes to undo the change."""
+    return _user.set(name.lower() if name else None)
+
+
+def reset_user(token: Token):
+    _user.reset(token)
+
+
+def current_user() -> str:
+    """Return the name of the user set with ``set_user``, $CLOK_USER or the login
+    name, in that order. User names are stored lowercase only."""
+    name = _user.get() or os.environ.get(USER_ENVIRONMENT_VARIABLE)
+    if not name:
+        try:
+            name = getpass.getuser()
+        except Exception:
+            name = DEFAULT_USER
+    return name.lower()
+
+
+def split_user_option(args: List[str]) -> Tuple[Optional[str], List[str]]:
+    """Split a leading ``--user`` option off command line arguments, for the entry
+    points that look at the command before the cli parses it."""
+    if len(args) >= 2 and args[0] == "--user":
+        return args[1], args[2:]
+    if args and args[0].startswith("--user="):
+        return args[0][len("--user=") :], args[1:]
+    return None, args
@@ -1,24 +1,44 @@
 """ This file contains our SqlAlchemy connection generator function which generates
 session factories for our databases. It also has a few utility functions that get used
 throughout the application. """
+import sys
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from multiprocessing import Lock
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 from sqlalchemy.pool import QueuePool
 
+from core.sqlite_utils import apply_pragmas
+
+# key of the unit of work nesting depth in Session.info
+_UNIT_OF_WORK_DEPTH = "unit_of_work_depth"
+
+
+def _session_scope():
+    """Scope sessions by thread and, inside a running event loop, by asyncio task so
+    that concurrent tasks on one thread don't share a session either. The task itself
+    is part of the key, not its id, ids are reused once a task is gone."""
+    task = None
+    # only look for a task if something already imported asyncio
+    if "asyncio" in sys.modules:
+        try:
+            task = sys.modules["asyncio"].current_task()
+        except RuntimeError:
+            pass
+    return threading.get_ident(), task
+
 
 class SqlAlchemyConnGenerator:
     """
     Stores configuration information for sql database connection and implements helper
     methods for the generation of a session maker, sessions and engines.
     Defaults to using the SingletonThreadPool for use in multi-threaded applications.
+    Sessions are kept in a scoped registry, every thread and asyncio task gets its own.
     """
 
-    _lock: Lock
-
     def __init__(
         self,
         user="",
@@ -36,19 +56,20 @@ class SqlAlchemyConnGenerator:
         self._host_port = port or 3306
         self._database_type = db_type or "mysql+mysqlconnector"
         self._uri_string = "{0}://{1}:{2}@{3}:{4}/{5}"
-        self._lock = Lock()
 
         if "pool_size" in kwargs:
             self._pool_size = kwargs.get("pool_size")
         else:
             self._pool_size = None
         self._sqlite_db = kwargs.get("sqlite_db", False)
+        self._sqlite_pragmas = kwargs.get("sqlite_pragmas", {})
         self._pool_type = kwargs.get("pool_type", QueuePool)
         self._echo = kwargs.get("echo", False)
 
         self._engine = None
         self._maker = None
-        self._current_session = None
+        self._registry = None
+        self._engine_listeners = []
 
     @property
     def sqlite_db(self):
@@ -56,13 +77,26 @@ class SqlAlchemyConnGenerator:
 
     @sqlite_db.setter
     def sqlite_db(self, test):
+        if test != self._sqlite_db:
+            self.dispose()
         self._sqlite_db = test
 
+    def dispose(self):
+        """Close the current session and drop the engine, the next use reconnects."""
+        if self._registry is not None:
+            self._registry.remove()
+        if self._engine is not None:
+            self._engine.dispose()
+        self._engine = None
+        self._maker = None
+        self._registry = None
+
     @property
     def engine(self) -> Engine:
         if self._engine is None:
             if self._sqlite_db:
                 self._engine = create_engine(self.db_uri, echo=self._echo)
+                event.listen(self._engine, "connect", self._on_sqlite_connect)
             else:
                 self._engine = create_engine(
                     self.db_uri,
@@ -70,8 +104,25 @@ class SqlAlchemyConnGenerator:
                     echo=self._echo,
                     pool_size=self._pool_size or 0,
                 )
+            for name, fn in self._engine_listeners:
+                event.listen(self._engine, name, fn)
         return self._engine
 
+    def listen(self, name: str, fn):
+        """Listen for the engine event ``name``, on this engine and the ones created
+        after it when the database changes."""
+        self._engine_listeners.append((name, fn))
+        if self._engine is not None:
+            event.listen(self._engine, name, fn)
+
+    def remove_listener(self, name: str, fn):
+        self._engine_listeners.remove((name, fn))
+        if self._engine is not None and event.contains(self._engine, name, fn):
+            event.remove(self._engine, name, fn)
+
+    def _on_sqlite_connect(self, dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, self._sqlite_pragmas)
+
     @property
     def port(self):
         return self._host_port
@@ -93,38 +144,88 @@ class SqlAlchemyConnGenerator:
                 self._db_name,
             )
 
-    def maker(self):
+    def maker(self) -> Session:
         if self._maker is None:
             self._maker = sessionmaker(
                 bind=self.engine, autocommit=False, autoflush=False
             )
         return self._maker()
 
+    @property
+    def registry(self) -> scoped_session:
+        if self._registry is None:
+            self._registry = scoped_session(self.maker, scopefunc=_session_scope)
+        return self._registry
+
     def make_new_session(self):
-        self._current_session = self.maker()
+        """Close the session of the current thread or task, the next use of ``session``
+        starts a new one."""
+        self.registry.remove()
+
+    def remove_session(self):
+        """Close and forget the session of the current thread or task. Threads that are
+        done with the database should call this to release their session, the session
+        of an asyncio task is removed when the task finishes."""
+        if self._registry is not None:
+            self._registry.remove()
 
     @property
-    def session(self):
-        if self._current_session is None:
-            self.make_new_session()
-        return self._current_session
+    def session(self) -> Session:
+        registry = self.registry
+        if not registry.registry.has():
+            scope = _session_scope()
+            task = scope[1]
+            if task is not None:
+                # a task's session is removed with the task, nothing else would
+                task.add_done_callback(lambda _: self._remove_scope(scope))
+        return registry()
+
+    def _remove_scope(self, scope):
+        if self._registry is not None:
+            session = self._registry.registry.registry.pop(scope, None)
+            if session is not None:
+                session.close()
 
     def create_tables(self, base):
         base.metadata.create_all(self.engine)
 
     @property
-    def locked_session(self):
-        # with self._lock:
+    def locked_session(self) -> Session:
+        # sessions are no longer shared between threads so there is nothing to lock,
+        # kept for compatibility
         return self.session
 
+    @contextmanager
+    def unit_of_work(self):
+        """Group the work done in the block into one transaction on the current
+        session. The outermost block commits once when it exits and rolls back if it
+        raises, nested blocks join the transaction of the enclosing one.
+
+        ::
+
+            with DB.unit_of_work() as session:
+                session.add(record)
+        """
+        session = self.session
+        depth = session.info.get(_UNIT_OF_WORK_DEPTH, 0)
+        session.info[_UNIT_OF_WORK_DEPTH] = depth + 1
+        try:
+            yield session
+            if not depth:
+                session.commit()
+        except BaseException:
+            if not depth:
+                session.rollback()
+            raise
+        finally:
+            session.info[_UNIT_OF_WORK_DEPTH] = depth
+
     @property
     def spawn_unique_session(self):
         """
         This property is used whenever we want to spawn a totally unique session
-        instance. This is typically used in cases where we are doing things with threads
-        or processes. We also return the lock instance for this connection generator.
-        This way the threads or processes can each have their own unique session but can
-        still use a shared lock to prevent integrity errors.
+        instance, one that is not shared with the thread or task that created it. The
+        wrapper holds its own session which the caller is responsible for closing.
 
         :return:
         """
@@ -138,7 +239,6 @@ class SqlAlchemyConnGenerator:
 
             def __init__(self):
                 self._session = None
-                self._lock = class_self._lock
 
             @property
             def session(self):
@@ -148,8 +248,12 @@ class SqlAlchemyConnGenerator:
 
             @property
             def locked_session(self):
-                with self._lock:
-                    return self.session
+                return self.session
+
+            def remove_session(self):
+                if self._session is not None:
+                    self._session.close()
+                    self._session = None
 
         session_wrapper = SessionWrapper()
 
@@ -164,5 +268,3 @@ def to_json(data):
         return data.timestamp()
 
     return data
-
-
@@ -1,4 +1,6 @@
 import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
 from core.database import DB
 from core.models import Clok, Job, Journal, State
 import clok
@@ -13,3 +15,43 @@ def db():
     print(f"Journal: {Journal.count()}")
     print(f"job: {Job.count()}")
     print(f"state: {State.count()}")
+
+
+@pytest.fixture()
+def statements():
+    """Collects the sql statements executed while the test runs."""
+    log = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        log.append(statement)
+
+    event.listen(DB.engine, "before_cursor_execute", before_cursor_execute)
+    yield log
+    event.remove(DB.engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture()
+def commits():
+    """Counts the commits made while the test runs."""
+    log = []
+
+    def commit(conn):
+        log.append(conn)
+
+    event.listen(DB.engine, "commit", commit)
+    yield log
+    event.remove(DB.engine, "commit", commit)
+
+
+@pytest.fixture()
+def hydrated():
+    """Collects the class names of the instances loaded from rows while the test
+    runs."""
+    log = []
+
+    def load(target, context):
+        log.append(type(target).__name__)
+
+    event.listen(Mapper, "load", load)
+    yield log
+    event.remove(Mapper, "load", load)
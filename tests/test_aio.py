@@ -0,0 +1,85 @@
+import asyncio
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+import clok
+from core import aio
+from core.database import DB
+from core.models import Clok, State
+from core.transfer import dump_database
+
+
+@pytest.fixture()
+def file_db(tmp_path):
+    DB.sqlite_db = str(tmp_path / "async.db")
+    clok.init(True)
+    adb = aio.AsyncConnGenerator(sqlite_db=DB.sqlite_db)
+    yield adb
+    # a test that failed half way leaves the connection's thread running
+    asyncio.run(adb.close())
+    DB.sqlite_db = True
+
+
+def test_async_api_matches_the_models(file_db):
+    when = datetime(2020, 10, 10, 8)
+
+    async def work():
+        clok_id = await aio.clock_in_when(when, "async in", db=file_db)
+        assert (await aio.get_last_record(db=file_db))["time_out"] is None
+        await aio.clock_out_when(when + timedelta(hours=2), "async out", db=file_db)
+        records = await aio.get_by_period("day", 20201010, db=file_db)
+        seconds = await aio.get_seconds("week", 202040, db=file_db)
+        dump = io.StringIO()
+        await aio.dump_database(dump, chunk_size=1, db=file_db)
+        await file_db.close()
+        return clok_id, records, seconds, dump.getvalue()
+
+    clok_id, records, seconds, dump = asyncio.run(work())
+
+    c = Clok.get_by_id(clok_id)
+    assert c.time_out == when + timedelta(hours=2)
+    assert c.get_journals == ["async in", "async out"]
+    assert records == [{k: v for k, v in c.to_dict.items() if k != "journals"}]
+    assert seconds == Clok.get_seconds("week", 202040) == 2 * 60 * 60
+    expected = io.StringIO()
+    dump_database(expected)
+    assert json.loads(dump) == json.loads(expected.getvalue())
+
+
+def test_concurrent_coroutines(file_db):
+    start = datetime(2020, 10, 12, 8)
+
+    async def worker(n):
+        when = start + timedelta(minutes=n)
+        clok_id = await aio.clock_in_when(when, db=file_db)
+        await aio.clock_out_when(
+            when + timedelta(seconds=30), clok_id=clok_id, db=file_db
+        )
+
+    async def work():
+        await asyncio.gather(*(worker(n) for n in range(50)))
+        hours = await aio.get_hours("day", 20201012, db=file_db)
+        await file_db.close()
+        return hours
+
+    assert asyncio.run(work()) == 50 * 30 / 3600
+    State.invalidate()
+    assert Clok.query().filter(Clok.time_span == 30).count() == 50
+
+
+def test_unit_of_work_rolls_back(file_db):
+    async def work():
+        with pytest.raises(RuntimeError):
+            async with file_db.unit_of_work():
+                await aio.clock_in_when(datetime(2020, 10, 13, 8), db=file_db)
+                raise RuntimeError()
+        records = await aio.get_by_period("day", 20201013, db=file_db)
+        await file_db.close()
+        return records
+
+    assert asyncio.run(work()) == []
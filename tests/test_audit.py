@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from .fixtures import db
+from core.audit import audit_records
+from core.models import Clok, DailyTotal, Job
+from core.users import reset_user, set_user
+
+NOW = datetime(2016, 6, 20)
+
+
+@pytest.fixture()
+def auditor(db):
+    # fixes only touch the records of their own user
+    token = set_user("auditor")
+    yield
+    reset_user(token)
+
+
+def _ids(pairs):
+    return [(a.id, b.id) for a, b in pairs]
+
+
+def test_audit_finds_and_fixes_overlaps(auditor):
+    day = datetime(2016, 6, 6)
+    ids = []
+    for start, end in ((8, 12), (9, 10), (11, 13), (15, 16)):
+        hours = timedelta(hours=start), timedelta(hours=end)
+        ids.append(Clok.add_span(day + hours[0], day + hours[1], f"{start}").id)
+    left_open = Clok.clock_in_when(datetime(2016, 6, 7, 8)).id
+
+    result = audit_records(now=NOW)
+    assert _ids(result.overlaps) == [(ids[0], ids[1]), (ids[0], ids[2])]
+    assert [c.id for c in result.open] == [left_open]
+    assert [(start.hour, end.hour) for _, start, end in result.gaps] == [(13, 15)]
+
+    fixed = audit_records(fix=True, now=NOW)
+    assert (fixed.merged, fixed.truncated) == (1, 1)
+    assert not audit_records(now=NOW).overlaps
+    records = Clok.get_by_date_key(20160606)
+    assert [(c.time_in.hour, c.time_out.hour) for c in records] == [
+        (8, 11),
+        (11, 13),
+        (15, 16),
+    ]
+    assert records[0].get_journals == ["8", "9"]
+    assert Clok.get_day_hours(20160606) == 6 * 3600
+    assert DailyTotal.stale() == 0
+
+
+def test_audit_across_jobs(auditor):
+    other = Job.create(name="audit-other").id
+    day = datetime(2016, 6, 9, 8)
+    Clok.bulk_create(
+        [
+            {"time_in": day, "time_out": day + timedelta(hours=2)},
+            {"time_in": day + timedelta(hours=1), "time_out": day + timedelta(hours=3)},
+        ]
+    )
+    Clok.bulk_create(
+        [{"time_in": day, "time_out": day + timedelta(hours=1), "job_id": other}]
+    )
+    (default_job, second), (other_job,) = (
+        Clok.get_by_date_key(20160609),
+        Clok.owned().filter(Clok.job_id == other).all(),
+    )
+    assert _ids(audit_records(now=NOW).overlaps) == [(default_job.id, second.id)]
+    across = audit_records(across_jobs=True, now=NOW).overlaps
+    assert _ids(across) == [(default_job.id, other_job.id), (default_job.id, second.id)]
+
+
+def test_audit_merges_records_starting_together(db):
+    # a user of its own, the records left by the test above would be fixed as well
+    token = set_user("auditor-same-start")
+    try:
+        day = datetime(2016, 6, 10)
+        Clok.add_span(day + timedelta(hours=8), day + timedelta(hours=10), "a")
+        Clok.add_span(day + timedelta(hours=8), day + timedelta(hours=12), "b")
+
+        fixed = audit_records(fix=True, now=NOW)
+        assert (fixed.merged, fixed.truncated) == (1, 0)
+        (record,) = Clok.get_by_date_key(20160610)
+        assert (record.time_in.hour, record.time_out.hour) == (8, 12)
+        assert sorted(record.get_journals) == ["a", "b"]
+    finally:
+        reset_user(token)
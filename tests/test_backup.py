@@ -0,0 +1,37 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from .fixtures import db
+from core.backup import backup, is_compressed, restore
+from core.models import Clok
+
+
+def test_backup_and_restore(db, tmp_path):
+    Clok(time_in=datetime(2016, 2, 1, 8), date_key=20160201).save()
+    plain, compressed = str(tmp_path / "b.db"), str(tmp_path / "b.db.gz")
+    pages = []
+    backup(plain, pages=1, progress=lambda copied, total: pages.append(copied))
+    assert len(pages) > 1 and pages[-1] > pages[0]
+    backup(compressed, compress=True)
+    assert is_compressed(compressed) and not is_compressed(plain)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.db", "b.db.gz"]
+
+    with sqlite3.connect(plain) as connection:
+        count = "SELECT count(*) FROM time_clok WHERE date_key = 20160201"
+        assert connection.execute(count).fetchone() == (1,)
+
+    Clok(time_in=datetime(2016, 2, 2, 8), date_key=20160202).save()
+    assert restore(compressed) == 0
+    assert len(Clok.get_by_date_key(20160201)) == 1
+    assert Clok.get_by_date_key(20160202) == []
+
+
+def test_restore_rejects_other_files(db, tmp_path):
+    Clok(time_in=datetime(2016, 2, 3, 8), date_key=20160203).save()
+    path = tmp_path / "notes.txt"
+    path.write_text("not a database " * 100)
+    with pytest.raises(ValueError):
+        restore(str(path))
+    assert len(Clok.get_by_date_key(20160203)) == 1
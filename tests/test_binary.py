@@ -0,0 +1,55 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from .fixtures import db
+from core import binary
+from core.models import ChangeSequence, Clok
+from core.transfer import (
+    DELTA_SECTION,
+    DumpFormatError,
+    dump_database,
+    import_file,
+    iter_dump_rows,
+)
+
+
+def test_binary_dump_reads_back_like_the_json_dump(db, tmp_path):
+    c = Clok(time_in=datetime(2017, 6, 5, 9, 30, 15, 250), date_key=20170605)
+    c.save()
+    c.add_journal("binary ünïcode entry")
+    c.add_journal("binary ünïcode entry")
+    path = str(tmp_path / "dump.bin")
+    counts = binary.dump_file(path, chunk_size=3)
+
+    json_dump = io.StringIO()
+    assert dump_database(json_dump) == counts
+    json_dump.seek(0)
+    with binary.BinaryDumpReader(path) as reader:
+        assert list(reader.rows()) == list(iter_dump_rows(json_dump))
+
+    result = import_file(path)
+    assert result.inserted == 0
+    assert result.skipped == sum(counts.values())
+
+
+def test_binary_delta_dump(db, tmp_path):
+    marker = ChangeSequence.current()
+    Clok(time_in=datetime(2017, 6, 6, 9), date_key=20170606).save()
+    path = str(tmp_path / "delta.bin")
+    counts = binary.dump_file(path, since=marker)
+    assert counts["time_clok"] == 1
+
+    with binary.BinaryDumpReader(path) as reader:
+        rows = list(reader.rows())
+    assert rows[0] == (DELTA_SECTION, dict(since=marker, marker=marker + 1))
+    assert import_file(path).tables["time_clok"]["skipped"] == 1
+
+
+def test_binary_reader_rejects_other_files(tmp_path):
+    path = tmp_path / "dump.bin"
+    path.write_bytes(binary.MAGIC + b"\x07\x00")
+    with pytest.raises(DumpFormatError):
+        with binary.BinaryDumpReader(str(path)):
+            pass
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from .fixtures import commits, db, statements
+from core.database import DB
+from core.models import Clok, Journal, State
+from core.users import reset_user, set_user
+
+
+def test_bulk_create_update_and_delete(db, statements, commits):
+    start = datetime(2016, 5, 2, 8)
+    rows = [
+        {
+            "time_in": start + timedelta(hours=n),
+            "time_out": start + timedelta(hours=n, minutes=30),
+        }
+        for n in range(5)
+    ]
+    State.current()
+    statements.clear()
+    assert Clok.bulk_create(rows, chunk_size=2) == 5
+    assert len(statements) == 3 and len(commits) == 1
+
+    records = Clok.get_by_date_key(20160502)
+    assert [c.time_span for c in records] == [1800] * 5
+    assert {(c.week_key, c.month_key) for c in records} == {(201618, 201605)}
+    assert Clok.get_day_hours(20160502) == 5 * 1800
+
+    ids = [c.id for c in records]
+    commits.clear()
+    with Clok.unit_of_work():
+        Clok.bulk_update([{"id": i, "time_span": 600} for i in ids[:2]])
+        Journal.bulk_create([{"clok_id": i, "entry": "bulk"} for i in ids])
+        assert Clok.bulk_delete(ids[4:]) == 1
+        assert not commits
+    assert len(commits) == 1
+    DB.session.expire_all()
+    assert [c.time_span for c in Clok.get_by_date_key(20160502)] == [
+        600,
+        600,
+        1800,
+        1800,
+    ]
+    assert Journal.owned().filter(Journal.entry == "bulk").count() == 5
+
+
+def test_bulk_changes_are_scoped_to_the_user(db):
+    State.current()
+    Clok.bulk_create([{"time_in": datetime(2016, 5, 3, 8)}])
+    (record,) = Clok.get_by_date_key(20160503)
+    token = set_user("bulk-other")
+    try:
+        assert Clok.bulk_update([{"id": record.id, "time_span": 1}]) == 0
+        assert Clok.bulk_delete([record.id]) == 0
+    finally:
+        reset_user(token)
+    DB.session.expire_all()
+    assert Clok.get_by_id(record.id).time_span == 0
+    assert record.user_id == State.get_user_id()
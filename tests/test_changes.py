@@ -0,0 +1,95 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from .fixtures import db
+import clok
+from core.database import DB
+from core.models import ChangeSequence, Clok, Journal, State, Tombstone
+from core.transfer import DELTA_SECTION, dump_database, import_dump, iter_dump_rows
+
+
+@pytest.fixture()
+def databases(tmp_path):
+    """Switches between two file databases, the source and its archive."""
+
+    def use(name):
+        DB.sqlite_db = str(tmp_path / f"{name}.db")
+        clok.init(True)
+
+    yield use
+    DB.sqlite_db = True
+
+
+def _rows(model):
+    columns = [c for c in model.__table__.columns if c.name != "change_seq"]
+    return DB.session.query(*columns).order_by(model.id).all()
+
+
+def test_changes_are_sequenced_and_deletes_leave_tombstones(db):
+    marker = ChangeSequence.current()
+    when = datetime(2018, 4, 2, 8)
+    c = Clok.clock_in_when(when)
+    assert c.change_seq > marker
+    State.invalidate()
+
+    Clok.clok_out_by_id(c.id, when + timedelta(hours=1))
+    DB.session.refresh(c)
+    changed = c.change_seq
+    assert changed == ChangeSequence.current()
+
+    Clok.delete_by_id(c.id)
+    tombstone = Tombstone.query().filter(Tombstone.row_id == c.id).one()
+    assert tombstone.table_name == "time_clok"
+    assert tombstone.change_seq > changed
+
+    f = io.StringIO()
+    counts = dump_database(f, since=marker)
+    assert counts["time_clok"] == 0
+    assert counts["time_clok_tombstones"] == 1
+    f.seek(0)
+    rows = list(iter_dump_rows(f))
+    assert rows[0] == (
+        DELTA_SECTION,
+        dict(since=marker, marker=ChangeSequence.current()),
+    )
+
+
+def test_delta_import_replays_the_changes(databases):
+    databases("source")
+    when = datetime(2018, 5, 7, 8)
+    kept = Clok.clock_in_when(when)
+    Clok.clok_out_by_id(kept.id, when + timedelta(hours=1))
+    removed = Clok.clock_in_when(when + timedelta(hours=2))
+    Clok.clok_out_by_id(removed.id, when + timedelta(hours=3))
+    full = io.StringIO()
+    marker = ChangeSequence.current()
+    dump_database(full)
+
+    Clok.clok_out_by_id(kept.id, when + timedelta(hours=1, minutes=30))
+    added = Clok.clock_in_when(when + timedelta(hours=4))
+    added.add_journal("new")
+    added = added.id
+    Clok.delete_by_id(removed.id)
+    delta = io.StringIO()
+    dump_database(delta, since=marker)
+    expected = _rows(Clok), _rows(Journal), _rows(State)
+
+    databases("archive")
+    full.seek(0)
+    import_dump(full)
+    delta.seek(0)
+    result = import_dump(delta)
+    assert result.delta["since"] == marker
+    assert result.tables["time_clok"]["updated"] == 1
+    assert result.tables["time_clok"]["inserted"] == 1
+    assert result.tables["time_clok_tombstones"]["deleted"] == 1
+    assert (_rows(Clok), _rows(Journal), _rows(State)) == expected
+    assert Clok.get_seconds("day", 20180507, all_jobs=True) == 90 * 60
+    assert Clok.get_by_id(added).get_journals == ["new"]
+
+    delta.seek(0)
+    result = import_dump(delta)
+    assert (result.inserted, result.updated, result.deleted) == (0, 0, 0)
+    assert (_rows(Clok), _rows(Journal), _rows(State)) == expected
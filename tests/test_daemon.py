@@ -0,0 +1,53 @@
+import io
+import socket
+import threading
+
+from .fixtures import db
+from core import daemon
+
+
+class _Output(io.StringIO):
+    def isatty(self):
+        return False
+
+
+def test_execute_runs_commands_and_hands_back_prompts(db):
+    out = _Output()
+    assert daemon.execute(["status"], out) == 0
+    assert out.getvalue().startswith("Clocked")
+
+    out = _Output()
+    assert daemon.execute(["show", "--bogus"], out) == 2
+    assert "no such option" in out.getvalue()
+
+    daemon.execute(["in", "2000-01-01 08:00"], _Output())
+    assert daemon.execute(["out"], _Output()) == daemon.EXIT_NEEDS_TERMINAL
+
+
+def test_forward_streams_output_and_exit_code(tmp_path):
+    path = str(tmp_path / "clok.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+
+    def serve_one():
+        connection, _ = server.accept()
+        with connection:
+            request = connection.makefile().readline()
+            assert '"argv": ["show"]' in request
+            connection.sendall(b"first line\n")
+            connection.sendall(b"second line\n\x003")
+
+    thread = threading.Thread(target=serve_one)
+    thread.start()
+    out = io.BytesIO()
+    assert daemon.forward(["show"], path=path, out=out) == 3
+    thread.join()
+    server.close()
+    assert out.getvalue() == b"first line\nsecond line\n"
+
+
+def test_forward_without_daemon(tmp_path):
+    path = str(tmp_path / "missing.sock")
+    assert daemon.forward(["show"], path=path) is None
+    assert daemon.forward(["delete", "1"], path=path) is None
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import clok
+from core.database import DB
+from core.models import Clok, Job, State
+from core.utils import SqlAlchemyConnGenerator
+from .fixtures import db, statements
+
+
+def test_sqlite_pragmas_are_applied_per_connection(tmp_path):
+    db = SqlAlchemyConnGenerator(
+        sqlite_db=str(tmp_path / "tuned.db"),
+        sqlite_pragmas={
+            "journal_mode": "wal",
+            "synchronous": "normal",
+            "busy_timeout": "1234",
+            "cache_size": "",
+        },
+    )
+    connection = db.engine.connect()
+    assert connection.execute("PRAGMA journal_mode").scalar() == "wal"
+    assert connection.execute("PRAGMA synchronous").scalar() == 1
+    assert connection.execute("PRAGMA busy_timeout").scalar() == 1234
+    assert connection.execute("PRAGMA cache_size").scalar() == -2000
+    connection.close()
+
+
+def test_engine_listeners_follow_new_engines():
+    db = SqlAlchemyConnGenerator(sqlite_db=True)
+    log = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        log.append(statement)
+
+    db.listen("before_cursor_execute", before_cursor_execute)
+    db.engine.execute("SELECT 1")
+    db.dispose()
+    db.engine.execute("SELECT 2")
+    db.remove_listener("before_cursor_execute", before_cursor_execute)
+    db.engine.execute("SELECT 3")
+    assert log == ["SELECT 1", "SELECT 2"]
+
+
+def test_sqlite_pragma_values_are_validated(tmp_path):
+    db = SqlAlchemyConnGenerator(
+        sqlite_db=str(tmp_path / "bad.db"),
+        sqlite_pragmas={"synchronous": "off; DROP TABLE x"},
+    )
+    with pytest.raises(ValueError):
+        db.engine.connect()
+
+
+def test_unit_of_work_commits_once(db, statements):
+    with DB.unit_of_work():
+        Job.create(name="uow-a")
+        with DB.unit_of_work():
+            Job.create(name="uow-b")
+        assert not any(s == "COMMIT" for s in statements)
+    DB.session.rollback()
+    assert {"uow-a", "uow-b"} <= {j.name for j in Job.query()}
+
+
+def test_unit_of_work_rolls_back(db):
+    with pytest.raises(RuntimeError):
+        with DB.unit_of_work():
+            Job.create(name="uow-c")
+            with DB.unit_of_work():
+                Job.create(name="uow-d")
+            raise RuntimeError()
+    assert Job.query().filter(Job.name.in_(["uow-c", "uow-d"])).count() == 0
+
+
+def test_sessions_are_thread_local(db):
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(DB.session))
+    thread.start()
+    thread.join()
+    assert sessions[0] is not DB.session
+
+
+def test_parallel_clock_in_and_out(tmp_path):
+    DB.sqlite_db = str(tmp_path / "threads.db")
+    threads, rounds = 8, 25
+    start = datetime(2020, 10, 10, 8)
+    errors = []
+
+    def work(n):
+        try:
+            for i in range(rounds):
+                when = start + timedelta(minutes=n * rounds + i)
+                c = Clok.clock_in_when(when)
+                Clok.clok_out_by_id(c.id, when + timedelta(seconds=30))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            DB.remove_session()
+
+    try:
+        clok.init(True)
+        workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert not errors
+        assert Clok.count() == threads * rounds
+        assert Clok.query().filter(Clok.time_span == 30).count() == threads * rounds
+        # the state ids are cached per session, this one has not seen the writes
+        State.invalidate()
+        assert State.get_clok_id() is not None
+    finally:
+        DB.sqlite_db = True
+
+
+def test_task_sessions_are_removed_with_the_task(db):
+    sessions = DB.registry.registry.registry
+    before = len(sessions)
+
+    async def work():
+        return DB.session
+
+    async def main():
+        seen = await asyncio.gather(*(asyncio.create_task(work()) for _ in range(200)))
+        # the done callbacks run on the next loop iteration
+        await asyncio.sleep(0)
+        return seen
+
+    seen = asyncio.run(main())
+    assert len({id(session) for session in seen}) == 200
+    assert len(sessions) == before
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core.date_utils import (
+    parse_date,
+    parse_date_and_time,
+    parse_date_time_junction,
+    parse_datetime,
+)
+
+
+def test_parse_datetime_forms():
+    expected = datetime(2020, 9, 1, 13, 5)
+    for text in (
+        "2020-09-01 13:05",
+        "2020-09-01 13:05:00",
+        "2020-09-01T13:05:00",
+        "2020-09-01 1:05pm",
+        "2020-09-01 01:05:00PM",
+        "2020-9-1 1:05 pm",
+        "2020-09-01 13:05:00.000000",
+    ):
+        assert parse_datetime(text) == expected, text
+    assert parse_datetime("2020-09-01 12:30am") == datetime(2020, 9, 1, 0, 30)
+    assert parse_datetime("2020-09-01 12:30pm") == datetime(2020, 9, 1, 12, 30)
+    assert parse_datetime("2020-09-01 13:05:00.25") == expected.replace(
+        microsecond=250000
+    )
+    # offsets are converted to local time
+    aware = datetime(2020, 9, 1, 13, 5, tzinfo=timezone.utc)
+    assert parse_datetime("2020-09-01T13:05:00+00:00") == aware.astimezone().replace(
+        tzinfo=None
+    )
+    assert parse_date("2020-09-01 13:05:00") == expected
+
+
+@pytest.mark.parametrize(
+    "text", ["2020-09-01 13:05pm", "2020-09-01 25:00", "2020-13-01 1:00", "tomorrow"]
+)
+def test_parse_datetime_rejects(text):
+    with pytest.raises(ValueError):
+        parse_datetime(text)
+
+
+def test_parse_date_and_time():
+    day = datetime(2021, 1, 2)
+    assert parse_date_and_time("9:15am", day) == datetime(2021, 1, 2, 9, 15)
+    assert parse_date_and_time("2020-09-01 9:15", day) == datetime(2020, 9, 1, 9, 15)
+    assert parse_date_and_time("17:45").date() == datetime.now().date()
+    assert parse_date_time_junction("2020-9-1 8:00-4:30pm") == (
+        datetime(2020, 9, 1, 8),
+        datetime(2020, 9, 1, 16, 30),
+    )
+
+
+def test_deltas_are_relative_to_now():
+    earlier = parse_date_and_time("_5m")
+    assert abs(datetime.now() - timedelta(minutes=5) - earlier) < timedelta(seconds=5)
+    later = parse_date_and_time("+2H")
+    assert abs(datetime.now() + timedelta(hours=2) - later) < timedelta(seconds=5)
+    with pytest.raises(ValueError):
+        parse_date_and_time("+5d")
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from .fixtures import db
+from core import fastpath
+from core.database import DB
+from core.models import Clok, State
+
+
+def _raw_connection():
+    return DB.session.connection().connection.connection
+
+
+def test_fast_path_writes_what_the_models_write(db):
+    connection = _raw_connection()
+    when = datetime(2015, 6, 7, 8, 9, 10)
+    clok_id = fastpath.clock_in(connection, when, "fast in")
+    State.invalidate()
+    DB.session.expire_all()
+
+    c = Clok.get_last_record()
+    assert c.id == clok_id
+    assert (c.time_in, c.time_out, c.time_span) == (when, None, 0)
+    assert (c.date_key, c.week_key, c.month_key) == (20150607, 201523, 201506)
+    assert c.get_journals == ["fast in"]
+    assert fastpath.status(connection).startswith("Clocked in to 'default'")
+
+    fastpath.clock_out(connection, datetime(2015, 6, 7, 9, 9, 10), "fast out")
+    DB.session.expire_all()
+    c = Clok.get_by_id(clok_id)
+    assert c.time_out == datetime(2015, 6, 7, 9, 9, 10)
+    assert c.time_span == 60 * 60
+    assert c.get_journals == ["fast in", "fast out"]
+    assert fastpath.status(connection) == "Clocked out of 'default'"
+
+
+def test_fast_path_falls_back(db):
+    assert not fastpath.run(["show"])
+    assert not fastpath.run(["in", "--when", "8:00"])
+    assert not fastpath.run(["status", "--help"])
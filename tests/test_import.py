@@ -0,0 +1,74 @@
+import io
+import json
+from datetime import datetime
+
+from .fixtures import db
+from core.models import Clok, Job
+from core.transfer import dump_file, import_dump, import_file, iter_dump_rows
+
+
+def _dump(cloks, jobs=(), journals=()):
+    return io.StringIO(
+        json.dumps(
+            {
+                "time_clok_jobs": list(jobs),
+                "time_clok_state": [],
+                "time_clok": list(cloks),
+                "time_clok_journal": list(journals),
+            }
+        )
+    )
+
+
+def test_iter_dump_rows_small_reads():
+    f = _dump([{"time_in": 1.0}, {"time_in": 2.0}], jobs=[{"name": "a"}])
+    rows = list(iter_dump_rows(f, read_size=3))
+    assert rows == [
+        ("time_clok_jobs", {"name": "a"}),
+        ("time_clok", {"time_in": 1.0}),
+        ("time_clok", {"time_in": 2.0}),
+    ]
+
+
+def test_import_skips_duplicates_and_invalid_rows(db):
+    time_in = datetime(2019, 3, 4, 8).timestamp()
+    time_out = datetime(2019, 3, 4, 17).timestamp()
+    cloks = [
+        {"time_in": time_in, "time_out": time_out},
+        {"time_in": time_in, "time_out": time_out},
+        {"time_out": time_out},
+    ]
+    jobs = [{"name": "Import-Job"}, {"name": "default"}]
+    result = import_dump(_dump(cloks, jobs), chunk_size=2)
+
+    assert result.tables["time_clok_jobs"]["inserted"] == 1
+    assert result.tables["time_clok_jobs"]["skipped"] == 1
+    assert result.tables["time_clok"]["inserted"] == 1
+    assert result.tables["time_clok"]["skipped"] == 2
+    assert Job.query().filter(Job.name == "import-job").count() == 1
+
+    c = Clok.get_by_date_key(20190304)[0]
+    assert c.time_in == datetime(2019, 3, 4, 8)
+    assert c.time_span == 9 * 60 * 60
+
+    result = import_dump(_dump(cloks, jobs))
+    assert result.inserted == 0
+
+
+def test_dump_round_trip(db, tmp_path):
+    clok_in = datetime(2019, 5, 6, 9)
+    c = Clok(time_in=clok_in, time_out=datetime(2019, 5, 6, 10), date_key=20190506)
+    c.save()
+    c.add_journal("round trip")
+
+    path = str(tmp_path / "dump.json")
+    counts = dump_file(path, chunk_size=2)
+    assert counts["time_clok"] == Clok.count()
+
+    with open(path) as f:
+        rows = [row for name, row in iter_dump_rows(f) if name == "time_clok_journal"]
+    assert {"clok_id": c.id, "entry": "round trip"}.items() <= rows[-1].items()
+
+    result = import_file(path)
+    assert result.inserted == 0
+    assert result.skipped == sum(counts.values())
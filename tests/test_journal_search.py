@@ -0,0 +1,72 @@
+from .fixtures import db
+import clok
+from core.models import Clok, Job, Journal
+from core.users import reset_user, set_user
+
+
+def _add(day: str, *entries: str) -> Clok:
+    clok.in_(f"{day} 08:00-09:00", out=None, m=None)
+    c = Clok.get_most_recent_record()
+    for entry in entries:
+        c.add_journal(entry)
+    return c
+
+
+def _ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_search_ranks_and_highlights(db):
+    _add("2022-02-01", "reviewed the zephyr release notes")
+    c = _add("2022-02-02", "zephyr zephyr, fixed the zephyr build")
+    _add("2022-02-03", "lunch")
+
+    rows = Journal.search("zephyr")
+    assert len(rows) == 2
+    assert rows[0][0] == c.journal_entries[0].id
+    assert rows[0][2] == "default"
+    assert "[zephyr]" in rows[0][3]
+
+    # prefix queries and boolean operators are fts5 syntax
+    assert len(Journal.search("zeph*")) == 2
+    assert len(Journal.search("zephyr NOT build")) == 1
+    # text that is not valid fts5 syntax is searched as words
+    _add("2022-02-04", "tracked down bug-123 in zephyr")
+    assert len(Journal.search('bug-123 "zephyr')) == 1
+    assert Journal.search("  ") == []
+
+
+def test_index_follows_updates_and_deletes(db):
+    c = _add("2022-03-01", "quokka sighting")
+    journal = c.journal_entries[0]
+    assert _ids(Journal.search("quokka")) == [journal.id]
+
+    journal.update(entry="wombat sighting")
+    assert Journal.search("quokka") == []
+    assert _ids(Journal.search("wombat")) == [journal.id]
+
+    Journal.delete_by_id(journal.id)
+    assert Journal.search("wombat") == []
+
+
+def test_search_filters(db, capsys):
+    _add("2022-04-04", "narwhal on monday")
+    Job(name="side").save()
+    clok.switch("side")
+    _add("2022-04-12", "narwhal on the side")
+
+    assert len(Journal.search("narwhal")) == 1
+    assert len(Journal.search("narwhal", all_jobs=True)) == 2
+    assert len(Journal.search("narwhal", "month", 202204, all_jobs=True)) == 2
+    assert len(Journal.search("narwhal", "day", 20220412, all_jobs=True)) == 1
+
+    token = set_user("search-other-user")
+    try:
+        assert Journal.search("narwhal", all_jobs=True) == []
+    finally:
+        reset_user(token)
+
+    clok.journal(None, None, True, "day", None, None, False, False, True, "narwhal", 5)
+    out = capsys.readouterr().out
+    assert "2 matching journal entries" in out and "[narwhal]" in out
+    clok.switch("default")
@@ -0,0 +1,76 @@
+import io
+from collections import Counter
+
+from .fixtures import db, hydrated, statements
+import clok
+from core.database import DB
+from core.models import Clok
+from core.transfer import DUMP_TABLES, dump_database
+
+
+def _seed_day(day: str, cloks: int, journals: int):
+    for hour in range(8, 8 + cloks):
+        clok.in_(f"{day} {hour}:00-{hour}:30", out=None, m=None)
+        c = Clok.get_most_recent_record()
+        for n in range(journals):
+            c.add_journal(f"entry {n}")
+    # start every measurement from an empty identity map
+    DB.session.expunge_all()
+
+
+def _selects(statements, table: str):
+    return [s for s in statements if s.startswith("SELECT") and f"FROM {table}" in s]
+
+
+def test_show_loads_journals_only_when_asked(db, statements, hydrated, capsys):
+    _seed_day("2021-05-05", cloks=3, journals=5)
+
+    statements.clear()
+    hydrated.clear()
+    clok.show("day", 20210505, False, False, False, False)
+    # the records and their job, nothing more
+    assert Counter(hydrated) == {"Clok": 3, "Job": 1}
+    assert "JID" not in capsys.readouterr().out
+    assert all("time_clok_journal" not in s for s in statements)
+    assert len(_selects(statements, "time_clok ")) == 1
+
+    DB.session.expunge_all()
+    statements.clear()
+    hydrated.clear()
+    clok.show("day", 20210505, True, False, False, False)
+    assert Counter(hydrated) == {"Clok": 3, "Job": 1, "Journal": 15}
+    assert capsys.readouterr().out.count("JID") == 15
+    # one query for the records and their jobs, one IN query for all the journals
+    assert len(_selects(statements, "time_clok ")) == 1
+    assert len(_selects(statements, "time_clok_journal")) == 1
+
+
+def test_journal_command_uses_one_query_for_the_entries(
+    db, statements, hydrated, capsys
+):
+    _seed_day("2021-05-06", cloks=4, journals=3)
+
+    statements.clear()
+    hydrated.clear()
+    clok.journal(
+        None, None, True, "day", "20210506", None, False, False, False, None, 20
+    )
+    assert Counter(hydrated) == {"Clok": 4, "Journal": 12}
+    assert capsys.readouterr().out.count("JID") == 12
+    assert len(_selects(statements, "time_clok ")) == 1
+    assert len(_selects(statements, "time_clok_journal")) == 1
+    # the records are not joined to their journals, so each is fetched once
+    assert all("JOIN" not in s for s in statements)
+
+
+def test_dump_reads_every_table_once(db, statements, hydrated):
+    _seed_day("2021-05-07", cloks=3, journals=2)
+
+    statements.clear()
+    hydrated.clear()
+    dump_database(io.StringIO())
+    # the rows are written as they are read, no model instances are built
+    assert hydrated == []
+    selects = [s for s in statements if s.startswith("SELECT")]
+    assert len(selects) == len(DUMP_TABLES)
+    assert all("JOIN" not in s for s in selects)
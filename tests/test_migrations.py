@@ -0,0 +1,136 @@
+from sqlalchemy import create_engine
+
+from core.database import BaseModel
+from core.migrations import (
+    CHANGE_TRIGGERS,
+    JOURNAL_FTS_TRIGGERS,
+    MIGRATIONS,
+    ROLLUP_TRIGGERS,
+    get_version,
+    migrate,
+)
+import core.models  # noqa: F401, registers the tables on BaseModel
+
+# the schema of a database created before migrations and users existed
+LEGACY_SCHEMA = (
+    """CREATE TABLE time_clok_jobs (
+        id INTEGER NOT NULL, name VARCHAR(64), PRIMARY KEY (id), UNIQUE (name)
+    )""",
+    """CREATE TABLE time_clok (
+        id INTEGER NOT NULL, job_id INTEGER NOT NULL, date_key INTEGER,
+        week_key INTEGER, month_key INTEGER, time_in DATETIME, time_out DATETIME,
+        time_span INTEGER, PRIMARY KEY (id),
+        CONSTRAINT "natural" UNIQUE (time_in, time_out),
+        FOREIGN KEY(job_id) REFERENCES time_clok_jobs (id)
+    )""",
+    """CREATE TABLE time_clok_state (
+        id INTEGER NOT NULL, job_id INTEGER, clok_id INTEGER, PRIMARY KEY (id),
+        FOREIGN KEY(job_id) REFERENCES time_clok_jobs (id),
+        FOREIGN KEY(clok_id) REFERENCES time_clok (id)
+    )""",
+    """CREATE TABLE time_clok_journal (
+        created_at DATETIME, modified_at DATETIME, id INTEGER NOT NULL,
+        clok_id INTEGER NOT NULL, time DATETIME, entry TEXT, PRIMARY KEY (id),
+        CONSTRAINT "natural" UNIQUE (id, time),
+        FOREIGN KEY(clok_id) REFERENCES time_clok (id)
+    )""",
+)
+
+
+def _legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    for statement in LEGACY_SCHEMA:
+        engine.execute(statement)
+    return engine
+
+
+def _indexes(engine):
+    rows = engine.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'"
+    )
+    return {row[0] for row in rows}
+
+
+def test_migrate_upgrades_old_database(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    assert _indexes(engine) == set()
+
+    assert migrate(engine) == len(MIGRATIONS)
+    assert "ix_time_clok_user_job_date" in _indexes(engine)
+    assert "ix_time_clok_job_date" not in _indexes(engine)
+    with engine.connect() as connection:
+        assert get_version(connection) == len(MIGRATIONS)
+
+    assert migrate(engine) == 0
+
+
+def test_migrations_match_a_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    BaseModel.metadata.create_all(engine)
+    expected = _indexes(engine)
+
+    assert migrate(engine) == len(MIGRATIONS)
+    assert _indexes(engine) == expected
+    triggers = engine.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+    assert {row[0] for row in triggers} == {
+        *ROLLUP_TRIGGERS,
+        *JOURNAL_FTS_TRIGGERS,
+        *CHANGE_TRIGGERS,
+    }
+
+
+def test_migrate_qualifies_week_and_month_keys(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    engine.execute(
+        "INSERT INTO time_clok (job_id, date_key, week_key, month_key, time_in) "
+        "VALUES (1, 20201010, 40, 10, '2020-10-10 08:00:00.000000')"
+    )
+
+    migrate(engine)
+    row = engine.execute("SELECT week_key, month_key FROM time_clok").fetchone()
+    assert tuple(row) == (202040, 202010)
+
+
+def test_migrate_gives_old_records_to_the_upgrading_user(tmp_path, monkeypatch):
+    monkeypatch.setenv("CLOK_USER", "Alice")
+    engine = _legacy_engine(tmp_path)
+    engine.execute("INSERT INTO time_clok_jobs (id, name) VALUES (1, 'default')")
+    engine.execute(
+        "INSERT INTO time_clok (id, job_id, date_key, week_key, month_key, time_in, "
+        "time_out) VALUES (1, 1, 20201010, 202040, 202010, "
+        "'2020-10-10 08:00:00.000000', '2020-10-10 09:00:00.000000')"
+    )
+    engine.execute("INSERT INTO time_clok_state (id, job_id, clok_id) VALUES (1, 1, 1)")
+    engine.execute(
+        "INSERT INTO time_clok_journal (id, clok_id, entry) VALUES (1, 1, 'hello')"
+    )
+
+    migrate(engine)
+    assert engine.execute("SELECT id, name FROM time_clok_users").fetchall() == [
+        (1, "alice")
+    ]
+    for table in (
+        "time_clok_jobs",
+        "time_clok",
+        "time_clok_state",
+        "time_clok_journal",
+    ):
+        assert engine.execute(f"SELECT user_id FROM {table}").fetchall() == [(1,)]
+    assert engine.execute("SELECT clok_id FROM time_clok_state").scalar() == 1
+    assert engine.execute(
+        "SELECT user_id, job_id, date_key, seconds, records FROM time_clok_daily_totals"
+    ).fetchall() == [(1, 1, 20201010, 0, 1)]
+    assert engine.execute(
+        "SELECT rowid FROM time_clok_journal_fts WHERE time_clok_journal_fts "
+        "MATCH 'hello'"
+    ).fetchall() == [(1,)]
+
+    # natural keys are unique per user now
+    engine.execute("INSERT INTO time_clok_users (id, name) VALUES (2, 'bob')")
+    engine.execute(
+        "INSERT INTO time_clok_jobs (id, name, user_id) VALUES (2, 'default', 2)"
+    )
+    engine.execute(
+        "INSERT INTO time_clok (job_id, time_in, time_out, user_id) VALUES "
+        "(2, '2020-10-10 08:00:00.000000', '2020-10-10 09:00:00.000000', 2)"
+    )
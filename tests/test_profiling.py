@@ -0,0 +1,40 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from .fixtures import db
+from core.models import Clok
+from core.profiling import PROFILE_SCHEMA_VERSION, Profile, parse_profilers
+
+
+def test_profile_reports_statements_commits_and_rows(db, tmp_path):
+    profile = Profile("show", ["tracemalloc"], directory=str(tmp_path))
+    profile.start()
+    Clok(time_in=datetime(2016, 3, 1, 8), date_key=20160301).save()
+    assert len(Clok.get_by_date_key(20160301)) == 1
+    report = profile.stop()
+
+    sql = report["sql"]
+    assert report["version"] == PROFILE_SCHEMA_VERSION
+    assert report["command"] == "show"
+    assert sql["commits"] == 1
+    assert sql["rows_hydrated"] >= 1
+    assert sql["statements"] == sum(s["count"] for s in sql["by_statement"])
+    assert any(s["statement"].startswith("INSERT") for s in sql["by_statement"])
+    assert report["tracemalloc"]["peak"] > 0 and report["cprofile"] is None
+    with open(report["path"]) as f:
+        assert json.load(f)["sql"]["commits"] == 1
+
+    # nothing is recorded once stopped
+    Clok(time_in=datetime(2016, 3, 2, 8), date_key=20160302).save()
+    assert profile.commits == 1
+
+
+def test_parse_profilers():
+    assert parse_profilers(None) is None
+    assert parse_profilers("0") is None
+    assert parse_profilers("1") == []
+    assert parse_profilers("tracemalloc, cProfile") == ["cprofile", "tracemalloc"]
+    with pytest.raises(ValueError):
+        Profile("show", ["perf"])
@@ -0,0 +1,76 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+from .fixtures import db
+import clok
+from core import fastpath
+from core.database import DB
+from core.models import Clok, DailyTotal
+from core.transfer import import_dump
+
+
+def _totals():
+    return [
+        (t.job_id, t.date_key, t.week_key, t.month_key, t.seconds, t.records)
+        for t in DailyTotal.query()
+        .filter(DailyTotal.month_key == 202103)
+        .order_by(DailyTotal.date_key)
+    ]
+
+
+def test_totals_follow_every_write(db):
+    when = datetime(2021, 3, 10, 8)
+    c = Clok.clock_in_when(when)
+    assert _totals() == [(1, 20210310, 202110, 202103, 0, 1)]
+
+    Clok.clok_out_by_id(c.id, when + timedelta(hours=2))
+    assert _totals() == [(1, 20210310, 202110, 202103, 7200, 1)]
+
+    clok.in_("2021-03-10 13:00-14:00", out=None, m=None)
+    clok.in_("2021-03-16 08:00-09:00", out=None, m=None)
+    assert _totals() == [
+        (1, 20210310, 202110, 202103, 10800, 2),
+        (1, 20210316, 202111, 202103, 3600, 1),
+    ]
+
+    Clok.delete_by_id(c.id)
+    assert _totals()[0] == (1, 20210310, 202110, 202103, 3600, 1)
+    Clok.delete_by_id(Clok.get_most_recent_record().id)
+    assert [t[1] for t in _totals()] == [20210310]
+    assert DailyTotal.stale() == 0
+
+
+def test_fast_path_and_import_update_the_totals(db):
+    connection = DB.session.connection().connection.connection
+    fastpath.clock_in(connection, datetime(2020, 11, 10, 8), None)
+    fastpath.clock_out(connection, datetime(2020, 11, 10, 9, 30), None)
+    assert Clok.get_seconds("day", 20201110) == 5400
+
+    dump = {
+        "time_clok": [
+            {
+                "id": 100,
+                "job_id": 1,
+                "time_in": "2020-11-11 08:00:00",
+                "time_out": "2020-11-11 10:00:00",
+            }
+        ]
+    }
+    import_dump(io.StringIO(json.dumps(dump)))
+    assert Clok.get_seconds("week", 202045) == 5400 + 7200
+    assert DailyTotal.stale() == 0
+
+
+def test_rebuild(db, capsys):
+    clok.in_("2020-12-10 08:00-09:00", out=None, m=None)
+    DB.session.execute(
+        "UPDATE time_clok_daily_totals SET seconds = 0 WHERE date_key = 20201210"
+    )
+    DB.session.commit()
+
+    clok.rollup(rebuild=False)
+    assert "1 out of date" in capsys.readouterr().out
+    clok.rollup(rebuild=True)
+    assert DailyTotal.stale() == 0
+    assert Clok.get_month_hours(202012) == 3600
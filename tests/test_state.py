@@ -0,0 +1,36 @@
+from .fixtures import db, statements
+import clok
+from core.models import Clok, Job, State
+
+
+def _state_queries(statements):
+    return [s for s in statements if s.startswith("SELECT") and "time_clok_state" in s]
+
+
+def test_state_is_queried_once_per_session(db, statements):
+    State.invalidate()
+    clok.in_(None, out=None, m="in")
+    # state read, then the clok, journal and state writes of one transaction
+    assert len(statements) == 4
+    clok.out(when=None, id=None, m="out")
+    clok.show("day", key=None, journal=False, week=False, month=False, all_jobs=False)
+    assert len(_state_queries(statements)) == 1
+
+
+def test_state_cache_follows_writes(db):
+    State.invalidate()
+    c = Clok.clock_in()
+    assert State.get_clok_id() == c.id
+    assert Clok.get_last_record().id == c.id
+
+    State.clear_clok()
+    assert State.get_clok_id() is None
+    State.db().rollback()
+    assert State.get_clok_id() == c.id
+
+    job = Job(name="state-test")
+    job.save()
+    State.set_job(job)
+    assert State.get_job_id() == job.id
+    assert State.get().job_id == job.id
+    State.set_job(Job.owned().filter(Job.name == "default").one())
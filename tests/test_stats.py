@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from .fixtures import db
+import clok
+from core import stats
+from core.models import Clok
+
+
+def test_to_arrays_reads_the_records(db):
+    clok.in_("2021-07-05 08:00-10:30", out=None, m=None)
+    clok.in_("2021-07-06 23:30", out=None, m=None)
+    Clok.clok_out_by_id(Clok.get_most_recent_record().id, datetime(2021, 7, 7, 1))
+    clok.in_("2021-07-07 09:00", out=None, m=None)
+
+    arrays = Clok.to_arrays("month", 202107)
+    assert all(a.flags["C_CONTIGUOUS"] for a in arrays.values())
+    assert arrays["time_in"].tolist() == [
+        datetime(2021, 7, 5, 8),
+        datetime(2021, 7, 6, 23, 30),
+        datetime(2021, 7, 7, 9),
+    ]
+    assert np.isnat(arrays["time_out"]).tolist() == [False, False, True]
+    assert arrays["time_span"].tolist() == [9000, 5400, 0]
+    assert arrays["job_id"].tolist() == [1, 1, 1]
+
+    heatmap = stats.weekday_hour_heatmap(arrays["time_in"], arrays["time_out"])
+    assert heatmap.sum() == 9000 + 5400
+    # monday 8:00-10:30, tuesday 23:30 to wednesday 1:00
+    assert heatmap[0, 8:11].tolist() == [3600, 3600, 1800]
+    assert (heatmap[1, 23], heatmap[2, 0]) == (1800, 3600)
+
+    days, seconds = stats.daily_seconds(arrays["time_in"], arrays["time_span"])
+    assert str(days[0]) == "2021-07-05" and seconds.tolist() == [9000, 5400, 0]
+    starts, weekly = stats.weekly_seconds(arrays["time_in"], arrays["time_span"])
+    # weeks start on sunday like the week keys
+    assert starts.astype(str).tolist() == ["2021-07-04"]
+    assert stats.overtime(weekly, 4).tolist() == [9000 + 5400 - 4 * 3600]
+
+    counts, _ = stats.span_histogram(arrays["time_span"])
+    assert counts[:3].tolist() == [1, 1, 1]
+
+
+def test_rolling_sum():
+    values = np.array([1, 2, 3, 4, 5])
+    assert stats.rolling_sum(values, 2).tolist() == [1, 3, 5, 7, 9]
+    assert stats.rolling_sum(values, 10).tolist() == [1, 3, 6, 10, 15]
+
+
+def test_stats_command(db, capsys):
+    clok.in_("2021-08-02 08:00-12:00", out=None, m=None)
+    clok.stats("month", 202108, False, 4, 2.0)
+    out = capsys.readouterr().out
+    assert "Records: 1" in out
+    assert "Weeks over 2 hours: 1 of 1, overtime 2H 0M" in out
+    assert "Mon          @@@@" in out
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from .fixtures import db
+import clok
+from core.date_utils import get_week_key
+from core.models import Clok
+
+
+def test_hours_and_summary(db):
+    clok.in_("2018-02-01 08:00-12:00", out=None, m="first")
+    c = Clok.get_most_recent_record()
+    c.add_journal("second")
+    clok.in_("2018-02-01 13:00-14:30", out=None, m=None)
+    clok.in_("2018-03-05 09:00-10:00", out=None, m="third")
+
+    assert Clok.get_day_hours(20180201) == 5.5 * 60 * 60
+    assert Clok.get_seconds("year", 2018) == 6.5 * 60 * 60
+
+    rows = Clok.summary("day", key=20180201)
+    assert rows == [("default", 20180201, 2, 5.5 * 60 * 60, 2)]
+
+    rows = Clok.summary("year", key=2018)
+    assert rows == [("default", 2018, 3, 6.5 * 60 * 60, 3)]
+
+
+def test_period_keys_are_year_qualified(db):
+    clok.in_("2017-10-10 08:00-09:00", out=None, m=None)
+    clok.in_("2016-10-11 08:00-09:00", out=None, m=None)
+    c = Clok.get_most_recent_record()
+    assert (c.week_key, c.month_key) == (201641, 201610)
+
+    assert len(Clok.get_by_week_key(201641)) == 1
+    assert len(Clok.get_by_month_key("201710")) == 1
+    assert Clok.get_month_hours(201610) == 60 * 60
+    assert get_week_key("5") == datetime.now().year * 100 + 5
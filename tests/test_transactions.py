@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.orm.exc import NoResultFound
+
+from .fixtures import commits, db, statements
+from core.defines import DEFAULT_JOB
+from core.models import Clok, Job, State
+
+
+def _punch(statements, commits, func, *args, **kwargs):
+    statements.clear()
+    commits.clear()
+    func(*args, **kwargs)
+    return len(statements), len(commits)
+
+
+def test_punches_write_in_one_transaction(db, statements, commits):
+    Job.create(name="punch-other")
+    State.current()
+    when = datetime(2016, 4, 1, 8)
+    # the record, its journal entry and the state
+    assert _punch(statements, commits, Clok.clock_in_when, when, msg="in") == (3, 1)
+    # read the record, update it and add the entry
+    out = datetime(2016, 4, 1, 9)
+    assert _punch(statements, commits, Clok.clock_out_when, out, msg="out") == (3, 1)
+    # clok journal reads the record to attach the entry to
+    add_journal = lambda: Clok.get_last_record().add_journal("note")
+    assert _punch(statements, commits, add_journal) == (2, 1)
+    open_id = Clok.clock_in_when(datetime(2016, 4, 1, 10)).id
+    # both jobs in one query, then clock out of the open record and update the state
+    assert _punch(statements, commits, Job.switch, "punch-other") == (4, 1)
+    assert Clok.get_by_id(open_id).time_out is not None
+    start, end = datetime(2016, 4, 2, 8), datetime(2016, 4, 2, 9)
+    assert _punch(statements, commits, Clok.add_span, start, end, "span") == (2, 1)
+    assert Clok.get_by_date_key(20160402)[0].get_journals == ["span"]
+    Job.switch(DEFAULT_JOB)
+
+
+def test_failed_switch_writes_nothing(db, statements, commits):
+    job_id = State.get_job_id()
+    statements.clear()
+    with pytest.raises(NoResultFound):
+        Job.switch("no-such-job")
+    assert commits == [] and all(s.startswith("SELECT") for s in statements)
+    assert State.get_job_id() == job_id
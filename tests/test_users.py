@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import pytest
+
+from .fixtures import db
+from core import daemon, fastpath
+from core.database import DB
+from core.models import Clok, Job, State
+from core.users import current_user, reset_user, set_user, split_user_option
+from .test_daemon import _Output
+
+
+@pytest.fixture()
+def as_user():
+    tokens = []
+
+    def switch(name):
+        tokens.append(set_user(name))
+
+    yield switch
+    for token in reversed(tokens):
+        reset_user(token)
+
+
+def test_current_user_resolution(monkeypatch, as_user):
+    monkeypatch.setenv("USER", "Login")
+    monkeypatch.delenv("LOGNAME", raising=False)
+    monkeypatch.delenv("CLOK_USER", raising=False)
+    assert current_user() == "login"
+    monkeypatch.setenv("CLOK_USER", "Env")
+    assert current_user() == "env"
+    as_user("Option")
+    assert current_user() == "option"
+
+    assert split_user_option(["--user", "bob", "in"]) == ("bob", ["in"])
+    assert split_user_option(["--user=bob", "in"]) == ("bob", ["in"])
+    assert split_user_option(["in", "--user", "bob"]) == (None, ["in", "--user", "bob"])
+
+
+def test_records_are_scoped_by_user(db, as_user):
+    when, out = datetime(2020, 10, 10, 8), datetime(2020, 10, 10, 9)
+    as_user("alice")
+    alice = Clok.clok_out_by_id(Clok.clock_in_when(when).id, out)
+    as_user("bob")
+    # the same times are fine for another user
+    bob = Clok.clok_out_by_id(Clok.clock_in_when(when).id, out)
+    assert Job.get_by_id(bob.job_id).name == "default"
+    assert bob.job_id != alice.job_id
+
+    assert Clok.get_by_date_key(20201010) == [bob]
+    assert Clok.get_seconds("day", 20201010, all_jobs=True) == 3600
+    assert Clok.get_by_id(alice.id) is None
+    Clok.delete_by_id(alice.id)
+
+    as_user("alice")
+    assert Clok.get_by_date_key(20201010) == [alice]
+    assert Clok.get_seconds("day", 20201010) == 3600
+    assert [row[2] for row in Clok.summary("day", 20201010, all_jobs=True)] == [1]
+
+
+def test_fast_path_acts_for_the_current_user(db, as_user):
+    connection = DB.session.connection().connection.connection
+    as_user("carol")
+    State.current()
+    carol_id = fastpath.clock_in(connection, datetime(2020, 10, 11, 8))
+    as_user("dave")
+    # dave has no state row yet, the full cli registers him
+    with pytest.raises(fastpath.Fallback):
+        fastpath.clock_in(connection, datetime(2020, 10, 11, 8))
+    State.current()
+    dave_id = fastpath.clock_in(connection, datetime(2020, 10, 11, 8))
+    DB.session.expire_all()
+    assert Clok.get_by_id(dave_id) is not None
+    assert Clok.get_by_id(carol_id) is None
+
+
+def test_daemon_runs_each_command_for_its_user(db):
+    out = _Output()
+    daemon.execute(["--user", "erin", "jobs", "--add", "erins"], out)
+    daemon.execute(["jobs"], out, user="frank")
+    out = _Output()
+    daemon.execute(["jobs"], out)
+    assert "erins" not in out.getvalue()
+    assert current_user() != "erin"
+    out = _Output()
+    daemon.execute(["jobs"], out, user="erin")
+    assert "erins" in out.getvalue()